@@ -14,6 +14,7 @@ from flask_cors import CORS
 from api.v1.helper_functions import generate_tokens_for_user
 from datetime import timedelta
 from flask_swagger_ui import get_swaggerui_blueprint
+from flask_migrate import Migrate
 
 
 app = Flask(__name__)
@@ -60,6 +61,7 @@ Session(app)
 
 cors = CORS(app, origins=["http://localhost:8080"],
             allow_headers=["Content-Type", "Authorization"],
+            expose_headers=["X-Next-Cursor"],
             methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
             supports_credentials=True)
 
@@ -91,6 +93,10 @@ google = oauth.register(
 )
 
 
+# Database migrations (flask db upgrade), DBStorage exposes the engine and metadata
+if models.storage_type == "db":
+    migrate = Migrate(app, models.storage)
+
 # register bluprints
 app.register_blueprint(app_views)
 
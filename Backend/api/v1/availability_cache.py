@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+"""
+Read-through cache of the rarely changing scheduling rows of each doctor:
+the doctor itself, its weekly availability per weekday and the exceptions
+covering each date, kept as plain copies that aren't tied to a database
+session. Entries are dropped by the availability, exception and doctor
+handlers when those rows change.
+"""
+from collections import OrderedDict
+from datetime import date as Date, timedelta
+from os import getenv
+from threading import Lock
+import time
+from api.v1.slot_index import Window, Closure, DoctorRow
+from models import storage
+from models.availability import Availability
+from models.doctor import Doctor
+from models.exception import Exception as DoctorException
+
+
+# Entries kept, least recently used are evicted first
+AVAILABILITY_CACHE_SIZE = int(getenv("HMS_AVAILABILITY_CACHE_SIZE", 10000))
+# Seconds an entry is trusted, bounds staleness when another process
+# changes availability or exceptions
+AVAILABILITY_CACHE_TTL = float(getenv("HMS_AVAILABILITY_CACHE_TTL", 60))
+
+
+def _as_date(value):
+    """Exception dates may still be the ISO string they were created with"""
+    return value if isinstance(value, Date) else Date.fromisoformat(str(value)[:10])
+
+
+class AvailabilityCache:
+    """
+    LRU map of ("doctor", doctor_id), ("availability", doctor_id, weekday)
+    and ("exception", doctor_id, date) to read-only copies of the rows,
+    with hit, miss and eviction counters
+    """
+
+    def __init__(self, size=AVAILABILITY_CACHE_SIZE, ttl=AVAILABILITY_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, key):
+        """Returns (found, value) counting a hit or a miss, call with the lock held"""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() > entry[1]:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[0]
+
+    def _put(self, key, value):
+        """Stores an entry evicting the least recently used, call with the lock held"""
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _load(doctor_id, load_doctor, weekdays, dates):
+        """
+        Reads the doctor when load_doctor is set, its availability on the
+        weekdays and its exceptions overlapping the span of the dates, each
+        with one small query on the doctor_id indexes and only the columns
+        needed. Returns (DoctorRow or None, availability rows, exception rows).
+        """
+        doctor = None
+        if load_doctor:
+            found = storage.get(Doctor, doctor_id)
+            if found is None:
+                return None, [], []
+            doctor = DoctorRow(found.id, found.first_name, found.last_name)
+        availabilities = []
+        if weekdays:
+            availabilities = storage.values(
+                Availability, ('id', 'day_of_week', 'start_time', 'end_time'),
+                doctor_id=doctor_id, day_of_week__in=list(weekdays))
+        exceptions = []
+        if dates:
+            exceptions = storage.values(
+                DoctorException, ('id', 'is_available', 'start_time', 'end_time', 'start_date', 'end_date'),
+                doctor_id=doctor_id, start_date__lte=max(dates), end_date__gte=min(dates))
+        return doctor, availabilities, exceptions
+
+    def schedule(self, doctor_id, weekdays, dates):
+        """
+        Returns (doctor, {weekday: [Window]}, {date: [Closure]}) for the
+        given weekdays and dates of a doctor, reading only what is not
+        cached. The doctor is a DoctorRow, None when it doesn't exist.
+        """
+        with self._lock:
+            found, doctor = self._get(("doctor", doctor_id))
+            availabilities = {}
+            exceptions = {}
+            missing_days = set()
+            missing_dates = set()
+            for day in weekdays:
+                hit, windows = self._get(("availability", doctor_id, day))
+                if hit:
+                    availabilities[day] = windows
+                else:
+                    missing_days.add(day)
+            for day in dates:
+                hit, closures = self._get(("exception", doctor_id, day))
+                if hit:
+                    exceptions[day] = closures
+                else:
+                    missing_dates.add(day)
+
+        if found and not missing_days and not missing_dates:
+            return doctor, availabilities, exceptions
+
+        loaded, availability_rows, exception_rows = self._load(
+            doctor_id, not found, missing_days, missing_dates)
+        if not found:
+            if loaded is None:
+                return None, {}, {}
+            doctor = loaded
+
+        loaded_days = {day: [] for day in missing_days}
+        loaded_dates = {day: [] for day in missing_dates}
+        for id, day_of_week, start_time, end_time in availability_rows:
+            if day_of_week in loaded_days:
+                loaded_days[day_of_week].append(Window(id, start_time, end_time))
+        for id, is_available, start_time, end_time, start_date, end_date in exception_rows:
+            closure = Closure(id, is_available, start_time, end_time)
+            for day, closures in loaded_dates.items():
+                if _as_date(start_date) <= day <= _as_date(end_date):
+                    closures.append(closure)
+
+        with self._lock:
+            if not found:
+                self._put(("doctor", doctor_id), doctor)
+            for day, windows in loaded_days.items():
+                availabilities[day] = windows
+                self._put(("availability", doctor_id, day), windows)
+            for day, closures in loaded_dates.items():
+                exceptions[day] = closures
+                self._put(("exception", doctor_id, day), closures)
+        return doctor, availabilities, exceptions
+
+    def invalidate_doctor(self, doctor_id):
+        """Drops the cached doctor, after it was updated or deleted"""
+        with self._lock:
+            self._entries.pop(("doctor", doctor_id), None)
+
+    def invalidate_availability(self, doctor_id, weekday):
+        """Drops the cached availability of a doctor on a weekday"""
+        with self._lock:
+            self._entries.pop(("availability", doctor_id, weekday), None)
+
+    def invalidate_exception(self, doctor_id, first_day, last_day=None):
+        """Drops the cached exceptions of a doctor on a date, or from first_day to last_day"""
+        day = _as_date(first_day)
+        last_day = day if last_day is None else _as_date(last_day)
+        with self._lock:
+            while day <= last_day:
+                self._entries.pop(("exception", doctor_id, day), None)
+                day += timedelta(days=1)
+
+    def clear(self):
+        """Drops every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters and size, for the /stats/cache endpoint"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self._entries), "max_size": self.size}
+
+
+availability_cache = AvailabilityCache()
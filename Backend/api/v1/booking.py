@@ -0,0 +1,500 @@
+#!/usr/bin/python3
+"""
+Booking checks: loads everything needed to decide whether a doctor can take
+one or more appointments in a few small queries and returns structured results.
+Loaded days are kept in the free-slot index so later checks skip the queries
+"""
+from datetime import datetime, timedelta, time as dtime
+from os import getenv
+from contextlib import ExitStack
+from threading import Lock
+import random
+import time
+import uuid
+from sqlalchemy.exc import IntegrityError, OperationalError
+from api.v1.availability_cache import availability_cache
+from api.v1.holds import slot_holds
+from api.v1.slot_index import slot_index, merge_windows, Window, Closure, Booked
+from models import storage
+from models.appointment import Appointment
+
+
+# HTTP status returned by the endpoints for each reason a booking is refused
+STATUS_CODES = {
+    "available": 200,
+    "doctor_not_found": 404,
+    "no_availability": 400,
+    "outside_availability": 409,
+    "doctor_unavailable": 409,
+    "conflict": 409,
+    "held": 409,
+    "hold_expired": 410,
+    "not_scheduled": 409,
+    "busy": 503,
+}
+
+# Attempts made when the booking lock can't be taken (deadlock, lock wait timeout)
+BOOKING_RETRIES = int(getenv("HMS_BOOKING_RETRIES", 3))
+BOOKING_RETRY_DELAY = 0.05
+
+# Bookings of one doctor and day are serialized in process by one of these
+# locks before waiting on the database row lock, so threads queue here
+# instead of holding pooled connections
+_booking_locks = [Lock() for _ in range(256)]
+
+
+def _booking_lock(doctor_id, day):
+    """Returns the index of the in-process lock guarding bookings of a doctor on a day"""
+    return hash((doctor_id, day)) % len(_booking_locks)
+
+
+class BookingCheck:
+    """Result of checking one candidate appointment for a doctor"""
+
+    def __init__(self, doctor_id, start_time, duration, code, reason,
+                 doctor=None, conflicts=()):
+        self.doctor_id = doctor_id
+        self.start_time = start_time
+        self.duration = duration
+        self.end_time = start_time + timedelta(minutes=duration)
+        self.code = code
+        self.reason = reason
+        self.doctor = doctor
+        self.conflicts = list(conflicts)
+
+    @property
+    def available(self):
+        """True when the appointment can be booked"""
+        return self.code == "available"
+
+    @property
+    def status_code(self):
+        """HTTP status matching the result"""
+        return STATUS_CODES[self.code]
+
+    def to_dict(self):
+        """Returns the result as a JSON serializable dictionary"""
+        return {
+            "doctor_id": self.doctor_id,
+            "scheduled_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat(),
+            "duration": self.duration,
+            "available": self.available,
+            "code": self.code,
+            "reason": self.reason,
+            "conflicts": [appointment.id for appointment in self.conflicts],
+        }
+
+
+class BookingContext:
+    """
+    The doctor, weekly availability, exceptions per date and scheduled
+    appointments of one doctor covering a set of candidate times
+    """
+
+    def __init__(self, doctor, availabilities, exceptions, appointments):
+        self.doctor = doctor
+        self.availabilities = availabilities
+        self.exceptions = exceptions
+        self.appointments = appointments
+
+    @classmethod
+    def load(cls, doctor_id, candidates, appointment_id_to_ignore=None):
+        """
+        Loads the context needed to check candidates, a list of
+        (start_time, duration) tuples: the doctor, its availability for the
+        weekdays and its exceptions for the dates involved come from the
+        availability cache (a small query per kind of row not cached), then one
+        query reads the id and times of the scheduled appointments overlapping
+        the candidates time span, through storage.values so it runs on both
+        storage engines
+        """
+        days = {start.strftime('%A') for start, _ in candidates}
+        dates = {start.date() for start, _ in candidates}
+
+        doctor, availabilities, exceptions = availability_cache.schedule(doctor_id, days, dates)
+        if doctor is None:
+            return cls(None, {}, {}, [])
+
+        span_start = min(start for start, _ in candidates)
+        span_end = max(start + timedelta(minutes=duration) for start, duration in candidates)
+        appointments = [Booked(*row) for row in storage.values(
+            Appointment, ('id', 'scheduled_time', 'end_time'),
+            doctor_id=doctor_id, status='scheduled',
+            end_time__gt=span_start, scheduled_time__lt=span_end)
+            if row[0] != appointment_id_to_ignore]
+
+        return cls(doctor, availabilities, exceptions, appointments)
+
+    def for_day(self, day):
+        """
+        Returns the context restricted to one day, with every row copied to
+        a namedtuple (the doctor is already a DoctorRow from the availability
+        cache and the appointments Booked rows) so it can be shared with
+        other threads in the free-slot index without holding ORM objects
+        """
+        day_start = datetime.combine(day, dtime.min)
+        day_end = day_start + timedelta(days=1)
+        weekday = day.strftime('%A')
+        return BookingContext(
+            self.doctor,
+            {weekday: [Window(slot.id, slot.start_time, slot.end_time)
+                       for slot in self.availabilities.get(weekday, [])]},
+            {day: [Closure(exception.id, exception.is_available,
+                           exception.start_time, exception.end_time)
+                   for exception in self.exceptions.get(day, [])]},
+            [appointment for appointment in self.appointments
+             if appointment.end_time > day_start and appointment.scheduled_time < day_end]
+        )
+
+    def available(self, doctor_id, start_time, duration):
+        """Result for a candidate already known to be free"""
+        return BookingCheck(doctor_id, start_time, duration, "available", "Available",
+                            doctor=self.doctor)
+
+    def check(self, doctor_id, start_time, duration):
+        """Checks one candidate appointment against the loaded context"""
+        def result(code, reason, conflicts=()):
+            return BookingCheck(doctor_id, start_time, duration, code, reason,
+                                doctor=self.doctor, conflicts=conflicts)
+
+        if self.doctor is None:
+            return result("doctor_not_found", "Doctor not found")
+
+        end_time = start_time + timedelta(minutes=duration)
+        slots = self.availabilities.get(start_time.strftime('%A'), [])
+        if not slots:
+            return result("no_availability", "Availability and day not found")
+
+        slot_available = end_time.date() == start_time.date() and any(
+            slot.start_time <= start_time.time() and slot.end_time >= end_time.time()
+            for slot in merge_windows(slots)
+        )
+        if not slot_available:
+            return result("outside_availability", "Doctor not available on this day/time")
+
+        blocking = [exception for exception in self.exceptions.get(start_time.date(), [])
+                    if exception.blocks(start_time.time(), end_time.time())]
+        if any(exception.whole_day for exception in blocking):
+            return result("doctor_unavailable", "Doctor has marked this date as unavailable")
+        if blocking:
+            return result("doctor_unavailable", "Doctor has marked this time as unavailable")
+
+        conflicts = [appointment for appointment in self.appointments
+                     if appointment.end_time > start_time and appointment.scheduled_time < end_time]
+        if conflicts:
+            return result("conflict", "Time slot already booked", conflicts)
+
+        return result("available", "Available")
+
+
+def check_holds(result, ignore_hold_id=None):
+    """
+    Turns an available result into a "held" one when a live hold, other
+    than ignore_hold_id, overlaps it
+    """
+    if not result.available:
+        return result
+    holds = [hold for hold in slot_holds.overlapping(result.doctor_id, result.start_time, result.end_time)
+             if hold.id != ignore_hold_id]
+    if not holds:
+        return result
+    return BookingCheck(result.doctor_id, result.start_time, result.duration, "held",
+                        "Time slot is on hold", doctor=result.doctor, conflicts=holds)
+
+
+def index_days(doctor_id, days, refresh=False):
+    """
+    Returns {date: DaySlots} for the given dates of a doctor, loading the
+    days missing from the free-slot index (or all of them when refresh is
+    True) with two queries. Returns None when the doctor doesn't exist.
+    """
+    indexed = {} if refresh else {day: slot_index.get(doctor_id, day) for day in days}
+    missing = sorted(day for day in days if indexed.get(day) is None)
+    if missing:
+        context = BookingContext.load(doctor_id, [(datetime.combine(day, dtime.min), 24 * 60)
+                                                  for day in missing])
+        if context.doctor is None:
+            return None
+        for day in missing:
+            indexed[day] = slot_index.put(doctor_id, day, context.for_day(day))
+    return indexed
+
+
+def check_bookings(doctor_id, candidates, appointment_id_to_ignore=None):
+    """
+    Checks many candidate appointments for one doctor, reading the days
+    involved from the free-slot index.
+
+    Parameters:
+        doctor_id (str): ID of the doctor
+        candidates (list): (start_time, duration) tuples, duration in minutes
+        appointment_id_to_ignore (str): Optional. Appointment ID to exclude from conflict check
+
+    Returns:
+        list: a BookingCheck per candidate, in the same order
+    """
+    if not candidates:
+        return []
+    if appointment_id_to_ignore:
+        context = BookingContext.load(doctor_id, candidates, appointment_id_to_ignore)
+        results = [context.check(doctor_id, start, duration) for start, duration in candidates]
+    else:
+        days = index_days(doctor_id, {start.date() for start, _ in candidates})
+        if days is None:
+            context = BookingContext(None, {}, {}, [])
+            results = [context.check(doctor_id, start, duration) for start, duration in candidates]
+        else:
+            results = [days[start.date()].check(doctor_id, start, duration)
+                       for start, duration in candidates]
+    return [check_holds(result) for result in results]
+
+
+def check_many(candidates):
+    """
+    Checks candidate appointments of many doctors.
+
+    Parameters:
+        candidates (list): (doctor_id, start_time, duration) tuples, duration in minutes
+
+    Returns:
+        list: a BookingCheck per candidate, in the same order. Candidates
+        are grouped per doctor so each doctor's days are loaded once
+    """
+    by_doctor = {}
+    for i, (doctor_id, _, _) in enumerate(candidates):
+        by_doctor.setdefault(doctor_id, []).append(i)
+
+    results = [None] * len(candidates)
+    for doctor_id, indexes in by_doctor.items():
+        checks = check_bookings(doctor_id, [candidates[i][1:] for i in indexes])
+        for i, result in zip(indexes, checks):
+            results[i] = result
+    return results
+
+
+def check_booking(doctor_id, start_time, duration, appointment_id_to_ignore=None):
+    """Checks a single candidate appointment, returns a BookingCheck"""
+    return check_bookings(doctor_id, [(start_time, duration)], appointment_id_to_ignore)[0]
+
+
+def _locked(doctor_id, days, action):
+    """
+    Runs action() holding the booking locks of a doctor on the given days,
+    in process and in the database, retrying up to BOOKING_RETRIES times
+    when a database lock can't be taken. Locks are always taken in the same
+    order so bookings spanning many days can't deadlock each other.
+    Returns what action returned, None when busy.
+    """
+    days = sorted(set(days))
+    stripes = sorted({_booking_lock(doctor_id, day) for day in days})
+    for attempt in range(BOOKING_RETRIES):
+        with ExitStack() as held:
+            for stripe in stripes:
+                held.enter_context(_booking_locks[stripe])
+            try:
+                # Start a new transaction so reads made after the lock
+                # see every booking committed before it was granted
+                storage.rollback()
+                for day in days:
+                    storage.lock(doctor_id, day)
+                return action()
+            except (IntegrityError, OperationalError):
+                storage.rollback()
+        time.sleep(BOOKING_RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return None
+
+
+def run_locked(doctor_id, days, action):
+    """
+    Runs action() holding the booking locks of a doctor on the given days,
+    for changes that must not interleave with bookings of those days.
+    Returns what action returned, None when busy.
+    """
+    return _locked(doctor_id, days, action)
+
+
+def _check_locked(doctor_id, candidates, ignore_hold_id=None):
+    """
+    Checks (start_time, duration) candidates under the booking lock,
+    reloading their days in one pass since the index may miss bookings made
+    by other processes
+    """
+    days = index_days(doctor_id, {start.date() for start, _ in candidates}, refresh=True)
+    if days is None:
+        context = BookingContext(None, {}, {}, [])
+        return [context.check(doctor_id, start, duration) for start, duration in candidates]
+    return [check_holds(days[start.date()].check(doctor_id, start, duration), ignore_hold_id)
+            for start, duration in candidates]
+
+
+def _busy(doctor_id, start_time, duration):
+    return BookingCheck(doctor_id, start_time, duration, "busy",
+                        "Too many concurrent bookings, try again")
+
+
+def _insert_appointments(patient_id, doctor_id, start_times, duration, series_id=None):
+    """
+    Commits new scheduled appointments in one transaction and records them
+    in the free-slot index
+    """
+    appointments = [Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        scheduled_time=start_time,
+        duration=duration,
+        status='scheduled',
+        series_id=series_id
+    ) for start_time in start_times]
+    for appointment in appointments:
+        storage.new(appointment)
+    storage.save()
+    for appointment in appointments:
+        slot_index.book(appointment)
+    return appointments
+
+
+def book_appointment(patient_id, doctor_id, start_time, duration):
+    """
+    Checks and books an appointment atomically: the (doctor, day) lock is
+    held from the availability check until the new appointment is
+    committed, so concurrent requests can't double book a time range.
+
+    Returns:
+        Tuple (BookingCheck, Appointment): the appointment is None when the
+        booking was refused or the lock couldn't be taken after
+        BOOKING_RETRIES attempts (result code "busy")
+    """
+    def book():
+        result, = _check_locked(doctor_id, [(start_time, duration)])
+        if not result.available:
+            storage.rollback()
+            return result, None
+        return result, _insert_appointments(patient_id, doctor_id, [start_time], duration)[0]
+
+    return _locked(doctor_id, {start_time.date()}, book) or \
+        (_busy(doctor_id, start_time, duration), None)
+
+
+def reschedule_appointment(appointment, start_time, duration):
+    """
+    Moves a scheduled appointment to a new time atomically: the booking
+    locks of the old and new days are held while the new time is checked,
+    ignoring the appointment itself, and the appointment is updated in one
+    transaction, so its current time is kept until the move is committed.
+
+    Returns:
+        Tuple (BookingCheck, Appointment): the appointment is None when the
+        new time was refused, the appointment is no longer scheduled (result
+        code "not_scheduled") or the locks couldn't be taken
+    """
+    doctor_id = appointment.doctor_id
+    previous_day = appointment.scheduled_time.date()
+
+    def move():
+        # The lock started a new transaction, so this sees concurrent cancellations
+        if appointment.status != 'scheduled':
+            storage.rollback()
+            return BookingCheck(doctor_id, start_time, duration, "not_scheduled",
+                                f"Cannot reschedule {appointment.status} appointment"), None
+        context = BookingContext.load(doctor_id, [(start_time, duration)],
+                                      appointment_id_to_ignore=appointment.id)
+        result = check_holds(context.check(doctor_id, start_time, duration))
+        if not result.available:
+            storage.rollback()
+            return result, None
+        appointment.scheduled_time = start_time
+        appointment.duration = duration
+        # Set explicitly for file storage, which has no end_time validator
+        appointment.end_time = start_time + timedelta(minutes=duration)
+        appointment.save()
+        slot_index.invalidate(doctor_id, previous_day)
+        slot_index.book(appointment)
+        return result, appointment
+
+    return _locked(doctor_id, {previous_day, start_time.date()}, move) or \
+        (_busy(doctor_id, start_time, duration), None)
+
+
+def place_hold(patient_id, doctor_id, start_time, duration, ttl):
+    """
+    Checks a time range like a booking and holds it for ttl seconds, during
+    which it is reported as a conflict to everyone.
+
+    Returns:
+        Tuple (BookingCheck, Hold): the hold is None when the range isn't free
+    Raises:
+        ValueError: if the patient already has too many live holds
+    """
+    def hold():
+        result, = _check_locked(doctor_id, [(start_time, duration)])
+        storage.rollback()
+        if not result.available:
+            return result, None
+        return result, slot_holds.place(doctor_id, patient_id, start_time, duration, ttl)
+
+    return _locked(doctor_id, {start_time.date()}, hold) or \
+        (_busy(doctor_id, start_time, duration), None)
+
+
+def confirm_hold(hold):
+    """
+    Books the held range once the hold is checked to still be live. Holds
+    only live in this process, so the range is checked again under the
+    booking lock: another process may have booked it since.
+
+    Returns:
+        Tuple (BookingCheck, Appointment): the appointment is None when the
+        hold expired (result code "hold_expired"), the range was taken (the
+        hold is released) or the lock couldn't be taken
+    """
+    def confirm():
+        if slot_holds.get(hold.id) is None:
+            storage.rollback()
+            return BookingCheck(hold.doctor_id, hold.scheduled_time, hold.duration,
+                                "hold_expired", "Hold expired"), None
+        result, = _check_locked(hold.doctor_id, [(hold.scheduled_time, hold.duration)],
+                                ignore_hold_id=hold.id)
+        if not result.available:
+            storage.rollback()
+            slot_holds.release(hold.id)
+            return result, None
+        appointment, = _insert_appointments(hold.patient_id, hold.doctor_id,
+                                            [hold.scheduled_time], hold.duration)
+        slot_holds.release(hold.id)
+        return result, appointment
+
+    return _locked(hold.doctor_id, {hold.scheduled_time.date()}, confirm) or \
+        (_busy(hold.doctor_id, hold.scheduled_time, hold.duration), None)
+
+
+def book_series(patient_id, doctor_id, start_times, duration, skip_conflicts=False):
+    """
+    Books a recurring series: every occurrence is checked in one pass over
+    its days, loaded with two queries, and the bookable ones are inserted in
+    a single transaction sharing a series_id, all under the booking locks
+    of every day involved.
+
+    Parameters:
+        start_times (list): start datetime of each occurrence
+        skip_conflicts (bool): book the free occurrences and skip the
+            others, instead of booking nothing when any of them is refused
+
+    Returns:
+        Tuple (results, appointments): a BookingCheck per occurrence and the
+        appointments inserted, none when the series was refused or the
+        locks couldn't be taken (result codes "busy")
+    """
+    candidates = [(start_time, duration) for start_time in start_times]
+
+    def book():
+        results = _check_locked(doctor_id, candidates)
+        bookable = [result.start_time for result in results if result.available]
+        if not bookable or (len(bookable) < len(results) and not skip_conflicts):
+            storage.rollback()
+            return results, []
+        return results, _insert_appointments(patient_id, doctor_id, bookable, duration,
+                                             series_id=str(uuid.uuid4()))
+
+    return _locked(doctor_id, {start_time.date() for start_time in start_times}, book) or \
+        ([_busy(doctor_id, start_time, duration) for start_time in start_times], [])
@@ -1,21 +1,49 @@
 #!/usr/bin/python3
 from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
-from flask import jsonify
+from flask import jsonify, request, Response, stream_with_context
 from functools import wraps
 from flask_jwt_extended import create_access_token, create_refresh_token
+from models import codec
 from models.appointment import Appointment
 from models.availability import Availability
 from models.doctor import Doctor
 from models import storage
-from datetime import datetime, time, timedelta
+from datetime import datetime, date, time, timedelta
 import re
+import base64
 from sqlalchemy import func, String, and_, text
 from models.exception import Exception as DoctorException
+from api.v1.booking import check_booking
+from api.v1.slot_index import SLOT_GRANULARITY
 
 
 # Constants
 MIN_APPOINTMENT_DURATION = 15
 MAX_APPOINTMENT_DURATION = 120
+# Minutes ahead of now an appointment must start
+MIN_BOOKING_NOTICE = 30
+MAX_BATCH_CHECKS = 100
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+APPOINTMENT_STATUSES = ('scheduled', 'cancelled', 'completed')
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+STREAM_CHUNK_SIZE = 500
+DEFAULT_SEARCH_DAYS = 14
+MAX_SEARCH_DAYS = 62
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+DEFAULT_SEARCH_STEP = 15
+DEFAULT_HEATMAP_DAYS = 28
+DEFAULT_HEATMAP_BUCKET = 60
+MAX_HEATMAP_BUCKET = 240
+HEATMAP_ENCODINGS = ('json', 'base64')
+RECURRENCE_FREQUENCIES = {'daily': 1, 'weekly': 7}
+MAX_SERIES_OCCURRENCES = 52
+SERIES_MODES = ('all_or_nothing', 'skip_conflicts')
+MAX_EXCEPTION_DAYS = 366
+MAX_BULK_EXCEPTIONS = 100
+MAX_WAITLIST_DAYS = 62
+MAX_WAITLIST_WAIT = 30
 
 
 def is_admin():
@@ -64,16 +92,10 @@ def is_doctor_available(doctor_id, start_time, duration, working_hours_start, wo
     
     Returns:
         Tuple (bool, str): (Is available, message)
-    """
-    sess = storage.get_session()
-
-    # Check if doctor exists
-    doctor = sess.get(Doctor, doctor_id)
-    if not doctor:
-        return False, "Doctor not found"
-    
 
-    # Calculate end_time
+    The doctor, availability, exception and conflict lookups are done by
+    api.v1.booking.check_booking, use it directly for the detailed result.
+    """
     end_time = start_time + timedelta(minutes=duration)
 
     # Validate working hours
@@ -82,58 +104,8 @@ def is_doctor_available(doctor_id, start_time, duration, working_hours_start, wo
     if end_time.time() > working_hours_end:
         return False, "End time outside working hours"
 
-    # Get weekday
-    day_of_week = start_time.strftime('%A')
-
-    # Fetch availability slots for this weekday
-    available_slots = sess.query(Availability).filter_by(
-        doctor_id=doctor_id,
-        day_of_week=day_of_week
-    ).all()
-
-    slot_available = any(
-        slot.start_time <= start_time.time() and
-        slot.end_time >= end_time.time()
-        for slot in available_slots
-    )
-
-    if not slot_available:
-        return False, "Doctor not available on this day/time"
-
-    # Check exceptions
-    exception = sess.query(DoctorException).filter_by(
-        doctor_id=doctor_id,
-        date=start_time.date()
-    ).first()
-
-    if exception and not exception.is_available:
-        return False, "Doctor has marked this date as unavailable"
-
-    # Compute new appointment end time
-    new_appointment_end = end_time
-
-    # Query for conflicting appointments
-    # Use MySQL TIMESTAMPADD(MINUTE, ...) to calculate end time of existing appointments
-    existing_appointment_end = func.TIMESTAMPADD(text('MINUTE'), Appointment.duration, Appointment.scheduled_time)
-
-    conflict_query = sess.query(Appointment).filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.status == 'scheduled',
-        # Overlap condition:
-        existing_appointment_end > start_time,         # existing ends after new starts
-        Appointment.scheduled_time < new_appointment_end  # existing starts before new ends
-    )
-
-    # Exclude current appointment if provided (used when editing)
-    if appointment_id_to_ignore:
-        conflict_query = conflict_query.filter(Appointment.id != appointment_id_to_ignore)
-
-    conflicting_appointments_count = conflict_query.count()
-
-    if conflicting_appointments_count > 0:
-        return False, "Time slot already booked"
-
-    return True, "Available"
+    result = check_booking(doctor_id, start_time, duration, appointment_id_to_ignore)
+    return result.available, result.reason
 
 
 def validate_appointment_data(data):
@@ -157,13 +129,163 @@ def validate_appointment_data(data):
     if 'scheduled_time' in data:
         try:
             scheduled_time = datetime.fromisoformat(data['scheduled_time'])
-            if scheduled_time < datetime.now() + timedelta(minutes=30):
-                errors['time'] = "Appointment must be scheduled at least 30 minutes in advance"
+            if scheduled_time < datetime.now() + timedelta(minutes=MIN_BOOKING_NOTICE):
+                errors['time'] = f"Appointment must be scheduled at least {MIN_BOOKING_NOTICE} minutes in advance"
         except ValueError:
             errors['time'] = "Invalid time format (use ISO 8601)"
 
     return errors
 
+def expand_recurrence(first_time, recurrence):
+    """
+    Expands a recurrence rule {"frequency": "daily"|"weekly", "interval": int,
+    "count": int} or with "until": YYYY-MM-DD (inclusive) instead of count,
+    into the start datetimes of the occurrences, first_time included.
+
+    Raises:
+        ValueError: if the rule is malformed or has more than MAX_SERIES_OCCURRENCES occurrences
+    """
+    if not isinstance(recurrence, dict):
+        raise ValueError("recurrence must be an object")
+    frequency = recurrence.get('frequency')
+    if frequency not in RECURRENCE_FREQUENCIES:
+        raise ValueError(f"frequency must be one of: {', '.join(RECURRENCE_FREQUENCIES)}")
+    try:
+        interval = int(recurrence.get('interval', 1))
+    except (TypeError, ValueError):
+        raise ValueError("interval must be an integer")
+    if interval < 1:
+        raise ValueError("interval must be at least 1")
+    if ('count' in recurrence) == ('until' in recurrence):
+        raise ValueError("either count or until required")
+
+    step = timedelta(days=RECURRENCE_FREQUENCIES[frequency] * interval)
+    if 'count' in recurrence:
+        try:
+            count = int(recurrence['count'])
+        except (TypeError, ValueError):
+            raise ValueError("count must be an integer")
+        if count < 1:
+            raise ValueError("count must be at least 1")
+    else:
+        try:
+            until = datetime.strptime(str(recurrence['until']), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Invalid until date format (use YYYY-MM-DD)")
+        if until < first_time.date():
+            raise ValueError("until must not be before the first occurrence")
+        count = (until - first_time.date()).days // step.days + 1
+    if count > MAX_SERIES_OCCURRENCES:
+        raise ValueError(f"At most {MAX_SERIES_OCCURRENCES} occurrences per series")
+
+    return [first_time + step * i for i in range(count)]
+
+
+def get_exception_fields(data, exception=None):
+    """
+    Reads the period of an exception: 'start_date' and 'end_date'
+    (YYYY-MM-DD, inclusive, 'date' is accepted for a single day) and the
+    optional 'start_time' and 'end_time' (HH:MM[:SS]) limiting it to part
+    of each day. When updating an exception, missing fields keep its
+    values and a new start alone moves the whole period.
+
+    Returns:
+        dict: the date, start_date, end_date, start_time and end_time to set
+    Raises:
+        ValueError: if a field is missing or malformed or the period invalid
+    """
+    def field(key):
+        value = data.get(key, getattr(exception, key, None))
+        return None if value == "" else value
+
+    def parse_date(value):
+        if isinstance(value, date):
+            return value
+        try:
+            return datetime.strptime(str(value), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Invalid date format (use YYYY-MM-DD)")
+
+    start_date = data.get('start_date', data.get('date'))
+    if start_date is None and exception is None:
+        raise ValueError("missing field 'start_date'")
+    if start_date is None:
+        start_date = exception.start_date
+    start_date = parse_date(start_date)
+    if data.get('end_date') is not None:
+        end_date = parse_date(data['end_date'])
+    elif exception is not None:
+        end_date = start_date + (exception.end_date - exception.start_date)
+    else:
+        end_date = start_date
+    if end_date < start_date:
+        raise ValueError("end_date must not be before start_date")
+    if (end_date - start_date).days >= MAX_EXCEPTION_DAYS:
+        raise ValueError(f"At most {MAX_EXCEPTION_DAYS} days per exception")
+
+    start_time, end_time = field('start_time'), field('end_time')
+    if (start_time is None) != (end_time is None):
+        raise ValueError("start_time and end_time go together")
+    if start_time is not None:
+        try:
+            start_time = start_time if isinstance(start_time, time) else time.fromisoformat(str(start_time))
+            end_time = end_time if isinstance(end_time, time) else time.fromisoformat(str(end_time))
+        except ValueError:
+            raise ValueError("Invalid time format (use HH:MM)")
+        if end_time <= start_time:
+            raise ValueError("end_time must be after start_time")
+
+    return {"date": start_date, "start_date": start_date, "end_date": end_date,
+            "start_time": start_time, "end_time": end_time}
+
+
+def get_waitlist_fields(data):
+    """
+    Reads a waitlist registration: 'doctor_id', 'duration' in minutes, the
+    'start_date' and optional 'end_date' (YYYY-MM-DD, inclusive, at most
+    MAX_WAITLIST_DAYS days), the optional 'earliest_time' and 'latest_time'
+    of the day (HH:MM) and 'auto_book'.
+
+    Returns:
+        dict: the fields of the new WaitlistEntry
+    Raises:
+        ValueError: if a field is missing or malformed
+    """
+    for field in ('doctor_id', 'duration', 'start_date'):
+        if field not in data:
+            raise ValueError(f"missing field '{field}'")
+    try:
+        duration = int(data['duration'])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid duration format")
+    if not MIN_APPOINTMENT_DURATION <= duration <= MAX_APPOINTMENT_DURATION:
+        raise ValueError(f"Duration must be between {MIN_APPOINTMENT_DURATION} - {MAX_APPOINTMENT_DURATION} minutes")
+    try:
+        start_date = datetime.strptime(str(data['start_date']), '%Y-%m-%d').date()
+        end_date = datetime.strptime(str(data['end_date']), '%Y-%m-%d').date() \
+            if data.get('end_date') else start_date
+    except ValueError:
+        raise ValueError("Invalid date format (use YYYY-MM-DD)")
+    if end_date < start_date:
+        raise ValueError("end_date must not be before start_date")
+    if end_date < datetime.now().date():
+        raise ValueError("end_date must not be in the past")
+    if (end_date - start_date).days >= MAX_WAITLIST_DAYS:
+        raise ValueError(f"At most {MAX_WAITLIST_DAYS} days per waitlist entry")
+    try:
+        earliest_time = time.fromisoformat(data['earliest_time']) if data.get('earliest_time') else None
+        latest_time = time.fromisoformat(data['latest_time']) if data.get('latest_time') else None
+    except (TypeError, ValueError):
+        raise ValueError("Invalid time format (use HH:MM)")
+    if earliest_time and latest_time and latest_time <= earliest_time:
+        raise ValueError("latest_time must be after earliest_time")
+
+    return {"doctor_id": data['doctor_id'], "duration": duration,
+            "start_date": start_date, "end_date": end_date,
+            "earliest_time": earliest_time, "latest_time": latest_time,
+            "auto_book": bool(data.get('auto_book', False))}
+
+
 def validate_medical_record(data):
     errors = {}
 
@@ -176,4 +298,218 @@ def validate_medical_record(data):
         if not re.match(r'^[a-zA-Z0-9\s\.,;:-]+$', data['prescriptions']):
             errors['prescriptions'] = "Invalid characters in prescriptions"
 
-    return errors
\ No newline at end of file
+    return errors
+
+
+def encode_cursor(key):
+    """Encodes a (created_at, id) key into an opaque pagination cursor"""
+    created_at, id = key
+    raw = f"{created_at.isoformat()}|{id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decodes a pagination cursor back into its (created_at, id) key"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), id
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def get_page_args():
+    """
+    Reads the 'limit' and 'cursor' query parameters of the current request.
+
+    Returns:
+        Tuple (int, tuple): (limit, (created_at, id) key to start after or None)
+    Raises:
+        ValueError: if either parameter is malformed
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise ValueError(f"limit must be between 1 - {MAX_PAGE_LIMIT}")
+
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    return limit, after
+
+
+def paginated_response(objs, next_key):
+    """
+    Returns the objects as a JSON array, the cursor of the next page is sent
+    in the X-Next-Cursor header when there are more objects
+    """
+    response = Response(codec.encode_list(objs), mimetype='application/json')
+    if next_key is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor(next_key)
+    return response
+
+
+def get_appointment_filters():
+    """
+    Builds storage filters from the 'doctor_id', 'patient_id', 'status',
+    'from' and 'to' query parameters of the current request.
+    'from' is inclusive and 'to' exclusive, a 'to' date without a time
+    includes that whole day.
+
+    Raises:
+        ValueError: if a parameter is malformed
+    """
+    filters = {}
+    for field in ('doctor_id', 'patient_id'):
+        if request.args.get(field):
+            filters[field] = request.args[field]
+
+    status = request.args.get('status')
+    if status:
+        if status not in APPOINTMENT_STATUSES:
+            raise ValueError(f"status must be one of: {', '.join(APPOINTMENT_STATUSES)}")
+        filters['status'] = status
+
+    for param, key in (('from', 'scheduled_time__gte'), ('to', 'scheduled_time__lt')):
+        value = request.args.get(param)
+        if not value:
+            continue
+        try:
+            filters[key] = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid '{param}' format (use ISO 8601)")
+        if param == 'to' and len(value) == 10:
+            filters[key] += timedelta(days=1)
+    return filters
+
+
+def get_date_range_args(default_days):
+    """
+    Reads the 'from' and 'to' dates (YYYY-MM-DD, both inclusive) of the
+    current request, defaulting to today and the following default_days - 1
+    days, at most MAX_SEARCH_DAYS days.
+
+    Raises:
+        ValueError: if a date is malformed or the range invalid
+    """
+    try:
+        first_day = datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+            if request.args.get('from') else datetime.now().date()
+        last_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+            if request.args.get('to') else first_day + timedelta(days=default_days - 1)
+    except ValueError:
+        raise ValueError("Invalid date format (use YYYY-MM-DD)")
+    if last_day < first_day:
+        raise ValueError("'to' must not be before 'from'")
+    if (last_day - first_day).days >= MAX_SEARCH_DAYS:
+        raise ValueError(f"At most {MAX_SEARCH_DAYS} days per search")
+    return first_day, last_day
+
+
+def get_heatmap_args():
+    """
+    Reads the heatmap parameters of the current request: optional
+    'doctor_ids' (comma separated) and 'specialization', the 'from' and
+    'to' dates (default the next 4 weeks), the 'bucket' size in minutes and
+    the 'encoding' of the matrices ('json' or 'base64').
+
+    Raises:
+        ValueError: if a parameter is malformed
+    """
+    first_day, last_day = get_date_range_args(DEFAULT_HEATMAP_DAYS)
+    try:
+        bucket = int(request.args.get('bucket', DEFAULT_HEATMAP_BUCKET))
+    except ValueError:
+        raise ValueError("bucket must be an integer")
+    if bucket <= 0 or bucket % SLOT_GRANULARITY or (24 * 60) % bucket or bucket > MAX_HEATMAP_BUCKET:
+        raise ValueError(f"bucket must be a multiple of {SLOT_GRANULARITY} minutes dividing a day, "
+                         f"at most {MAX_HEATMAP_BUCKET}")
+    encoding = request.args.get('encoding', 'json')
+    if encoding not in HEATMAP_ENCODINGS:
+        raise ValueError(f"encoding must be one of: {', '.join(HEATMAP_ENCODINGS)}")
+
+    return {"doctor_ids": [id.strip() for id in request.args.get('doctor_ids', '').split(',') if id.strip()],
+            "specialization": request.args.get('specialization', '').strip(),
+            "from": first_day, "to": last_day, "bucket": bucket, "encoding": encoding}
+
+
+def get_slot_search_args():
+    """
+    Reads the free slot search parameters of the current request:
+    'doctor_ids' (comma separated) or 'specialization', the 'from' and 'to'
+    dates (inclusive, default today and the following 13 days), 'duration'
+    and 'step' in minutes and 'limit'.
+
+    Raises:
+        ValueError: if a parameter is missing or malformed
+    """
+    doctor_ids = [id.strip() for id in request.args.get('doctor_ids', '').split(',') if id.strip()]
+    specialization = request.args.get('specialization', '').strip()
+    if not doctor_ids and not specialization:
+        raise ValueError("doctor_ids or specialization required")
+
+    first_day, last_day = get_date_range_args(DEFAULT_SEARCH_DAYS)
+
+    try:
+        duration = int(request.args.get('duration', MIN_APPOINTMENT_DURATION * 2))
+        step = int(request.args.get('step', DEFAULT_SEARCH_STEP))
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        raise ValueError("duration, step and limit must be integers")
+    if not MIN_APPOINTMENT_DURATION <= duration <= MAX_APPOINTMENT_DURATION:
+        raise ValueError(f"Duration must be between {MIN_APPOINTMENT_DURATION} - {MAX_APPOINTMENT_DURATION} minutes")
+    if step <= 0 or step % SLOT_GRANULARITY:
+        raise ValueError(f"step must be a positive multiple of {SLOT_GRANULARITY} minutes")
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_SEARCH_LIMIT}")
+
+    return {"doctor_ids": doctor_ids, "specialization": specialization,
+            "from": first_day, "to": last_day,
+            "duration": duration, "step": step, "limit": limit}
+
+
+def get_stream_format():
+    """
+    Reads the 'stream' query parameter of the current request.
+
+    Returns:
+        str: 'json' or 'ndjson' when a streamed response is requested else None
+    Raises:
+        ValueError: if the format is not supported
+    """
+    stream = request.args.get('stream')
+    if stream is None:
+        return None
+    if stream not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+    return stream
+
+
+def stream_response(objs, stream_format):
+    """
+    Returns a response that writes the objects as a JSON array or as NDJSON
+    while they are read, STREAM_CHUNK_SIZE objects per chunk
+    """
+    def generate():
+        chunk = []
+        first = True
+        if stream_format == 'json':
+            yield b"["
+        for obj in objs:
+            if stream_format == 'json':
+                chunk.append(codec.encode_object(obj) if first else b"," + codec.encode_object(obj))
+                first = False
+            else:
+                chunk.append(codec.encode_object(obj) + b"\n")
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+        if stream_format == 'json':
+            yield b"]"
+
+    return Response(stream_with_context(generate()),
+                    mimetype=STREAM_FORMATS[stream_format])
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+"""
+Short-lived holds placed by patients on a doctor's time range while they
+confirm a booking. Holds live in the API process and expire through a
+min-heap of expiry times, so expiring them never scans the holds.
+"""
+from datetime import datetime, timedelta
+from os import getenv
+from threading import Lock
+import heapq
+import time
+import uuid
+
+
+# Seconds a hold lasts when the client doesn't ask for less
+HOLD_TTL = int(getenv("HMS_HOLD_TTL", 120))
+MAX_HOLD_TTL = 600
+# Live holds a patient may have at once
+MAX_HOLDS_PER_PATIENT = int(getenv("HMS_MAX_HOLDS_PER_PATIENT", 3))
+
+
+class Hold:
+    """A patient's hold on a doctor's time range"""
+
+    def __init__(self, doctor_id, patient_id, scheduled_time, duration, ttl):
+        self.id = str(uuid.uuid4())
+        self.doctor_id = doctor_id
+        self.patient_id = patient_id
+        self.scheduled_time = scheduled_time
+        self.duration = duration
+        self.end_time = scheduled_time + timedelta(minutes=duration)
+        self.deadline = time.monotonic() + ttl
+        self.expires_at = datetime.now() + timedelta(seconds=ttl)
+
+    @property
+    def days(self):
+        """Dates the held range spans"""
+        day = self.scheduled_time.date()
+        last = (self.end_time - timedelta(microseconds=1)).date()
+        while day <= last:
+            yield day
+            day += timedelta(days=1)
+
+    def to_dict(self):
+        """Returns the hold as a JSON serializable dictionary"""
+        return {
+            "id": self.id,
+            "doctor_id": self.doctor_id,
+            "patient_id": self.patient_id,
+            "scheduled_time": self.scheduled_time.isoformat(),
+            "end_time": self.end_time.isoformat(),
+            "duration": self.duration,
+            "expires_at": self.expires_at.isoformat(),
+        }
+
+
+class HoldStore:
+    """
+    Live holds by id, by (doctor_id, date) and by patient. Every call first
+    pops the holds whose deadline passed off the expiry heap; released
+    holds stay in the heap and are skipped when their deadline comes.
+    """
+
+    def __init__(self):
+        self._holds = {}
+        self._by_day = {}
+        self._by_patient = {}
+        self._expiry = []
+        self._lock = Lock()
+
+    def _expire(self):
+        """Drops the holds past their deadline, call with the lock held"""
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, hold_id = heapq.heappop(self._expiry)
+            self._remove(hold_id)
+
+    def _remove(self, hold_id):
+        """Removes a hold from every map, call with the lock held"""
+        hold = self._holds.pop(hold_id, None)
+        if hold is None:
+            return None
+        for day in hold.days:
+            held = self._by_day.get((hold.doctor_id, day))
+            if held is not None:
+                held.pop(hold_id, None)
+                if not held:
+                    del self._by_day[(hold.doctor_id, day)]
+        patient_holds = self._by_patient.get(hold.patient_id)
+        if patient_holds is not None:
+            patient_holds.discard(hold_id)
+            if not patient_holds:
+                del self._by_patient[hold.patient_id]
+        return hold
+
+    def place(self, doctor_id, patient_id, scheduled_time, duration, ttl=HOLD_TTL):
+        """
+        Stores a new hold and returns it. The caller checks the range is
+        free first, under the doctor's booking lock.
+
+        Raises:
+            ValueError: if the patient already has MAX_HOLDS_PER_PATIENT live holds
+        """
+        with self._lock:
+            self._expire()
+            if len(self._by_patient.get(patient_id, ())) >= MAX_HOLDS_PER_PATIENT:
+                raise ValueError(f"At most {MAX_HOLDS_PER_PATIENT} holds at a time")
+            hold = Hold(doctor_id, patient_id, scheduled_time, duration, ttl)
+            self._holds[hold.id] = hold
+            for day in hold.days:
+                self._by_day.setdefault((doctor_id, day), {})[hold.id] = hold
+            self._by_patient.setdefault(patient_id, set()).add(hold.id)
+            heapq.heappush(self._expiry, (hold.deadline, hold.id))
+            return hold
+
+    def get(self, hold_id):
+        """Returns a live hold or None"""
+        with self._lock:
+            self._expire()
+            return self._holds.get(hold_id)
+
+    def release(self, hold_id):
+        """Removes a hold, returns it or None when it was not live"""
+        with self._lock:
+            self._expire()
+            return self._remove(hold_id)
+
+    def overlapping(self, doctor_id, start_time, end_time):
+        """Live holds of a doctor overlapping [start_time, end_time)"""
+        with self._lock:
+            self._expire()
+            found = {}
+            day = start_time.date()
+            while day <= (end_time - timedelta(microseconds=1)).date():
+                for hold in self._by_day.get((doctor_id, day), {}).values():
+                    if hold.end_time > start_time and hold.scheduled_time < end_time:
+                        found[hold.id] = hold
+                day += timedelta(days=1)
+            return list(found.values())
+
+    def in_range(self, doctor_ids, start_time, end_time):
+        """Live holds of any of the doctors overlapping [start_time, end_time)"""
+        doctor_ids = set(doctor_ids)
+        with self._lock:
+            self._expire()
+            return [hold for hold in self._holds.values()
+                    if hold.doctor_id in doctor_ids
+                    and hold.end_time > start_time and hold.scheduled_time < end_time]
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._holds)
+
+
+slot_holds = HoldStore()
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+"""
+Free time of many doctors over a range of days as one NumPy array, built
+from a handful of bulk queries so searches across doctors and dates don't
+loop over every doctor and day
+"""
+from datetime import datetime, timedelta, time as dtime
+import numpy as np
+from api.v1.holds import slot_holds
+from api.v1.slot_index import SLOT_GRANULARITY, UNITS_PER_DAY
+from models import storage
+from models.appointment import Appointment
+from models.availability import Availability
+from models.exception import Exception as DoctorException
+
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+def _minutes(times):
+    """Minutes since midnight of a list of times"""
+    return [moment.hour * 60 + moment.minute + moment.second / 60 for moment in times]
+
+
+def _units(minutes, round_up=False):
+    """Converts an array of minutes to whole units, rounding down or up"""
+    units = np.asarray(minutes, dtype=float) / SLOT_GRANULARITY
+    return (np.ceil(units) if round_up else np.floor(units)).astype(np.int64)
+
+
+class ScheduleGrid:
+    """
+    Free time of doctors over consecutive days.
+
+    available is a boolean array of shape (doctors, days, UNITS_PER_DAY),
+    True for every SLOT_GRANULARITY minute unit within the doctor's weekly
+    availability and not closed by an exception; free is the same without
+    the units booked or held. Availability is rounded inwards, exceptions,
+    bookings and holds outwards so a free unit is always free.
+    """
+
+    def __init__(self, doctors, first_day, free, available=None):
+        self.doctors = doctors
+        self.first_day = first_day
+        self.free = free
+        self.available = free if available is None else available
+
+    @property
+    def days(self):
+        """Number of days covered"""
+        return self.free.shape[1]
+
+    @classmethod
+    def load(cls, doctors, first_day, last_day):
+        """
+        Builds the grid of the given doctors from first_day to last_day
+        inclusive with three queries: their weekly availability, their
+        exceptions in the range and their scheduled appointments overlapping
+        it. Live holds of this process take their time like appointments,
+        as in available_slots and the booking check.
+        """
+        doctors = list(doctors)
+        days = (last_day - first_day).days + 1
+        free = np.zeros((len(doctors), days, UNITS_PER_DAY), dtype=bool)
+        if not doctors or days <= 0:
+            return cls(doctors, first_day, free, free.copy())
+
+        rows = {doctor.id: i for i, doctor in enumerate(doctors)}
+        ids = list(rows)
+        range_start = datetime.combine(first_day, dtime.min)
+        range_end = range_start + timedelta(days=days)
+
+        # Weekly availability as a (doctors, 7, units) template, marked with
+        # +1/-1 at window edges and summed along the day
+        availabilities = [row for row in storage.values(
+            Availability, ('doctor_id', 'day_of_week', 'start_time', 'end_time'), doctor_id__in=ids)
+            if row[1] in WEEKDAYS]
+        weekly = np.zeros((len(doctors), 7, UNITS_PER_DAY + 1), dtype=np.int32)
+        if availabilities:
+            doctor_ids, weekdays, start_times, end_times = zip(*availabilities)
+            doctor_rows = np.array([rows[id] for id in doctor_ids])
+            weekdays = np.array([WEEKDAYS.index(day) for day in weekdays])
+            starts = _units(_minutes(start_times), round_up=True)
+            ends = _units(_minutes(end_times))
+            valid = ends > starts
+            np.add.at(weekly, (doctor_rows[valid], weekdays[valid], starts[valid]), 1)
+            np.add.at(weekly, (doctor_rows[valid], weekdays[valid], ends[valid]), -1)
+        weekly = np.cumsum(weekly, axis=2)[:, :, :UNITS_PER_DAY] > 0
+        free[:] = weekly[:, (first_day.weekday() + np.arange(days)) % 7, :]
+
+        # Days, or times of each day, closed by an exception overlapping the range
+        closures = storage.values(DoctorException, ('doctor_id', 'start_date', 'end_date', 'start_time', 'end_time'),
+                                  doctor_id__in=ids, is_available=False,
+                                  start_date__lte=last_day, end_date__gte=first_day)
+        for doctor_id, start_date, end_date, start_time, end_time in closures:
+            days_closed = slice(max((start_date - first_day).days, 0), (end_date - first_day).days + 1)
+            if start_time is None or end_time is None:
+                free[rows[doctor_id], days_closed, :] = False
+            else:
+                units = slice(int(_units(_minutes([start_time]))[0]),
+                              int(_units(_minutes([end_time]), round_up=True)[0]))
+                free[rows[doctor_id], days_closed, units] = False
+        available = free.copy()
+
+        # Scheduled appointments and holds over the whole range as one timeline per doctor
+        busy = list(storage.values(Appointment, ('doctor_id', 'scheduled_time', 'end_time'),
+                                   doctor_id__in=ids, status='scheduled',
+                                   end_time__gt=range_start, scheduled_time__lt=range_end))
+        busy += [(hold.doctor_id, hold.scheduled_time, hold.end_time)
+                 for hold in slot_holds.in_range(ids, range_start, range_end)]
+        if busy:
+            total = days * UNITS_PER_DAY
+            origin = np.datetime64(range_start, 'us')
+            minute = np.timedelta64(1, 'm')
+            doctor_ids, start_times, end_times = zip(*busy)
+            doctor_rows = np.array([rows[id] for id in doctor_ids])
+            starts = _units((np.array(start_times, dtype='datetime64[us]') - origin) / minute)
+            ends = _units((np.array(end_times, dtype='datetime64[us]') - origin) / minute, round_up=True)
+            booked = np.zeros((len(doctors), total + 1), dtype=np.int32)
+            np.add.at(booked, (doctor_rows, np.clip(starts, 0, total)), 1)
+            np.add.at(booked, (doctor_rows, np.clip(ends, 0, total)), -1)
+            booked = np.cumsum(booked, axis=1)[:, :total] > 0
+            free &= ~booked.reshape(len(doctors), days, UNITS_PER_DAY)
+
+        return cls(doctors, first_day, free, available)
+
+    def first_free(self, duration, limit, step=SLOT_GRANULARITY, not_before=None):
+        """
+        Returns the earliest free slots of duration minutes across all
+        doctors as (doctor, start, end) tuples ordered by start time, at
+        most limit of them. Slots start every step minutes from midnight,
+        never before not_before and never span two days.
+        """
+        length = -(-duration // SLOT_GRANULARITY)
+        starts = np.arange(0, UNITS_PER_DAY - length + 1, max(step // SLOT_GRANULARITY, 1))
+        if not self.doctors or not len(starts):
+            return []
+
+        # Free units before each unit of the day, so a window is free when
+        # the count over it equals its length
+        counts = np.zeros(self.free.shape[:2] + (UNITS_PER_DAY + 1,), dtype=np.int32)
+        np.cumsum(self.free, axis=2, out=counts[:, :, 1:])
+        fits = counts[:, :, starts + length] - counts[:, :, starts] == length
+
+        if not_before is not None:
+            first_unit = _units((not_before - datetime.combine(self.first_day, dtime.min))
+                                / timedelta(minutes=1), round_up=True)
+            absolute = np.arange(self.days)[:, None] * UNITS_PER_DAY + starts[None, :]
+            fits &= (absolute >= first_unit)[None, :, :]
+
+        # Ordered by day, start then doctor
+        found = np.flatnonzero(fits.transpose(1, 2, 0))[:limit]
+        days, start_rows, doctor_rows = np.unravel_index(found, (self.days, len(starts), len(self.doctors)))
+        slots = []
+        for day, start_row, doctor_row in zip(days.tolist(), start_rows.tolist(), doctor_rows.tolist()):
+            start = datetime.combine(self.first_day + timedelta(days=day), dtime.min) + \
+                timedelta(minutes=int(starts[start_row]) * SLOT_GRANULARITY)
+            slots.append((self.doctors[doctor_row], start, start + timedelta(minutes=duration)))
+        return slots
+
+    def occupancy(self, bucket):
+        """
+        Returns the available and booked minutes of each doctor in every
+        bucket of bucket minutes (a multiple of SLOT_GRANULARITY dividing a
+        day) as two integer arrays of shape (doctors, days * 24 * 60 / bucket)
+        """
+        per_bucket = bucket // SLOT_GRANULARITY
+        shape = (len(self.doctors), self.days * UNITS_PER_DAY // per_bucket, per_bucket)
+        available = self.available.reshape(shape).sum(axis=2, dtype=np.int32)
+        free = self.free.reshape(shape).sum(axis=2, dtype=np.int32)
+        return available * SLOT_GRANULARITY, (available - free) * SLOT_GRANULARITY
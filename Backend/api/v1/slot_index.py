@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+"""
+In-process index of the free time of each doctor per day, kept as a bitmap
+of SLOT_GRANULARITY minute units so slot listings and booking checks don't
+recompute availability against every booked appointment
+"""
+from collections import OrderedDict, namedtuple
+from copy import copy
+from datetime import datetime, timedelta, time as dtime
+from os import getenv
+from threading import Lock
+import time
+
+
+# Minutes covered by one bit, must divide a day
+SLOT_GRANULARITY = int(getenv("HMS_SLOT_GRANULARITY", 5))
+# Seconds an indexed day is trusted before it is reloaded, bounds how stale
+# the index can get when other processes book the same doctor
+SLOT_INDEX_TTL = float(getenv("HMS_SLOT_INDEX_TTL", 30))
+# Indexed (doctor, day) pairs kept, least recently used are dropped first
+SLOT_INDEX_SIZE = int(getenv("HMS_SLOT_INDEX_SIZE", 4096))
+
+if SLOT_GRANULARITY <= 0 or (24 * 60) % SLOT_GRANULARITY:
+    raise ValueError("HMS_SLOT_GRANULARITY must divide 1440 minutes")
+
+UNITS_PER_DAY = 24 * 60 // SLOT_GRANULARITY
+
+# Read-only copies of the rows an indexed day is built from, shared by every
+# request thread so they must not be tied to a database session
+Window = namedtuple('Window', ['id', 'start_time', 'end_time'])
+DoctorRow = namedtuple('DoctorRow', ['id', 'first_name', 'last_name'])
+Booked = namedtuple('Booked', ['id', 'scheduled_time', 'end_time'])
+
+
+class Closure(namedtuple('Closure', ['id', 'is_available', 'start_time', 'end_time'],
+                         defaults=(None, None))):
+    """An exception on one day, covering the whole day when it has no times"""
+    __slots__ = ()
+
+    @property
+    def whole_day(self):
+        """True when the exception covers the whole day"""
+        return self.start_time is None or self.end_time is None
+
+    def blocks(self, start_time, end_time):
+        """True when the exception makes the doctor unavailable between two times of the day"""
+        if self.is_available:
+            return False
+        return self.whole_day or (self.start_time < end_time and self.end_time > start_time)
+
+
+def merge_windows(windows):
+    """
+    Availability windows of a day sorted by start, with windows that touch
+    or overlap merged into one: a range spanning 09:00-12:00 and 12:00-15:00
+    is within the availability
+    """
+    merged = []
+    for window in sorted(windows, key=lambda window: window.start_time):
+        if merged and window.start_time <= merged[-1].end_time:
+            if window.end_time > merged[-1].end_time:
+                merged[-1] = merged[-1]._replace(end_time=window.end_time)
+        else:
+            merged.append(Window(window.id, window.start_time, window.end_time))
+    return merged
+
+
+def _mask(first, last):
+    """Bits of the units first (inclusive) to last (exclusive)"""
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def _aligned(moment):
+    """True when a time or datetime falls on a unit boundary"""
+    return (moment.second == 0 and moment.microsecond == 0
+            and (moment.hour * 60 + moment.minute) % SLOT_GRANULARITY == 0)
+
+
+class DaySlots:
+    """
+    Free time of one doctor on one day.
+
+    context is a BookingContext holding only that day, used for exact
+    answers; bitmap has a bit set for every unit within the weekly
+    availability, not blocked by an exception and not booked. Availability
+    is rounded inwards, exceptions and bookings outwards so a set bit is always free,
+    and when every boundary is aligned a cleared bit is always taken.
+    Request threads read it without a lock, so it is never changed once
+    indexed: bookings replace it with an updated copy (see booked).
+    """
+
+    def __init__(self, day, context):
+        self.day = day
+        self.context = context
+        self.loaded_at = time.monotonic()
+        self._rebuild()
+
+    def _unit(self, moment, round_up=False):
+        """Unit index of a datetime within the day, clamped to the day"""
+        units = (moment - datetime.combine(self.day, dtime.min)) / timedelta(minutes=SLOT_GRANULARITY)
+        unit = -int(-units // 1) if round_up else int(units // 1)
+        return min(max(unit, 0), UNITS_PER_DAY)
+
+    @property
+    def closed(self):
+        """True when an exception marks the doctor unavailable the whole day"""
+        return any(not exception.is_available and exception.whole_day
+                   for exception in self.context.exceptions.get(self.day, []))
+
+    def _closures(self):
+        """Exceptions marking part of the day unavailable"""
+        return [exception for exception in self.context.exceptions.get(self.day, [])
+                if not exception.is_available and not exception.whole_day]
+
+    def _windows(self):
+        """Merged availability windows of the day, none on blocked dates"""
+        if self.closed:
+            return []
+        return merge_windows(self.context.availabilities.get(self.day.strftime('%A'), []))
+
+    def _booked_mask(self, appointment):
+        """Bits covered by an appointment"""
+        return _mask(self._unit(appointment.scheduled_time),
+                     self._unit(appointment.end_time, round_up=True))
+
+    def _rebuild(self):
+        """Recomputes the bitmap from the day context"""
+        bitmap = 0
+        for window in self._windows():
+            bitmap |= _mask(self._unit(datetime.combine(self.day, window.start_time), round_up=True),
+                            self._unit(datetime.combine(self.day, window.end_time)))
+        for closure in self._closures():
+            bitmap &= ~_mask(self._unit(datetime.combine(self.day, closure.start_time)),
+                             self._unit(datetime.combine(self.day, closure.end_time), round_up=True))
+        for appointment in self.context.appointments:
+            bitmap &= ~self._booked_mask(appointment)
+        self.bitmap = bitmap
+        self.exact = all(_aligned(window.start_time) and _aligned(window.end_time)
+                         for window in self._windows()) and all(
+            _aligned(closure.start_time) and _aligned(closure.end_time)
+            for closure in self._closures()) and all(
+            _aligned(appointment.scheduled_time) and _aligned(appointment.end_time)
+            for appointment in self.context.appointments)
+
+    @property
+    def expired(self):
+        """True when the day should be reloaded from the database"""
+        return time.monotonic() - self.loaded_at > SLOT_INDEX_TTL
+
+    def lookup(self, start_time, duration):
+        """
+        Bitmap lookup of a range: True when free, False when taken and None
+        when the bitmap can't tell (range or day not aligned to units)
+        """
+        end_time = start_time + timedelta(minutes=duration)
+        if (start_time.date() != self.day or end_time.date() != self.day
+                or not _aligned(start_time) or duration % SLOT_GRANULARITY):
+            return None
+        first = self._unit(start_time)
+        mask = _mask(first, first + duration // SLOT_GRANULARITY)
+        if mask and self.bitmap & mask == mask:
+            return True
+        return False if self.exact else None
+
+    def check(self, doctor_id, start_time, duration):
+        """
+        Checks a candidate appointment: free ranges are answered from the
+        bitmap, refusals by the exact check of the day context for the reason
+        """
+        if self.lookup(start_time, duration):
+            return self.context.available(doctor_id, start_time, duration)
+        return self.context.check(doctor_id, start_time, duration)
+
+    def free_slots(self, length):
+        """
+        Returns (start, end) datetimes of the free slots of length minutes,
+        stepping from the start of each availability window
+        """
+        slots = []
+        for window in self._windows():
+            current = datetime.combine(self.day, window.start_time)
+            window_end = datetime.combine(self.day, window.end_time)
+            while current + timedelta(minutes=length) <= window_end:
+                free = self.lookup(current, length)
+                if free is None:
+                    free = self.context.check(self.context.doctor.id, current, length).available
+                if free:
+                    slots.append((current, current + timedelta(minutes=length)))
+                current += timedelta(minutes=length)
+        return slots
+
+    def _with_appointments(self, appointments):
+        """A copy of the day with other scheduled appointments, as old as this one"""
+        context = copy(self.context)
+        context.appointments = appointments
+        slots = DaySlots(self.day, context)
+        slots.loaded_at = self.loaded_at
+        return slots
+
+    def booked(self, appointment):
+        """Returns a copy of the day with a new scheduled appointment taken"""
+        booked = Booked(appointment.id, appointment.scheduled_time, appointment.end_time)
+        return self._with_appointments(self.context.appointments + [booked])
+
+    def released(self, appointment):
+        """Returns a copy of the day with the time of an appointment no longer scheduled freed"""
+        return self._with_appointments([booked for booked in self.context.appointments
+                                        if booked.id != appointment.id])
+
+
+class SlotIndex:
+    """
+    LRU map of (doctor_id, day) to DaySlots shared by the request threads.
+    The lock guards the map only, a DaySlots is swapped for a new one when
+    its day changes so readers keep a consistent day.
+    """
+
+    def __init__(self, size=SLOT_INDEX_SIZE):
+        self.size = size
+        self._days = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, doctor_id, day):
+        """Returns the indexed DaySlots or None when missing or expired"""
+        with self._lock:
+            slots = self._days.get((doctor_id, day))
+            if slots is None or slots.expired:
+                return None
+            self._days.move_to_end((doctor_id, day))
+            return slots
+
+    def put(self, doctor_id, day, context):
+        """Indexes the day context of a doctor, returns its DaySlots"""
+        slots = DaySlots(day, context)
+        with self._lock:
+            self._days[(doctor_id, day)] = slots
+            self._days.move_to_end((doctor_id, day))
+            while len(self._days) > self.size:
+                self._days.popitem(last=False)
+        return slots
+
+    def book(self, appointment):
+        """Marks the time of a new appointment as taken"""
+        with self._lock:
+            for day in self._days_of(appointment):
+                slots = self._days.get((appointment.doctor_id, day))
+                if slots is not None:
+                    self._days[(appointment.doctor_id, day)] = slots.booked(appointment)
+
+    def release(self, appointment):
+        """Frees the time of a cancelled or completed appointment"""
+        with self._lock:
+            for day in self._days_of(appointment):
+                slots = self._days.get((appointment.doctor_id, day))
+                if slots is not None:
+                    self._days[(appointment.doctor_id, day)] = slots.released(appointment)
+
+    def invalidate(self, doctor_id, day=None):
+        """Drops the indexed days of a doctor, or one of them, so they are reloaded"""
+        with self._lock:
+            for key in [key for key in self._days
+                        if key[0] == doctor_id and day in (None, key[1])]:
+                del self._days[key]
+
+    def clear(self):
+        """Drops every indexed day"""
+        with self._lock:
+            self._days.clear()
+
+    @staticmethod
+    def _days_of(appointment):
+        """Dates an appointment spans"""
+        day = appointment.scheduled_time.date()
+        last = (appointment.end_time - timedelta(microseconds=1)).date()
+        while day <= last:
+            yield day
+            day += timedelta(days=1)
+
+
+slot_index = SlotIndex()
@@ -3,7 +3,16 @@
 from models import storage
 import models
 from api.v1.views import app_views
-from api.v1.helper_functions import role_required, is_doctor_available, validate_appointment_data
+from api.v1.helper_functions import role_required, validate_appointment_data
+from api.v1.helper_functions import get_page_args, paginated_response, get_stream_format, stream_response
+from api.v1.helper_functions import get_appointment_filters, get_slot_search_args, MAX_BATCH_CHECKS
+from api.v1.helper_functions import expand_recurrence, SERIES_MODES, MIN_BOOKING_NOTICE
+from api.v1.booking import check_many, book_appointment, book_series, reschedule_appointment
+from api.v1.booking import index_days, place_hold, confirm_hold
+from api.v1.holds import slot_holds, HOLD_TTL, MAX_HOLD_TTL
+from api.v1.slot_index import slot_index
+from api.v1.waitlist import waitlist_matcher
+from api.v1.schedule_grid import ScheduleGrid
 from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.appointment import Appointment
@@ -20,7 +29,6 @@ from models.exception import Exception as Doctor_Exception
 @role_required('patient')
 def create_appointment():
     """creates a new appointment"""
-    sess = storage.get_session()
     current_user_id = get_jwt_identity()
     print("Current user: ", current_user_id)
     
@@ -36,70 +44,237 @@ def create_appointment():
         duration = int(data['duration'])
 
         # Get Patient
-        patient = sess.query(Patient).filter_by(user_id=current_user_id).first()
-        print(patient.id)
+        patient = storage.get_by(Patient, user_id=current_user_id)
         if not patient:
             return jsonify({"error": "patient profile not found"}), 404
         
-        # check doctor exists
-        doctor = storage.get(Doctor, data['doctor_id'])
-        if not doctor:
-            return jsonify({"error": "Doctor not found"})
-        
-        day_of_week = scheduled_time.strftime("%A")
-        # print(day_of_week)
-        time_available = sess.query(Availability).filter(Availability.doctor_id==doctor.id,
-                                                            Availability.day_of_week==day_of_week).first()
-
-        if not time_available:
-            return jsonify({"error": "Availability and day not found"}), 400
+        # check doctor, availability, exceptions and conflicts and insert
+        # under the doctor/day booking lock
+        try:
+            result, new_appointment = book_appointment(patient.id, data['doctor_id'],
+                                                       scheduled_time, duration)
+        except Exception as e:
+            print("error when saving => ", e)
+            return jsonify({"error": "Something went wrong while saving"}), 500
 
-        working_hours_start = time_available.start_time
-        working_hours_end = time_available.end_time
+        if new_appointment is None:
+            return jsonify({"error": result.reason, "result": result.to_dict()}), result.status_code
+        doctor = result.doctor
 
-        #working_hours_start = datetime.strptime(data['start_time'], "%H:%M").time()
-        #working_hours_end = datetime.strptime(data['end_time'], "%H:%M").time()
-        
-        # check available
-        is_available, reason = is_doctor_available(doctor.id,
-                                           scheduled_time,
-                                           duration,
-                                           working_hours_start,
-                                           working_hours_end,
-                                           appointment_id_to_ignore=None
-                        )
-        
-        if not is_available:
-            return jsonify({"error": reason}), 409
-        
-        # create appointment
-        new_appointment = Appointment(
-            patient_id=patient.id,
-            doctor_id=doctor.id,
-            scheduled_time=scheduled_time,
-            duration=duration,
-            status='scheduled'
-        )
-
-        try:
-            storage.new(new_appointment)
-            storage.save()
-            return jsonify({
-                "id": new_appointment.id,
+        return jsonify({
+            "id": new_appointment.id,
             "message": "Appointment scheduled successfully",
             "details": {
                 "doctor": f"Dr. {doctor.first_name} {doctor.last_name}",
                 "time": scheduled_time.isoformat(),
                 "duration": duration
-            }
-            }), 201
-        except Exception as e:
-            print("error when saving => ", e)
-            return jsonify({"error": "Something went wrong while saving"})
+            },
+            "result": result.to_dict()
+        }), 201
 
     except Exception as e:
         
         return jsonify({"error": str(e)}), 500
+
+
+@app_views.route("/appointments/series", methods=["POST"], strict_slashes=False)
+@jwt_required()
+@role_required('patient')
+def create_appointment_series():
+    """
+    Books a recurring series of appointments in one transaction.
+    Takes the fields of POST /appointments for the first occurrence plus
+    {"recurrence": {"frequency": "weekly", "interval": 1, "count": 12},
+     "mode": "all_or_nothing" | "skip_conflicts"}
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "not a json"}), 400
+
+    errors = validate_appointment_data(data)
+    if errors:
+        return jsonify({"errors": errors}), 400
+
+    mode = data.get('mode', 'all_or_nothing')
+    if mode not in SERIES_MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(SERIES_MODES)}"}), 400
+    try:
+        start_times = expand_recurrence(datetime.fromisoformat(data['scheduled_time']),
+                                        data.get('recurrence'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    patient = storage.get_by(Patient, user_id=get_jwt_identity())
+    if not patient:
+        return jsonify({"error": "patient profile not found"}), 404
+
+    try:
+        results, appointments = book_series(patient.id, data['doctor_id'], start_times,
+                                            int(data['duration']),
+                                            skip_conflicts=mode == 'skip_conflicts')
+    except Exception as e:
+        print("error when saving => ", e)
+        return jsonify({"error": "Something went wrong while saving"}), 500
+
+    if not appointments:
+        refused = next(result for result in results if not result.available)
+        return jsonify({
+            "error": refused.reason,
+            "results": [result.to_dict() for result in results]
+        }), refused.status_code
+
+    return jsonify({
+        "series_id": appointments[0].series_id,
+        "message": f"{len(appointments)} of {len(results)} appointments scheduled successfully",
+        "appointments": [appointment.id for appointment in appointments],
+        "skipped": [result.to_dict() for result in results if not result.available],
+        "results": [result.to_dict() for result in results]
+    }), 201
+
+
+@app_views.route("/appointments/holds", methods=["POST"], strict_slashes=False)
+@jwt_required()
+@role_required('patient')
+def create_hold():
+    """
+    Holds a doctor's time range for 'ttl' seconds while the patient confirms.
+    Takes the same fields as POST /appointments
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "not a json"}), 400
+
+    errors = validate_appointment_data(data)
+    if errors:
+        return jsonify({"errors": errors}), 400
+
+    try:
+        ttl = int(data.get('ttl', HOLD_TTL))
+    except (TypeError, ValueError):
+        return jsonify({"error": "ttl must be an integer"}), 400
+    if not 1 <= ttl <= MAX_HOLD_TTL:
+        return jsonify({"error": f"ttl must be between 1 and {MAX_HOLD_TTL} seconds"}), 400
+
+    patient = storage.get_by(Patient, user_id=get_jwt_identity())
+    if not patient:
+        return jsonify({"error": "patient profile not found"}), 404
+
+    try:
+        result, hold = place_hold(patient.id, data['doctor_id'],
+                                  datetime.fromisoformat(data['scheduled_time']),
+                                  int(data['duration']), ttl)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 429
+
+    if hold is None:
+        return jsonify({"error": result.reason, "result": result.to_dict()}), result.status_code
+    return jsonify(hold.to_dict()), 201
+
+
+def get_own_hold(hold_id):
+    """
+    Returns (hold, None) for a live hold of the current patient, else
+    (None, error response)
+    """
+    hold = slot_holds.get(hold_id)
+    if hold is None:
+        return None, (jsonify({"error": "hold not found or expired"}), 404)
+    patient = storage.get_by(Patient, user_id=get_jwt_identity())
+    if not patient or hold.patient_id != patient.id:
+        return None, (jsonify({"error": "Unauthorized"}), 403)
+    return hold, None
+
+
+@app_views.route("/appointments/holds/<string:hold_id>", methods=["GET"], strict_slashes=False)
+@jwt_required()
+@role_required('patient')
+def get_hold(hold_id):
+    """Retrieves a live hold of the current patient"""
+    hold, error = get_own_hold(hold_id)
+    if error:
+        return error
+    return jsonify(hold.to_dict()), 200
+
+
+@app_views.route("/appointments/holds/<string:hold_id>", methods=["DELETE"], strict_slashes=False)
+@jwt_required()
+@role_required('patient')
+def release_hold(hold_id):
+    """Releases a hold of the current patient before it expires"""
+    hold, error = get_own_hold(hold_id)
+    if error:
+        return error
+    slot_holds.release(hold.id)
+    waitlist_matcher.slot_freed(hold.doctor_id, hold.scheduled_time, hold.end_time)
+    return jsonify({"message": "Hold released"}), 200
+
+
+@app_views.route("/appointments/holds/<string:hold_id>/confirm", methods=["POST"], strict_slashes=False)
+@jwt_required()
+@role_required('patient')
+def confirm_appointment_hold(hold_id):
+    """Turns a live hold of the current patient into a scheduled appointment"""
+    hold, error = get_own_hold(hold_id)
+    if error:
+        return error
+
+    try:
+        result, appointment = confirm_hold(hold)
+    except Exception as e:
+        print("error when saving => ", e)
+        return jsonify({"error": "Something went wrong while saving"}), 500
+
+    if appointment is None:
+        return jsonify({"error": result.reason, "result": result.to_dict()}), result.status_code
+    waitlist_matcher.hold_confirmed(hold, appointment)
+
+    return jsonify({
+        "id": appointment.id,
+        "message": "Appointment scheduled successfully",
+        "hold_id": hold.id,
+        "result": result.to_dict()
+    }), 201
+
+
+@app_views.route("/appointments/check", methods=["POST"], strict_slashes=False)
+@jwt_required()
+def check_appointment_times():
+    """
+    Checks many candidate times, for one or many doctors, without booking them.
+    Expects {"doctor_id": str, "candidates": [{"doctor_id": str, "scheduled_time": ISO 8601, "duration": int}]}
+    where a candidate's doctor_id defaults to the top level one
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "not a json"}), 400
+
+    doctor_id = data.get('doctor_id')
+    candidates = data.get('candidates')
+    if not isinstance(candidates, list) or not candidates:
+        return jsonify({"error": "a list of candidates required"}), 400
+    if len(candidates) > MAX_BATCH_CHECKS:
+        return jsonify({"error": f"At most {MAX_BATCH_CHECKS} candidates per request"}), 400
+
+    parsed = []
+    for i, candidate in enumerate(candidates):
+        if not isinstance(candidate, dict):
+            return jsonify({"error": "each candidate must be an object", "index": i}), 400
+        candidate = dict(candidate)
+        candidate.setdefault('doctor_id', doctor_id)
+        if not candidate['doctor_id']:
+            return jsonify({"error": "doctor_id required", "index": i}), 400
+        errors = validate_appointment_data(candidate)
+        if errors:
+            return jsonify({"errors": errors, "index": i}), 400
+        parsed.append((candidate['doctor_id'], datetime.fromisoformat(candidate['scheduled_time']),
+                       int(candidate['duration'])))
+
+    results = check_many(parsed)
+    response = {"results": [result.to_dict() for result in results]}
+    if doctor_id:
+        response["doctor_id"] = doctor_id
+    return jsonify(response), 200
+
         
 @app_views.route("/appointments/<string:appointment_id>", methods=["GET"], strict_slashes=False)
 @jwt_required()
@@ -145,19 +320,48 @@ def get_appointment(appointment_id):
 @app_views.route("/appointments", methods=["GET"], strict_slashes=False)
 @jwt_required()
 def get_appointments():
-    """Get all appointments"""
+    """
+    Get the appointments visible to the current user, optionally filtered
+    by doctor_id, patient_id, status and a from/to scheduled time range
+    """
     current_user_id = get_jwt_identity()
     current_user = storage.get(User, current_user_id)
     
     if not current_user:
         return jsonify({"error": "Unauthorized"}), 401
     
-    appointments = storage.all(Appointment).values()
+    try:
+        limit, after = get_page_args()
+        stream = get_stream_format()
+        filters = get_appointment_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Scope the query to the caller so patients and doctors only read their own rows
+    if current_user.role == 'patient':
+        patient = storage.get_by(Patient, user_id=current_user_id)
+        if not patient:
+            return jsonify({"error": "patient profile not found"}), 404
+        if filters.get('patient_id', patient.id) != patient.id:
+            return jsonify({"error": "Unauthorized"}), 403
+        filters['patient_id'] = patient.id
+    elif current_user.role == 'doctor':
+        doctor = storage.get_by(Doctor, user_id=current_user_id)
+        if not doctor:
+            return jsonify({"error": "doctor not found"}), 404
+        if filters.get('doctor_id', doctor.id) != doctor.id:
+            return jsonify({"error": "Unauthorized"}), 403
+        filters['doctor_id'] = doctor.id
+
+    if stream:
+        return stream_response(storage.iterate(Appointment, after, **filters), stream)
+
+    appointments, next_key = storage.page(Appointment, limit, after, **filters)
 
     if not appointments:
         return jsonify({"error": "appointments not found"}), 404
     
-    return jsonify([appointment.to_dict() for appointment in appointments]), 200
+    return paginated_response(appointments, next_key), 200
 
 
 @app_views.route("/appointments/<string:appointment_id>/cancel", methods=["PUT"], strict_slashes=False)
@@ -206,11 +410,81 @@ def cancel_appointment(appointment_id):
 
     # commit changes
     try:
-        storage.save()
+        appointment.save()
+        slot_index.release(appointment)
+        # offer the freed time to the waitlist
+        waitlist_matcher.slot_freed(appointment.doctor_id, appointment.scheduled_time, appointment.end_time)
         return  jsonify({"message": "Appointment cancelled successfully"}), 200
     except Exception as e:
         return jsonify({"error": "error while saving"}), 500    
 
+@app_views.route("/appointments/<string:appointment_id>/reschedule", methods=["PUT"], strict_slashes=False)
+@jwt_required()
+@role_required('admin', 'doctor', 'patient')
+def reschedule(appointment_id):
+    """
+    Moves an appointment to a new time with the same doctor in one step.
+    Expects {"scheduled_time": ISO 8601, "duration": int (optional, default the current one)}
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "not a json"}), 400
+
+    appointment = storage.get(Appointment, appointment_id)
+    if not appointment:
+        return jsonify({"error": "appointment not found"}), 404
+
+    current_user_id = get_jwt_identity()
+    current_user = storage.get(User, current_user_id)
+    if not current_user:
+        return jsonify({"error": "user not found"}), 400
+
+    # authorization
+    if current_user.role == 'patient':
+        patient = storage.get_by(Patient, user_id=current_user_id)
+        if not patient or appointment.patient_id != patient.id:
+            return jsonify({"error": "Unauthorized"}), 401
+    elif current_user.role == 'doctor':
+        doctor = storage.get_by(Doctor, user_id=current_user_id)
+        if not doctor or appointment.doctor_id != doctor.id:
+            return jsonify({"error": "Unauthorized"}), 401
+
+    if appointment.status != 'scheduled':
+        return jsonify({"error": f"Cannot reschedule {appointment.status} appointment"}), 400
+    if appointment.scheduled_time <= datetime.now():
+        return jsonify({"error": "Cannot reschedule past appointments"}), 400
+
+    data = dict(data, doctor_id=appointment.doctor_id)
+    data.setdefault('duration', appointment.duration)
+    errors = validate_appointment_data(data)
+    if errors:
+        return jsonify({"errors": errors}), 400
+
+    scheduled_time = datetime.fromisoformat(data['scheduled_time'])
+    duration = int(data['duration'])
+    previous_range = (appointment.scheduled_time, appointment.end_time)
+    try:
+        result, moved = reschedule_appointment(appointment, scheduled_time, duration)
+    except Exception as e:
+        print("error when saving => ", e)
+        return jsonify({"error": "Something went wrong while saving"}), 500
+
+    if moved is None:
+        return jsonify({"error": result.reason, "result": result.to_dict()}), result.status_code
+    waitlist_matcher.slot_freed(moved.doctor_id, *previous_range)
+
+    return jsonify({
+        "id": moved.id,
+        "message": "Appointment rescheduled successfully",
+        "details": {
+            "doctor": f"Dr. {result.doctor.first_name} {result.doctor.last_name}",
+            "time": scheduled_time.isoformat(),
+            "duration": duration
+        },
+        "result": result.to_dict()
+    }), 200
+
+
 @app_views.route('appointments/<string:appointment_id>/complete', methods=["PUT"], strict_slashes=False)
 @jwt_required()
 @role_required('doctor')
@@ -246,7 +520,8 @@ def complete_appointment(appointment_id):
     
     appointment.status = 'completed'
 
-    storage.save()
+    appointment.save()
+    slot_index.release(appointment)
 
     return jsonify({"message": "Appointment marked as completed"}), 200
 
@@ -254,7 +529,6 @@ def complete_appointment(appointment_id):
 @app_views.route('/appointments/available_slots', methods=['GET'], strict_slashes=False)
 @jwt_required()
 def get_available_slots():
-    sess = storage.get_session()
     data = request.get_json(silent=True)
 
     if not data:
@@ -271,59 +545,64 @@ def get_available_slots():
     except ValueError:
         return jsonify({"error": "Invalid date format (use YYYY-MM-DD)"}), 400
     
-    # Get doctor's availability for this day
-    day_of_week = target_date.strftime('%A')
-    availability = sess.query(Availability).filter_by(
-        doctor_id=doctor_id,
-        day_of_week=day_of_week
-    ).all()
-
-    # check for exceptions
-    exception = sess.query(Doctor_Exception).filter_by(
-        doctor_id=doctor_id,
-        date=target_date
-    ).first()
-
-    if exception and not exception.is_available:
+    # availability, exceptions and bookings of the day from the free-slot index
+    days = index_days(doctor_id, {target_date})
+    if days is None:
+        return jsonify({"error": "doctor not found"}), 404
+    day_slots = days[target_date]
+
+    if day_slots.closed:
         return jsonify({"available": False, "reason": "Doctor unavailable on this date"}), 200
     
-    # Get booked slots
-    start_of_day = datetime.combine(target_date, datetime.min.time())
-    end_of_day = datetime.combine(target_date, datetime.max.time())
-    
-    booked_slots = sess.query(Appointment).filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.status == 'scheduled',
-        Appointment.scheduled_time.between(start_of_day, end_of_day)
-    ).all()
-    
-    
     # Generate available slots (30-minute intervals)
-    available_slots = []
-    for avail in availability:
-        current_time = datetime.combine(target_date, avail.start_time)
-        end_time = datetime.combine(target_date, avail.end_time)
-        
-        while current_time + timedelta(minutes=30) <= end_time:
-            slot_end = current_time + timedelta(minutes=30)
-            
-            # Check if slot is booked
-            is_booked = any(
-                a.scheduled_time < slot_end and 
-                a.scheduled_time + timedelta(a.duration) > current_time
-                for a in booked_slots
-            )
-            
-            if not is_booked and current_time > datetime.now():
-                available_slots.append({
-                    "start": current_time.isoformat(),
-                    "end": slot_end.isoformat()
-                })
-            
-            current_time += timedelta(minutes=30)
+    now = datetime.now()
+    available_slots = [
+        {"start": start.isoformat(), "end": end.isoformat()}
+        for start, end in day_slots.free_slots(30)
+        if start > now and not slot_holds.overlapping(doctor_id, start, end)
+    ]
     
     return jsonify({
         "date": date,
         "doctor_id": doctor_id,
         "available_slots": available_slots
     })
+
+
+@app_views.route('/appointments/search', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def search_available_slots():
+    """
+    Finds the earliest free slots across many doctors, chosen by 'doctor_ids'
+    or 'specialization', between the 'from' and 'to' dates
+    """
+    try:
+        args = get_slot_search_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if args['doctor_ids']:
+        found = storage.get_many(Doctor, args['doctor_ids'])
+        doctors = [found[id] for id in dict.fromkeys(args['doctor_ids']) if id in found]
+    else:
+        doctors = list(storage.iterate(Doctor, specialization=args['specialization']))
+
+    if not doctors:
+        return jsonify({"error": "doctors not found"}), 404
+
+    grid = ScheduleGrid.load(doctors, args['from'], args['to'])
+    slots = grid.first_free(args['duration'], args['limit'], args['step'],
+                            not_before=datetime.now() + timedelta(minutes=MIN_BOOKING_NOTICE))
+
+    return jsonify({
+        "from": args['from'].isoformat(),
+        "to": args['to'].isoformat(),
+        "duration": args['duration'],
+        "slots": [{
+            "doctor_id": doctor.id,
+            "doctor": f"Dr. {doctor.first_name} {doctor.last_name}",
+            "specialization": doctor.specialization,
+            "start": start.isoformat(),
+            "end": end.isoformat()
+        } for doctor, start, end in slots]
+    }), 200
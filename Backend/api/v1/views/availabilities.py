@@ -6,18 +6,29 @@ from models.availability import Availability
 from models.doctor import Doctor
 from api.v1.views import app_views
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from api.v1.helper_functions import role_required
+from api.v1.helper_functions import role_required, get_page_args, paginated_response, get_stream_format, stream_response
+from api.v1.slot_index import slot_index
+from api.v1.availability_cache import availability_cache
 
 
 @app_views.route("/availabilities", methods=["GET"], strict_slashes=False)
 @jwt_required()
 def get_all_availabilities():
     """Retrieves all the availability data"""
-    availabilities = storage.all(Availability).values()
+    try:
+        limit, after = get_page_args()
+        stream = get_stream_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_response(storage.iterate(Availability, after), stream)
+
+    availabilities, next_key = storage.page(Availability, limit, after)
 
     if not availabilities:
         return jsonify({"error": "availabilities not found"}), 404
-    return jsonify([availability.to_dict() for availability in availabilities]), 200
+    return paginated_response(availabilities, next_key), 200
 
 
 @app_views.route("/availabilities/<string:availability_id>", methods=["GET"], strict_slashes=False)
@@ -74,6 +85,8 @@ def create_availability():
     try:
         storage.new(new_avail)
         storage.save()
+        availability_cache.invalidate_availability(new_avail.doctor_id, new_avail.day_of_week)
+        slot_index.invalidate(new_avail.doctor_id)
         return jsonify(new_avail.to_dict()), 201
     except Exception as e:
         print(e)
@@ -99,8 +112,12 @@ def update_availability(availability_id):
         if not is_valid_id:
             return jsonify({"error": "doctor id is invalid"}), 400
     
+    previous_doctor_id = availability.doctor_id
+    previous_day = availability.day_of_week
     keys_to_ignore = {"id", "created_at", "updated_at"}
 
+    # validated before changing the availability, kept in memory between requests
+    updates = {}
     for k, v in data.items():
         if k not in keys_to_ignore:
             if k == 'start_time':
@@ -117,10 +134,16 @@ def update_availability(availability_id):
                     v = end_time
                 except ValueError as e:
                     return jsonify({"error": f"Invalid time format: {str(e)}"}), 400
-            setattr(availability, k, v)
+            updates[k] = v
+    for k, v in updates.items():
+        setattr(availability, k, v)
 
     try:
         availability.save()
+        availability_cache.invalidate_availability(previous_doctor_id, previous_day)
+        availability_cache.invalidate_availability(availability.doctor_id, availability.day_of_week)
+        slot_index.invalidate(previous_doctor_id)
+        slot_index.invalidate(availability.doctor_id)
         return jsonify(availability.to_dict()), 200
     except Exception as e:
         print(e)
@@ -138,6 +161,8 @@ def delete_availability(availability_id):
     try:
         storage.delete(availability)
         storage.save()
+        availability_cache.invalidate_availability(availability.doctor_id, availability.day_of_week)
+        slot_index.invalidate(availability.doctor_id)
         return jsonify({"message": "availability deleted succefully"}), 200
     except Exception as e:
         print("error deleting", e)
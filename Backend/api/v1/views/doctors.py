@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 """Endpoint for Doctor"""
-from models import storage
+from models import storage, codec
 from flask import jsonify, request
 from models.doctor import Doctor
 from api.v1.views import app_views
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from api.v1.helper_functions import role_required
+from api.v1.helper_functions import role_required, get_page_args, paginated_response, get_stream_format, stream_response
+from api.v1.helper_functions import get_heatmap_args
+from api.v1.schedule_grid import ScheduleGrid
+from api.v1.availability_cache import availability_cache
+from api.v1.slot_index import slot_index
+import base64
+import numpy as np
 import re
 from models.user import User
 
@@ -15,11 +21,70 @@ from models.user import User
 @role_required('admin')
 def get_all_doctors():
     """Retrieves all doctors data from db"""
-    doctors = storage.all(Doctor).values()
+    try:
+        limit, after = get_page_args()
+        stream = get_stream_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_response(storage.iterate(Doctor, after), stream)
+
+    doctors, next_key = storage.page(Doctor, limit, after)
 
     if not doctors:
         return jsonify({"error": "not found"}), 400
-    return jsonify([doc.to_dict() for doc in doctors]), 200
+    return paginated_response(doctors, next_key), 200
+
+
+@app_views.route('/doctors/heatmap', methods=["GET"], strict_slashes=False)
+@jwt_required()
+@role_required('admin')
+def get_doctors_heatmap():
+    """
+    Available and booked minutes of every doctor, or of the doctors chosen
+    by 'doctor_ids' or 'specialization', per time bucket between the 'from'
+    and 'to' dates. Both matrices are doctors x buckets, row major, as
+    nested lists or base64 encoded uint8 arrays
+    """
+    try:
+        args = get_heatmap_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if args['doctor_ids']:
+        found = storage.get_many(Doctor, args['doctor_ids'])
+        doctors = [found[id] for id in dict.fromkeys(args['doctor_ids']) if id in found]
+    elif args['specialization']:
+        doctors = list(storage.iterate(Doctor, specialization=args['specialization']))
+    else:
+        doctors = list(storage.iterate(Doctor))
+
+    if not doctors:
+        return jsonify({"error": "doctors not found"}), 404
+
+    grid = ScheduleGrid.load(doctors, args['from'], args['to'])
+    available, booked = grid.occupancy(args['bucket'])
+
+    if args['encoding'] == 'base64':
+        # bucket is at most 240 minutes so every value fits in a byte
+        available, booked = (base64.b64encode(matrix.astype(np.uint8).tobytes()).decode()
+                             for matrix in (available, booked))
+    else:
+        available, booked = available.tolist(), booked.tolist()
+
+    return jsonify({
+        "from": args['from'].isoformat(),
+        "to": args['to'].isoformat(),
+        "bucket_minutes": args['bucket'],
+        "shape": [len(doctors), grid.days * 24 * 60 // args['bucket']],
+        "encoding": args['encoding'],
+        "doctors": [{"id": doctor.id,
+                     "name": f"Dr. {doctor.first_name} {doctor.last_name}",
+                     "specialization": doctor.specialization} for doctor in doctors],
+        "available": available,
+        "booked": booked
+    }), 200
 
 
 @app_views.route('/doctors/<string:doctor_id>', methods=["GET"], strict_slashes=False)
@@ -186,10 +251,16 @@ def update_doctor(doctor_id):
 
     keys_to_ignore = {"id", "created_at", "updated_at"}
 
-    for k, v in new_data.items():
-        if k not in keys_to_ignore:
-            setattr(doctor, k, v)
+    # checked before changing the doctor, kept in memory between requests
+    updates = {k: v for k, v in new_data.items() if k not in keys_to_ignore}
+    try:
+        codec.check(doctor, updates)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for k, v in updates.items():
+        setattr(doctor, k, v)
     doctor.save()
+    availability_cache.invalidate_doctor(doctor_id)
     return jsonify(doctor.to_dict()), 200
 
 
@@ -204,6 +275,8 @@ def delete_doctor(doctor_id):
         return jsonify({"error": "doctor not found"}), 404
     try:
         storage.delete(doctor)
+        availability_cache.invalidate_doctor(doctor_id)
+        slot_index.invalidate(doctor_id)
         return jsonify({}), 200
     except Exception as e:
         print("Error: ", e)
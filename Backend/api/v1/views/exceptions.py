@@ -1,25 +1,42 @@
 #!/usr/bin/env python3
 """Endpoint for Exception"""
-from models import storage
+from models import storage, codec
 from flask import jsonify, request
 from models.exception import Exception as Doctor_Exception
 from models.doctor import Doctor
 from api.v1.views import app_views
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from api.v1.helper_functions import role_required
+from api.v1.helper_functions import role_required, get_page_args, paginated_response, get_stream_format, stream_response
+from api.v1.helper_functions import get_exception_fields, MAX_BULK_EXCEPTIONS
+from api.v1.slot_index import slot_index
+from api.v1.availability_cache import availability_cache
 
 
+def invalidate_exception(exception):
+    """Drops the cached exceptions and indexed days of the doctor over the period of an exception"""
+    availability_cache.invalidate_exception(exception.doctor_id, exception.start_date, exception.end_date)
+    slot_index.invalidate(exception.doctor_id)
+
 
 @app_views.route("/exceptions", methods=["GET"], strict_slashes=False)
 @jwt_required()
 def get_all_exceptions():
     """Gets all exceptions in the database"""
-    exceptions = storage.all(Doctor_Exception).values()
+    try:
+        limit, after = get_page_args()
+        stream = get_stream_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_response(storage.iterate(Doctor_Exception, after), stream)
+
+    exceptions, next_key = storage.page(Doctor_Exception, limit, after)
 
     if not exceptions:
         return jsonify({"error": "exceptions not found"}), 404
 
-    return jsonify([exception.to_dict() for exception in exceptions]), 200
+    return paginated_response(exceptions, next_key), 200
 
 
 @app_views.route('/exceptions/<string:exception_id>', methods=["GET"], strict_slashes=False)
@@ -36,17 +53,25 @@ def get_exception_data(exception_id):
 @app_views.route("/exceptions", methods=['POST'], strict_slashes=False)
 @jwt_required()
 def create_exception():
-    """creates a new exception"""
+    """
+    creates a new exception, for one 'date' or from 'start_date' to
+    'end_date', optionally from 'start_time' to 'end_time' on each day
+    """
     data = request.get_json(silent=True)
 
     if not data:
         return jsonify({"error": "invalid json"}), 400
     
-    required_fields = ["doctor_id", "date", "is_available"]
+    required_fields = ["doctor_id", "is_available"]
 
     for field in required_fields:
         if field not in data:
             return jsonify({"error": f"missing field '{field}'"}), 400
+
+    try:
+        period = get_exception_fields(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # Check if is valid ID and Exists
     is_valid_id = storage.find(Doctor, data.get('doctor_id'))
@@ -55,17 +80,72 @@ def create_exception():
     
     new_exception = Doctor_Exception(
         doctor_id=data.get('doctor_id'),
-        date=data.get('date'),
-        is_available=data.get('is_available')
+        is_available=data.get('is_available'),
+        **period
     )
     try:
         storage.new(new_exception)
         storage.save()
+        invalidate_exception(new_exception)
         return jsonify(new_exception.to_dict()), 201
     except Exception as e:
         print(e)
         return jsonify({"error": f"Error saving => {e}"}), 500
-    
+
+
+@app_views.route("/exceptions/bulk", methods=['POST'], strict_slashes=False)
+@jwt_required()
+@role_required('admin', 'doctor')
+def create_exceptions():
+    """
+    creates many exceptions in one transaction.
+    Expects {"doctor_id": str, "is_available": bool, "exceptions": [{...}]}
+    where each exception takes the fields of POST /exceptions and
+    doctor_id and is_available default to the top level ones
+    """
+    data = request.get_json(silent=True)
+
+    if not data:
+        return jsonify({"error": "invalid json"}), 400
+
+    items = data.get('exceptions')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "a list of exceptions required"}), 400
+    if len(items) > MAX_BULK_EXCEPTIONS:
+        return jsonify({"error": f"At most {MAX_BULK_EXCEPTIONS} exceptions per request"}), 400
+
+    new_exceptions = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify({"error": f"exception {i} is not an object"}), 400
+        doctor_id = item.get('doctor_id', data.get('doctor_id'))
+        is_available = item.get('is_available', data.get('is_available'))
+        if doctor_id is None or is_available is None:
+            return jsonify({"error": f"exception {i}: doctor_id and is_available required"}), 400
+        try:
+            period = get_exception_fields(item)
+        except ValueError as e:
+            return jsonify({"error": f"exception {i}: {e}"}), 400
+        new_exceptions.append(Doctor_Exception(doctor_id=doctor_id, is_available=is_available, **period))
+
+    doctor_ids = {exception.doctor_id for exception in new_exceptions}
+    found = {id for id, in storage.values(Doctor, ('id',), id__in=doctor_ids)}
+    if found != doctor_ids:
+        return jsonify({"error": "doctor id is invalid", "doctor_ids": sorted(doctor_ids - found)}), 400
+
+    try:
+        for exception in new_exceptions:
+            storage.new(exception)
+        storage.save()
+    except Exception as e:
+        print(e)
+        storage.rollback()
+        return jsonify({"error": f"Error saving => {e}"}), 500
+
+    for exception in new_exceptions:
+        invalidate_exception(exception)
+    return jsonify([exception.to_dict() for exception in new_exceptions]), 201
+
 
 @app_views.route('/exceptions/<string:exception_id>', methods=["PUT"], strict_slashes=False)
 @jwt_required()
@@ -81,14 +161,30 @@ def update_exception(exception_id):
 
     if not new_data:
         return jsonify({"error": "not a valid json"}), 400
+
+    try:
+        period = get_exception_fields(new_data, exception)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    keys_to_ignore = {"id", "created_at", "updated_at"}
+    previous_doctor_id = exception.doctor_id
+    previous_period = (exception.start_date, exception.end_date)
+    keys_to_ignore = {"id", "created_at", "updated_at"} | set(period)
 
-    for key, value in new_data.items():
-        if key not in keys_to_ignore:
-            setattr(exception, key, value)
+    # checked before changing the exception, kept in memory between requests
+    updates = {key: value for key, value in new_data.items() if key not in keys_to_ignore}
+    updates.update(period)
+    try:
+        codec.check(exception, updates)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for key, value in updates.items():
+        setattr(exception, key, value)
     try:
         exception.save()
+        availability_cache.invalidate_exception(previous_doctor_id, *previous_period)
+        slot_index.invalidate(previous_doctor_id)
+        invalidate_exception(exception)
         return jsonify(exception.to_dict()), 200
     except Exception as e:
         print(e)
@@ -108,6 +204,7 @@ def delete_exception(exception_id):
     try:
         storage.delete(exception)
         storage.save()
+        invalidate_exception(exception)
         return jsonify({"message": "exception deleted successfully"})
     except Exception as e:
         print("error deleting exeption", e)
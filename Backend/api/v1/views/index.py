@@ -3,10 +3,17 @@
 from api.v1.views import app_views
 from flask import jsonify
 from models import storage
-from models.user import User
-from models.doctor import Doctor
-from models.patient import Patient
-from models.appointment import Appointment
+from api.v1.availability_cache import availability_cache
+from os import getenv
+from threading import Lock
+import time
+
+
+# Seconds a /stats response is served from memory before it is recomputed
+STATS_TTL = float(getenv("HMS_STATS_TTL", 10))
+
+_stats_cache = {"data": None, "expires_at": 0.0}
+_stats_lock = Lock()
 
 
 @app_views.route('/status', methods=["GET"], strict_slashes=False)
@@ -18,10 +25,15 @@ def status():
 @app_views.route('/stats', methods=['GET'], strict_slashes=False)
 def stats():
     """Retrieves the number of each objects by type"""
-    stats_data = {
-        "users": storage.count(User),
-        "doctors": storage.count(Doctor),
-        "patients": storage.count(Patient),
-        "appointments": storage.count(Appointment)
-    }
+    with _stats_lock:
+        if _stats_cache["data"] is None or time.monotonic() >= _stats_cache["expires_at"]:
+            _stats_cache["data"] = storage.stats()
+            _stats_cache["expires_at"] = time.monotonic() + STATS_TTL
+        stats_data = _stats_cache["data"]
     return jsonify(stats_data), 200
+
+
+@app_views.route('/stats/cache', methods=['GET'], strict_slashes=False)
+def cache_stats():
+    """Hit, miss and eviction counters of the availability cache"""
+    return jsonify({"availability_cache": availability_cache.stats()}), 200
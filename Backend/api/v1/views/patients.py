@@ -1,11 +1,11 @@
 #!/usr/bin/python3
 """ Endpoints for Patient """
-from models import storage
+from models import storage, codec
 from flask import jsonify, request
 from models.patient import Patient
 from api.v1.views import app_views
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from api.v1.helper_functions import role_required
+from api.v1.helper_functions import role_required, get_page_args, paginated_response, get_stream_format, stream_response
 import re
 from models.user import User
 
@@ -15,13 +15,21 @@ from models.user import User
 @role_required('admin')
 def get_all_patients():
     """Retrieves all the patients from the database"""
-    patients = storage.all(Patient).values()
-    #print([p.to_dict() for p in patients])
+    try:
+        limit, after = get_page_args()
+        stream = get_stream_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_response(storage.iterate(Patient, after), stream)
+
+    patients, next_key = storage.page(Patient, limit, after)
 
     if not patients:
-        return jsonify({"error", "not found"}), 404
+        return jsonify({"error": "not found"}), 404
     
-    return jsonify([patient.to_dict() for patient in patients]), 200
+    return paginated_response(patients, next_key), 200
 
 
 @app_views.route("/patients/<patient_id>", methods=["GET"], strict_slashes=False)
@@ -134,9 +142,14 @@ def update_patient(patient_id):
     
     keys_to_ignore = {"id", "created_at", "updated_at"}
 
-    for k, v in new_data.items():
-        if k not in keys_to_ignore:
-            setattr(patient, k, v)
+    # checked before changing the patient, kept in memory between requests
+    updates = {k: v for k, v in new_data.items() if k not in keys_to_ignore}
+    try:
+        codec.check(patient, updates)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for k, v in updates.items():
+        setattr(patient, k, v)
     patient.save()
     return jsonify(patient.to_dict()), 200
 
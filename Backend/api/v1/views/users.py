@@ -2,9 +2,9 @@
 from flask import jsonify, request
 from models.user import User
 from api.v1.views import app_views
-from models import storage
+from models import storage, codec
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from api.v1.helper_functions import is_admin, role_required
+from api.v1.helper_functions import is_admin, role_required, get_page_args, paginated_response, get_stream_format, stream_response
 
 
 
@@ -15,8 +15,17 @@ def get_users():
     """Gets all the users in the database"""
     if not is_admin():
         return jsonify({"error": "admin privileges required"}), 403
-    users = storage.all(User).values()
-    return jsonify([user.to_dict() for user in users]), 200
+    try:
+        limit, after = get_page_args()
+        stream = get_stream_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_response(storage.iterate(User, after), stream)
+
+    users, next_key = storage.page(User, limit, after)
+    return paginated_response(users, next_key), 200
 
 
 @app_views.route('/users/me', methods=['GET'], strict_slashes=False)
@@ -90,12 +99,17 @@ def update_user(user_id):
     if not data:
         return jsonify({"error": "not a valid json"}), 400
     
-    for key, value in data.items():
-        if key == "password":
-            value = user._hash_password(value)
-        if key in ["name", "email", "password", "role"]:
-            setattr(user, key, value)
-    storage.save()
+    # checked before changing the user, kept in memory between requests
+    updates = {key: value for key, value in data.items() if key in ["name", "email", "password", "role"]}
+    try:
+        codec.check(user, updates)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if "password" in updates:
+        updates["password"] = user._hash_password(updates["password"])
+    for key, value in updates.items():
+        setattr(user, key, value)
+    user.save()
     return jsonify(user.to_dict()), 200
 
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Endpoints for the waitlist"""
+from models import storage
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from api.v1.views import app_views
+from api.v1.helper_functions import role_required, get_page_args, paginated_response
+from api.v1.helper_functions import get_waitlist_fields, MAX_WAITLIST_WAIT
+from api.v1.holds import slot_holds
+from api.v1.waitlist import waitlist_matcher
+from models.doctor import Doctor
+from models.patient import Patient
+from models.user import User
+from models.waitlist_entry import WaitlistEntry
+
+
+def get_visible_entry(entry_id):
+    """
+    Returns (entry, None) when the current user may see the waitlist entry:
+    its patient, its doctor or an admin, else (None, error response)
+    """
+    entry = storage.get(WaitlistEntry, entry_id)
+    if not entry:
+        return None, (jsonify({"error": "waitlist entry not found"}), 404)
+
+    current_user_id = get_jwt_identity()
+    current_user = storage.get(User, current_user_id)
+    if not current_user:
+        return None, (jsonify({"error": "user not found"}), 404)
+    if current_user.role == 'patient':
+        patient = storage.get_by(Patient, user_id=current_user_id)
+        if not patient or entry.patient_id != patient.id:
+            return None, (jsonify({"error": "Unauthorized"}), 403)
+    elif current_user.role == 'doctor':
+        doctor = storage.get_by(Doctor, user_id=current_user_id)
+        if not doctor or entry.doctor_id != doctor.id:
+            return None, (jsonify({"error": "Unauthorized"}), 403)
+    return entry, None
+
+
+@app_views.route("/waitlist", methods=["POST"], strict_slashes=False)
+@jwt_required()
+@role_required('patient')
+def create_waitlist_entry():
+    """
+    Registers the current patient for the first opening of a doctor in a
+    date window, offered as a hold to confirm or booked when auto_book is set
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "not a json"}), 400
+
+    try:
+        fields = get_waitlist_fields(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    patient = storage.get_by(Patient, user_id=get_jwt_identity())
+    if not patient:
+        return jsonify({"error": "patient profile not found"}), 404
+    if not storage.find(Doctor, fields['doctor_id']):
+        return jsonify({"error": "doctor id is invalid"}), 400
+
+    entry = WaitlistEntry(patient_id=patient.id, status='waiting', priority=0, **fields)
+    try:
+        storage.new(entry)
+        storage.save()
+    except Exception as e:
+        print("error when saving => ", e)
+        return jsonify({"error": "Something went wrong while saving"}), 500
+    return jsonify(entry.to_dict()), 201
+
+
+@app_views.route("/waitlist", methods=["GET"], strict_slashes=False)
+@jwt_required()
+def get_waitlist_entries():
+    """
+    Lists waitlist entries, one page at a time. Patients see their own,
+    doctors theirs; 'doctor_id' and 'status' filter the list
+    """
+    try:
+        limit, after = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filters = {key: request.args[key] for key in ('doctor_id', 'status') if request.args.get(key)}
+    current_user_id = get_jwt_identity()
+    current_user = storage.get(User, current_user_id)
+    if not current_user:
+        return jsonify({"error": "user not found"}), 404
+    if current_user.role == 'patient':
+        patient = storage.get_by(Patient, user_id=current_user_id)
+        if not patient:
+            return jsonify({"error": "patient profile not found"}), 404
+        filters['patient_id'] = patient.id
+    elif current_user.role == 'doctor':
+        doctor = storage.get_by(Doctor, user_id=current_user_id)
+        if not doctor:
+            return jsonify({"error": "doctor profile not found"}), 404
+        filters['doctor_id'] = doctor.id
+
+    entries, next_key = storage.page(WaitlistEntry, limit, after, **filters)
+    return paginated_response(entries, next_key), 200
+
+
+@app_views.route("/waitlist/<string:entry_id>", methods=["GET"], strict_slashes=False)
+@jwt_required()
+def get_waitlist_entry(entry_id):
+    """
+    Retrieves a waitlist entry. With 'wait' (seconds, at most 30) a waiting
+    entry is returned once the matcher offers or books an opening, or when
+    the time is up, so clients don't poll the available slots
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_WAITLIST_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    version = waitlist_matcher.version(entry_id)
+    entry, error = get_visible_entry(entry_id)
+    if error:
+        return error
+
+    if wait > 0 and entry.status == 'waiting':
+        if waitlist_matcher.wait(entry_id, version, wait) != version:
+            # read the entry again, as committed by the matcher
+            storage.rollback()
+            entry = storage.get(WaitlistEntry, entry_id)
+    return jsonify(entry.to_dict()), 200
+
+
+@app_views.route("/waitlist/<string:entry_id>", methods=["PUT"], strict_slashes=False)
+@jwt_required()
+@role_required('admin')
+def update_waitlist_entry(entry_id):
+    """Changes the priority of a waitlist entry, higher entries are served first"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "not a json"}), 400
+    try:
+        priority = int(data['priority'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "an integer priority required"}), 400
+
+    entry = storage.get(WaitlistEntry, entry_id)
+    if not entry:
+        return jsonify({"error": "waitlist entry not found"}), 404
+    entry.priority = priority
+    entry.save()
+    return jsonify(entry.to_dict()), 200
+
+
+@app_views.route("/waitlist/<string:entry_id>", methods=["DELETE"], strict_slashes=False)
+@jwt_required()
+@role_required('admin', 'patient')
+def cancel_waitlist_entry(entry_id):
+    """Leaves the waitlist, releasing an opening offered to the entry"""
+    entry, error = get_visible_entry(entry_id)
+    if error:
+        return error
+    if entry.status not in ('waiting', 'offered'):
+        return jsonify({"error": f"Cannot cancel {entry.status} waitlist entry"}), 400
+
+    hold = slot_holds.release(entry.hold_id) if entry.status == 'offered' else None
+    entry.status = 'cancelled'
+    entry.save()
+    if hold is not None:
+        waitlist_matcher.slot_freed(hold.doctor_id, hold.scheduled_time, hold.end_time)
+    waitlist_matcher.notify(entry.id)
+    return jsonify({"message": "Waitlist entry cancelled"}), 200
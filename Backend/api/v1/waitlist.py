@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+"""
+Waitlist matcher: when a booked or held time range is freed, a background
+thread offers it to the best waiting patient, as a hold to confirm or as a
+booking for entries with auto_book, and wakes up the requests waiting for
+changes of that patient's entries
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import islice
+from os import getenv
+from threading import Condition, Lock, Thread
+import queue
+import models
+from api.v1.booking import book_appointment, place_hold, run_locked
+from api.v1.helper_functions import MIN_BOOKING_NOTICE
+from api.v1.holds import slot_holds
+from models import storage
+from models.appointment import Appointment
+from models.waitlist_entry import WaitlistEntry
+
+
+# Seconds a waitlisted patient has to confirm an offered hold
+OFFER_TTL = int(getenv("HMS_WAITLIST_OFFER_TTL", 600))
+# Waiting entries read per freed range, best first
+MATCH_CANDIDATES = 20
+# Seconds between checks for offers that ran out
+OFFER_CHECK_INTERVAL = 5
+# Entries whose change count is kept for waiting requests, the least
+# recently changed without a waiting request are dropped first
+MAX_TRACKED_ENTRIES = 10000
+# Bookings and offers must start at least this far in the future, like POST /appointments
+MIN_NOTICE = timedelta(minutes=MIN_BOOKING_NOTICE)
+
+
+class WaitlistMatcher:
+    """
+    Queue of freed (doctor_id, start_time, end_time) ranges served by one
+    daemon thread, started on the first freed range, plus a version number
+    per recently changed entry that requests can wait on
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = Lock()
+        self._versions = OrderedDict()
+        # entry id -> number of requests waiting for it
+        self._waiters = {}
+        self._changed = Condition()
+
+    def slot_freed(self, doctor_id, start_time, end_time):
+        """Queues a freed time range of a doctor to be offered"""
+        self._queue.put((doctor_id, start_time, end_time))
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="waitlist-matcher", daemon=True)
+                self._thread.start()
+
+    def version(self, entry_id):
+        """Number of changes made by the matcher to an entry"""
+        with self._changed:
+            return self._versions.get(entry_id, 0)
+
+    def wait(self, entry_id, version, timeout):
+        """
+        Blocks until the matcher changes an entry past version or timeout
+        seconds pass, returns the current version
+        """
+        with self._changed:
+            self._waiters[entry_id] = self._waiters.get(entry_id, 0) + 1
+            try:
+                self._changed.wait_for(lambda: self._versions.get(entry_id, 0) != version, timeout)
+            finally:
+                self._waiters[entry_id] -= 1
+                if not self._waiters[entry_id]:
+                    del self._waiters[entry_id]
+            return self._versions.get(entry_id, 0)
+
+    def notify(self, entry_id):
+        """
+        Wakes up the requests waiting for changes of an entry. Past
+        MAX_TRACKED_ENTRIES the least recently changed entry nobody waits
+        for is forgotten, its version starting over from 0.
+        """
+        with self._changed:
+            self._versions[entry_id] = self._versions.pop(entry_id, 0) + 1
+            self._changed.notify_all()
+            if len(self._versions) > MAX_TRACKED_ENTRIES:
+                for old_id in list(islice(self._versions, len(self._waiters) + 1)):
+                    if old_id not in self._waiters:
+                        del self._versions[old_id]
+                        break
+
+    def _run(self):
+        """Matcher thread: serves freed ranges and checks offers until the process exits"""
+        while True:
+            try:
+                freed = self._queue.get(timeout=OFFER_CHECK_INTERVAL)
+            except queue.Empty:
+                freed = None
+            try:
+                if freed is not None:
+                    self.match(*freed)
+                self.check_offers()
+            except Exception as e:
+                print("waitlist matcher error => ", e)
+                storage.rollback()
+            finally:
+                storage.close()
+
+    @staticmethod
+    def _candidates(doctor_id, day):
+        """
+        Waiting entries of a doctor whose window includes day, by priority
+        then age: read through the (doctor_id, status, priority DESC,
+        created_at) index in the database, sorted in process in file storage
+        which has no query session
+        """
+        if models.storage_type != "db":
+            entries = storage.iterate(WaitlistEntry, doctor_id=doctor_id, status='waiting',
+                                      start_date__lte=day, end_date__gte=day)
+            # stable sort of entries iterated oldest first
+            return sorted(entries, key=lambda entry: -entry.priority)[:MATCH_CANDIDATES]
+        return storage.get_session().query(WaitlistEntry).filter(
+            WaitlistEntry.doctor_id == doctor_id,
+            WaitlistEntry.status == 'waiting',
+            WaitlistEntry.start_date <= day,
+            WaitlistEntry.end_date >= day
+        ).order_by(WaitlistEntry.priority.desc(), WaitlistEntry.created_at).limit(MATCH_CANDIDATES).all()
+
+    @staticmethod
+    def fit(entry, start_time, end_time):
+        """Earliest start within the freed range and the entry's times of day, or None"""
+        day = start_time.date()
+        start = max(start_time, datetime.now() + MIN_NOTICE)
+        last_end = end_time
+        if entry.earliest_time is not None:
+            start = max(start, datetime.combine(day, entry.earliest_time))
+        if entry.latest_time is not None:
+            last_end = min(last_end, datetime.combine(day, entry.latest_time))
+        # whole minutes, like the times clients book
+        start = start.replace(second=0, microsecond=0) + \
+            (timedelta(minutes=1) if start.second or start.microsecond else timedelta())
+        if start.date() != day or start + timedelta(minutes=entry.duration) > last_end:
+            return None
+        return start
+
+    def match(self, doctor_id, start_time, end_time):
+        """
+        Offers a freed range to the best waiting entry it fits, returns the
+        entry served or None. The first entry the range fits gets it unless
+        its patient can't take another hold; a refused booking or hold
+        means the range was taken again and ends the matching.
+        """
+        for entry in self._candidates(doctor_id, start_time.date()):
+            start = self.fit(entry, start_time, end_time)
+            if start is None:
+                continue
+            entry_id, patient_id, duration = entry.id, entry.patient_id, entry.duration
+            if entry.auto_book:
+                result, appointment = book_appointment(patient_id, doctor_id, start, duration)
+                if appointment is None:
+                    return None
+                entry = storage.get(WaitlistEntry, entry_id)
+                entry.status = 'booked'
+                entry.appointment_id = appointment.id
+            else:
+                try:
+                    result, hold = place_hold(patient_id, doctor_id, start, duration, OFFER_TTL)
+                except ValueError:
+                    continue
+                if hold is None:
+                    return None
+                entry = storage.get(WaitlistEntry, entry_id)
+                entry.status = 'offered'
+                entry.hold_id = hold.id
+                entry.offered_time = start
+                entry.offered_until = hold.expires_at
+            entry.save()
+            self.notify(entry_id)
+            return entry
+        return None
+
+    def check_offers(self):
+        """
+        Settles the offers whose hold ran out, read from storage so the
+        offers made by other processes are settled too. Each one is settled
+        under the booking lock of its day, so two processes can't both
+        settle it and offer its range twice.
+        """
+        expired = [(entry.id, entry.doctor_id, entry.offered_time.date())
+                   for entry in storage.iterate(WaitlistEntry, status='offered',
+                                                offered_until__lt=datetime.now())
+                   if entry.offered_time is not None]
+        for entry_id, doctor_id, day in expired:
+            run_locked(doctor_id, {day}, lambda: self._settle(entry_id))
+
+    def _settle(self, entry_id):
+        """
+        Marks an offer that ran out booked when its patient booked the
+        offered range, from any process, or expired and offers the range to
+        the next entry
+        """
+        entry = storage.get(WaitlistEntry, entry_id)
+        if entry is None or entry.status != 'offered' or slot_holds.get(entry.hold_id) is not None:
+            storage.rollback()
+            return
+        appointment = storage.get_by(Appointment, patient_id=entry.patient_id,
+                                     doctor_id=entry.doctor_id,
+                                     scheduled_time=entry.offered_time, status='scheduled')
+        if appointment is not None:
+            entry.status = 'booked'
+            entry.appointment_id = appointment.id
+        else:
+            entry.status = 'expired'
+        freed = (entry.doctor_id, entry.offered_time,
+                 entry.offered_time + timedelta(minutes=entry.duration))
+        entry.save()
+        if appointment is None:
+            self._queue.put(freed)
+        self.notify(entry_id)
+
+    def hold_confirmed(self, hold, appointment):
+        """
+        Marks the entry offered a confirmed hold booked, if there is one. The
+        appointment is already booked, so a failure is only printed and left
+        to check_offers, which finds the appointment once the offer runs out
+        """
+        try:
+            entry = storage.get_by(WaitlistEntry, patient_id=hold.patient_id,
+                                   hold_id=hold.id, status='offered')
+            if entry is None:
+                return
+            entry.status = 'booked'
+            entry.appointment_id = appointment.id
+            entry.save()
+        except Exception as e:
+            print("waitlist matcher error => ", e)
+            storage.rollback()
+            return
+        self.notify(entry.id)
+
+
+waitlist_matcher = WaitlistMatcher()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+"""
+Concurrency benchmark for the booking path (POST /appointments)
+
+Many clients book random slots of the same doctor on the same day through
+api.v1.booking.book_appointment. For each number of clients it reports the
+throughput, latency percentiles and outcome counts, then checks that no
+two scheduled appointments of that day overlap.
+
+Run it against MySQL: SQLite ignores SELECT ... FOR UPDATE, so the
+database lock isn't exercised there and the throughput isn't meaningful.
+
+Usage (from the Backend directory, against the configured database):
+    HMS_TYPE_STORAGE=db HMS_DB_URL=<database url> \\
+        python3 -m benchmarks.booking_concurrency --clients 1 50 200 --attempts 20
+"""
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, time as dtime
+from threading import Barrier
+
+import models
+from models import storage
+from models.appointment import Appointment
+from models.availability import Availability
+from models.doctor import Doctor
+from models.patient import Patient
+from models.user import User
+from api.v1.booking import book_appointment
+
+
+def setup(clients):
+    """Creates a doctor available 08:00-18:00 every Monday and one patient per client"""
+    run = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    doctor_user = User(name="Bench Doctor", email=f"bench-doctor-{run}@example.com",
+                       password="", role="doctor")
+    doctor = Doctor(first_name="Bench", last_name=run, email=f"bench-doctor-{run}@example.com",
+                    specialization="benchmark", user_id=doctor_user.id)
+    storage.new(doctor_user)
+    storage.new(doctor)
+    storage.new(Availability(doctor_id=doctor.id, day_of_week="Monday",
+                             start_time=dtime(8, 0), end_time=dtime(18, 0)))
+    patients = []
+    for i in range(clients):
+        user = User(name=f"Bench Patient {i}", email=f"bench-patient-{run}-{i}@example.com",
+                    password="", role="patient")
+        patient = Patient(first_name="Bench", last_name=str(i), phone_number="0",
+                          email=user.email, insurance_number=f"bench-{run}-{i}", user_id=user.id)
+        storage.new(user)
+        storage.new(patient)
+        patients.append(patient.id)
+    storage.save()
+    return doctor.id, patients
+
+
+def client(doctor_id, patient_id, day, attempts, barrier):
+    """Books random 15/30 minute slots, returns (latencies, outcome codes)"""
+    latencies = []
+    codes = []
+    barrier.wait()
+    try:
+        for _ in range(attempts):
+            start = datetime.combine(day, dtime(8, 0)) + timedelta(minutes=15 * random.randrange(40))
+            duration = random.choice((15, 30))
+            began = time.perf_counter()
+            result, _ = book_appointment(patient_id, doctor_id, start, duration)
+            latencies.append(time.perf_counter() - began)
+            codes.append(result.code)
+    finally:
+        storage.close()
+    return latencies, codes
+
+
+def overlaps(doctor_id, day):
+    """Number of overlapping scheduled appointments of the doctor on day"""
+    start = datetime.combine(day, dtime.min)
+    booked, _ = storage.page(Appointment, 10000, None, doctor_id=doctor_id, status='scheduled',
+                             scheduled_time__gte=start,
+                             scheduled_time__lt=start + timedelta(days=1))
+    booked.sort(key=lambda appointment: appointment.scheduled_time)
+    return sum(1 for previous, current in zip(booked, booked[1:])
+               if current.scheduled_time < previous.end_time)
+
+
+def run(clients, attempts, doctor_id, patients, day):
+    """Runs one benchmark round and prints its results"""
+    barrier = Barrier(clients + 1)
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(client, doctor_id, patients[i], day, attempts, barrier)
+                   for i in range(clients)]
+        barrier.wait()
+        began = time.perf_counter()
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - began
+
+    latencies = sorted(latency for lats, _ in results for latency in lats)
+    codes = [code for _, cods in results for code in cods]
+    counts = {code: codes.count(code) for code in sorted(set(codes))}
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"clients={clients:4d} requests={len(codes):6d} "
+          f"throughput={len(codes) / elapsed:8.1f} req/s "
+          f"p50={statistics.median(latencies) * 1000:7.1f}ms p99={p99 * 1000:7.1f}ms "
+          f"outcomes={counts} overlaps={overlaps(doctor_id, day)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100, 300])
+    parser.add_argument("--attempts", type=int, default=10, help="bookings tried per client")
+    args = parser.parse_args()
+
+    if models.storage_type == "db":
+        storage.get_engine().echo = False
+    doctor_id, patients = setup(max(args.clients))
+
+    # a fresh Monday per round so every round starts with an empty day
+    day = datetime.utcnow().date() + timedelta(days=7)
+    day += timedelta(days=-day.weekday())
+    for i, clients in enumerate(args.clients):
+        run(clients, args.attempts, doctor_id, patients, day + timedelta(weeks=i))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+"""
+Serialization benchmark for the file storage
+
+Builds a file of users, patients, availabilities and exceptions, then times
+writing and reading it back with the stdlib json module and the models'
+to_dict()/__init__, as FileStorage used to, and with models.codec. It also
+times FileStorage.save() and reload() on the same objects.
+
+Usage (from the Backend directory):
+    python3 -m benchmarks.file_storage_codec --objects 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+from models import codec
+from models.availability import Availability
+from models.engine.file_storage import FileStorage, classes
+from models.exception import Exception as DoctorException
+from models.patient import Patient
+from models.user import User
+
+
+def make_objects(count):
+    """Returns a dictionary of key -> object, a mix of four models"""
+    objs = {}
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            obj = User(name=f"User {i}", email=f"user{i}@example.com", password="x" * 60, role="patient")
+        elif kind == 1:
+            obj = Patient(first_name="Bench", last_name=str(i), phone_number="0", email=f"p{i}@example.com",
+                          insurance_number=f"ins-{i}", insurance_provider="bench", user_id=f"user-{i}")
+        elif kind == 2:
+            obj = Availability(doctor_id=f"doctor-{i % 1000}", day_of_week="Monday",
+                               start_time=dtime(8, 0), end_time=dtime(17, 0))
+        else:
+            obj = DoctorException(doctor_id=f"doctor-{i % 1000}",
+                                  date=date(2030, 1, 1) + timedelta(days=i % 365), is_available=False)
+        objs[f"{obj.__class__.__name__}.{obj.id}"] = obj
+    return objs
+
+
+def timed(label, func, *args):
+    """Runs func, prints its duration and returns its result"""
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<32} {time.perf_counter() - start:8.2f}s")
+    return result
+
+
+def json_save(objs, path):
+    with open(path, 'w') as file:
+        json.dump({k: v.to_dict() for k, v in objs.items()}, file)
+
+
+def json_load(path):
+    with open(path, 'r') as file:
+        data = json.load(file)
+    return {k: classes[v["__class__"]](**v) for k, v in data.items()}
+
+
+def codec_save(objs, path):
+    with open(path, 'wb') as file:
+        file.write(codec.encode(objs))
+
+
+def codec_load(path):
+    with open(path, 'rb') as file:
+        return codec.decode(file.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--objects", type=int, default=1000000)
+    args = parser.parse_args()
+
+    objs = make_objects(args.objects)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "file.json")
+        print(f"{args.objects} objects")
+        timed("json save", json_save, objs, path)
+        print(f"{'file size':<32} {os.path.getsize(path) / 2 ** 20:8.1f}MB")
+        loaded = timed("json reload", json_load, path)
+        del loaded
+        timed("codec save", codec_save, objs, path)
+        print(f"{'file size':<32} {os.path.getsize(path) / 2 ** 20:8.1f}MB")
+        loaded = timed("codec reload", codec_load, path)
+        assert len(loaded) == len(objs)
+        del loaded
+
+        storage = FileStorage()
+        storage._FileStorage__file_path = path
+        for obj in objs.values():
+            storage.new(obj)
+        timed("FileStorage.save()", storage.save)
+        timed("FileStorage.reload()", storage.reload)
+
+
+if __name__ == "__main__":
+    main()
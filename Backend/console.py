@@ -14,6 +14,7 @@ from models.exception import Exception
 from models.patient import Patient
 from models.medical_record import MedicalRecord
 from models.user import User
+from models.waitlist_entry import WaitlistEntry
 
 classes = {
     "BaseModel": BaseModel,
@@ -23,7 +24,8 @@ classes = {
     "Patient": Patient,
     "Exception": Exception,
     "MedicalRecord": MedicalRecord,
-    "User": User
+    "User": User,
+    "WaitlistEntry": WaitlistEntry
 }
 
 class HMSCommand(cmd.Cmd):
@@ -136,9 +138,9 @@ class HMSCommand(cmd.Cmd):
             print("** class name missing **")
         elif args[0] in classes:
             if len(args) > 1:
-                key = args[0] + "." + args[1]
-                if key in models.storage.all():
-                    models.storage.all().pop(key)
+                obj = models.storage.get(classes[args[0]], args[1])
+                if obj is not None:
+                    models.storage.delete(obj)
                     models.storage.save()
                 else:
                     print("** no instance found **")
@@ -192,7 +194,7 @@ class HMSCommand(cmd.Cmd):
 
     def do_count(self, class_name):
         """Retrieve the number of instances of a class"""
-        count = sum(1 for key in models.storage.all() if key.startswith(class_name))
+        count = models.storage.count(classes[class_name]) if class_name in classes else 0
         print(count)     
 
 if __name__ == "__main__":
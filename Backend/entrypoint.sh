@@ -11,6 +11,9 @@ done
 
 echo "✅ MySQL is up!"
 
+# Apply database migrations (indexes, new columns) to existing databases
+flask db upgrade
+
 # Start the Flask application
 # exec gunicorn --bind 0.0.0.0:5000 --workers 4 api.v1.app:app
 
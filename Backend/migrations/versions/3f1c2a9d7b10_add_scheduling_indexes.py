@@ -0,0 +1,49 @@
+"""add scheduling indexes
+
+Revision ID: 3f1c2a9d7b10
+Revises:
+Create Date: 2026-10-17 09:12:44.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_appointments_doctor_status_time', 'appointments', ['doctor_id', 'status', 'scheduled_time']),
+    ('ix_appointments_patient_time', 'appointments', ['patient_id', 'scheduled_time']),
+    ('ix_availability_doctor_day', 'availability', ['doctor_id', 'day_of_week']),
+    ('ix_exceptions_doctor_date', 'exceptions', ['doctor_id', 'date']),
+    ('ix_patients_user_id', 'patients', ['user_id']),
+    ('ix_doctors_user_id', 'doctors', ['user_id']),
+    ('ix_medical_records_patient_id', 'medical_records', ['patient_id']),
+    ('ix_medical_records_appointment_id', 'medical_records', ['appointment_id']),
+] + [
+    (f'ix_{table}_created_at', table, ['created_at'])
+    for table in ('users', 'doctors', 'patients', 'appointments',
+                  'availability', 'exceptions', 'medical_records')
+]
+
+
+def existing_indexes(table):
+    """Names of the indexes already on a table (create_all builds them on new databases)"""
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,69 @@
+"""add appointment end_time
+
+Revision ID: 8b2e5d7c4a91
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-17 11:40:02.771953
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import timedelta
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e5d7c4a91'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+appointments = sa.table(
+    'appointments',
+    sa.column('id', sa.String),
+    sa.column('scheduled_time', sa.DateTime),
+    sa.column('duration', sa.Integer),
+    sa.column('end_time', sa.DateTime),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if 'end_time' not in {column['name'] for column in inspector.get_columns('appointments')}:
+        op.add_column('appointments', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # Backfill in batches, computed in Python so it runs the same on every database
+    select_missing = (
+        sa.select(appointments.c.id, appointments.c.scheduled_time, appointments.c.duration)
+        .where(appointments.c.end_time.is_(None))
+        .limit(BATCH_SIZE)
+    )
+    set_end_time = (
+        appointments.update()
+        .where(appointments.c.id == sa.bindparam('appointment_id'))
+        .values(end_time=sa.bindparam('new_end_time'))
+    )
+    while True:
+        rows = bind.execute(select_missing).fetchall()
+        if not rows:
+            break
+        bind.execute(set_end_time, [
+            {'appointment_id': id, 'new_end_time': scheduled_time + timedelta(minutes=duration)}
+            for id, scheduled_time, duration in rows
+        ])
+
+    with op.batch_alter_table('appointments') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if 'ix_appointments_doctor_status_end' not in {index['name'] for index in inspector.get_indexes('appointments')}:
+        op.create_index('ix_appointments_doctor_status_end', 'appointments',
+                        ['doctor_id', 'status', 'end_time'])
+
+
+def downgrade():
+    op.drop_index('ix_appointments_doctor_status_end', table_name='appointments')
+    with op.batch_alter_table('appointments') as batch_op:
+        batch_op.drop_column('end_time')
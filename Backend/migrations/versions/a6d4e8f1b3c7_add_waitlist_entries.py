@@ -0,0 +1,55 @@
+"""add waitlist entries
+
+Revision ID: a6d4e8f1b3c7
+Revises: f2b8c6d1e9a5
+Create Date: 2026-10-17 19:58:23.614092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d4e8f1b3c7'
+down_revision = 'f2b8c6d1e9a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'waitlist_entries' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'waitlist_entries',
+        sa.Column('id', sa.String(length=60), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('patient_id', sa.String(length=60), nullable=False),
+        sa.Column('doctor_id', sa.String(length=60), nullable=False),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('end_date', sa.Date(), nullable=False),
+        sa.Column('earliest_time', sa.Time(), nullable=True),
+        sa.Column('latest_time', sa.Time(), nullable=True),
+        sa.Column('duration', sa.Integer(), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('auto_book', sa.Boolean(), nullable=False),
+        sa.Column('status', sa.Enum('waiting', 'offered', 'booked', 'cancelled', 'expired',
+                                    name='waitlist_status'), nullable=False),
+        sa.Column('hold_id', sa.String(length=60), nullable=True),
+        sa.Column('offered_time', sa.DateTime(), nullable=True),
+        sa.Column('offered_until', sa.DateTime(), nullable=True),
+        sa.Column('appointment_id', sa.String(length=60), nullable=True),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id']),
+        sa.ForeignKeyConstraint(['patient_id'], ['patients.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_waitlist_entries_created_at', 'waitlist_entries', ['created_at'])
+    op.create_index('ix_waitlist_doctor_status_priority', 'waitlist_entries',
+                    ['doctor_id', 'status', sa.text('priority DESC'), 'created_at'])
+    op.create_index('ix_waitlist_status_offered_until', 'waitlist_entries',
+                    ['status', 'offered_until'])
+    op.create_index('ix_waitlist_patient', 'waitlist_entries', ['patient_id'])
+
+
+def downgrade():
+    op.drop_table('waitlist_entries')
@@ -0,0 +1,31 @@
+"""add booking locks
+
+Revision ID: c4d9e1f2a7b3
+Revises: 8b2e5d7c4a91
+Create Date: 2026-10-17 14:05:37.120584
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d9e1f2a7b3'
+down_revision = '8b2e5d7c4a91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'booking_locks' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'booking_locks',
+        sa.Column('doctor_id', sa.String(length=60), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('doctor_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('booking_locks')
@@ -0,0 +1,32 @@
+"""add appointment series_id
+
+Revision ID: e7a3b5c9d2f4
+Revises: c4d9e1f2a7b3
+Create Date: 2026-10-17 16:20:48.305117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3b5c9d2f4'
+down_revision = 'c4d9e1f2a7b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'series_id' not in {column['name'] for column in inspector.get_columns('appointments')}:
+        op.add_column('appointments', sa.Column('series_id', sa.String(length=60), nullable=True))
+
+    if 'ix_appointments_series' not in {index['name'] for index in inspector.get_indexes('appointments')}:
+        op.create_index('ix_appointments_series', 'appointments', ['series_id'])
+
+
+def downgrade():
+    op.drop_index('ix_appointments_series', table_name='appointments')
+    with op.batch_alter_table('appointments') as batch_op:
+        batch_op.drop_column('series_id')
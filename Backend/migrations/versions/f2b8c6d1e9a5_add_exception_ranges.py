@@ -0,0 +1,59 @@
+"""add exception date and time ranges
+
+Revision ID: f2b8c6d1e9a5
+Revises: e7a3b5c9d2f4
+Create Date: 2026-10-17 17:42:11.508236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8c6d1e9a5'
+down_revision = 'e7a3b5c9d2f4'
+branch_labels = None
+depends_on = None
+
+
+exceptions = sa.table(
+    'exceptions',
+    sa.column('date', sa.Date),
+    sa.column('start_date', sa.Date),
+    sa.column('end_date', sa.Date),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column['name'] for column in inspector.get_columns('exceptions')}
+
+    for name, column_type in (('start_date', sa.Date()), ('end_date', sa.Date()),
+                              ('start_time', sa.Time()), ('end_time', sa.Time())):
+        if name not in columns:
+            op.add_column('exceptions', sa.Column(name, column_type, nullable=True))
+
+    # Every existing exception covers its one date, the whole day
+    bind.execute(
+        exceptions.update()
+        .where(exceptions.c.start_date.is_(None))
+        .values(start_date=exceptions.c.date, end_date=exceptions.c.date)
+    )
+
+    with op.batch_alter_table('exceptions') as batch_op:
+        batch_op.alter_column('start_date', existing_type=sa.Date(), nullable=False)
+        batch_op.alter_column('end_date', existing_type=sa.Date(), nullable=False)
+
+    if 'ix_exceptions_doctor_range' not in {index['name'] for index in inspector.get_indexes('exceptions')}:
+        op.create_index('ix_exceptions_doctor_range', 'exceptions',
+                        ['doctor_id', 'start_date', 'end_date'])
+
+
+def downgrade():
+    op.drop_index('ix_exceptions_doctor_range', table_name='exceptions')
+    with op.batch_alter_table('exceptions') as batch_op:
+        batch_op.drop_column('end_time')
+        batch_op.drop_column('start_time')
+        batch_op.drop_column('end_date')
+        batch_op.drop_column('start_date')
@@ -2,30 +2,63 @@
 """Defines the Appointment class"""
 import models
 from models.base_model import Base, BaseModel
-from sqlalchemy import Column, String, ForeignKey, DateTime, Time, Enum, Integer
-from sqlalchemy.orm import relationship
+from datetime import datetime, timedelta
+from sqlalchemy import Column, String, ForeignKey, DateTime, Time, Enum, Integer, Index
+from sqlalchemy.orm import relationship, validates
+
+
+def appointment_end(scheduled_time, duration):
+    """Returns scheduled_time + duration minutes or None if either is missing"""
+    if not scheduled_time or duration in (None, ""):
+        return None
+    if isinstance(scheduled_time, str):
+        scheduled_time = datetime.fromisoformat(scheduled_time)
+    return scheduled_time + timedelta(minutes=int(duration))
 
 
 class Appointment(BaseModel, Base):
     """Blueprint for Appointment model"""
     if models.storage_type == "db":
         __tablename__ = 'appointments'
+        __table_args__ = (
+            # conflict checks and slot lookups: one doctor, one status, a time range
+            Index('ix_appointments_doctor_status_time', 'doctor_id', 'status', 'scheduled_time'),
+            Index('ix_appointments_doctor_status_end', 'doctor_id', 'status', 'end_time'),
+            Index('ix_appointments_patient_time', 'patient_id', 'scheduled_time'),
+            Index('ix_appointments_series', 'series_id'),
+        )
         patient_id = Column(String(60), ForeignKey('patients.id'), nullable=False)
         doctor_id = Column(String(60), ForeignKey('doctors.id'), nullable=False)
         scheduled_time = Column(DateTime, nullable=False)
         duration = Column(Integer, nullable=False)
+        # scheduled_time + duration, kept in sync so overlap checks are plain range predicates
+        end_time = Column(DateTime, nullable=False)
         status = Column(Enum('scheduled', 'cancelled', 'completed', name='appointment_status'), default='scheduled', nullable=False)
+        # shared by the occurrences of a recurring series, None for single bookings
+        series_id = Column(String(60), nullable=True)
 
         patient = relationship("Patient", back_populates='appointments')
         doctor = relationship("Doctor", back_populates='appointments')
 
+        @validates('scheduled_time', 'duration')
+        def _sync_end_time(self, key, value):
+            """Recomputes end_time whenever scheduled_time or duration change"""
+            scheduled_time = value if key == 'scheduled_time' else self.scheduled_time
+            duration = value if key == 'duration' else self.duration
+            self.end_time = appointment_end(scheduled_time, duration)
+            return value
+
     else:
         patient_id = ""
         doctor_id = ""
         scheduled_time = ""
         duration = ""
+        end_time = ""
         status = ""
+        series_id = None
 
     def __init__(self, *args, **kwargs):
         """Initializes the Appointment instance"""
         super().__init__(*args, **kwargs)
+        if models.storage_type != "db" and not self.end_time:
+            self.end_time = appointment_end(self.scheduled_time, self.duration)
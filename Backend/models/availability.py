@@ -2,7 +2,7 @@
 """Defines the Availability Model"""
 import models
 from models.base_model import Base, BaseModel
-from sqlalchemy import Column, String, Time, ForeignKey
+from sqlalchemy import Column, String, Time, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -14,6 +14,9 @@ class Availability(BaseModel, Base):
     """Defnes Availability Blueprint"""
     if models.storage_type == "db":
         __tablename__ = "availability"
+        __table_args__ = (
+            Index('ix_availability_doctor_day', 'doctor_id', 'day_of_week'),
+        )
         doctor_id = Column(String(60), ForeignKey('doctors.id'), nullable=False)
         day_of_week = Column(String(70), nullable=False)
         start_time = Column(Time, nullable=False)
@@ -18,7 +18,7 @@ class BaseModel:
     """The BaseModel class from which all the other models will be derived"""
     if models.storage_type == "db":
         id = Column(String(60), primary_key=True)
-        created_at = Column(DateTime, default=datetime.utcnow)
+        created_at = Column(DateTime, default=datetime.utcnow, index=True)
         updated_at = Column(DateTime, default=datetime.utcnow)
 
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+"""Defines the BookingLock model"""
+import models
+from models.base_model import Base
+from sqlalchemy import Column, String, Date
+
+
+class BookingLock(Base):
+    """
+    One row per doctor and day, locked (SELECT ... FOR UPDATE) while a
+    booking for that doctor and day is validated and inserted
+    """
+    if models.storage_type == "db":
+        __tablename__ = 'booking_locks'
+        # no foreign key: unknown doctors are reported by the booking check
+        doctor_id = Column(String(60), primary_key=True)
+        day = Column(Date, primary_key=True)
+
+    else:
+        doctor_id = ""
+        day = ""
+
+    def __init__(self, doctor_id, day):
+        """Initializes the lock row"""
+        self.doctor_id = doctor_id
+        self.day = day
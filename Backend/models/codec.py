@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+"""
+msgspec codec for the models: one typed Struct per model, tagged with the
+model's class name in '__class__' like to_dict(). FileStorage reads and
+writes its file and journal through it, and the API encodes lists of
+objects with it, without building a dictionary per object.
+"""
+from datetime import date, datetime, time
+from typing import Optional, Union
+import msgspec
+from models.base_model import BaseModel
+from models.appointment import Appointment
+from models.availability import Availability
+from models.doctor import Doctor
+from models.exception import Exception as DoctorException
+from models.medical_record import MedicalRecord
+from models.patient import Patient
+from models.user import User
+from models.waitlist_entry import WaitlistEntry
+
+
+class BaseModelStruct(msgspec.Struct, tag_field="__class__", tag="BaseModel", kw_only=True):
+    """Fields of every model"""
+    id: str
+    created_at: datetime
+    updated_at: datetime
+
+
+class AppointmentStruct(BaseModelStruct, tag="Appointment", kw_only=True):
+    patient_id: str = ""
+    doctor_id: str = ""
+    scheduled_time: datetime
+    duration: int
+    end_time: Optional[datetime] = None
+    status: str = "scheduled"
+    series_id: Optional[str] = None
+
+
+class AvailabilityStruct(BaseModelStruct, tag="Availability", kw_only=True):
+    doctor_id: str = ""
+    day_of_week: str = ""
+    start_time: time
+    end_time: time
+
+
+class DoctorStruct(BaseModelStruct, tag="Doctor", kw_only=True):
+    first_name: str = ""
+    last_name: str = ""
+    email: str = ""
+    specialization: str = ""
+    user_id: str = ""
+
+
+class ExceptionStruct(BaseModelStruct, tag="Exception", kw_only=True):
+    doctor_id: str = ""
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+    is_available: bool = True
+    # start_date as an ISO string, the only date of files written before
+    # date ranges, where it may also be an ISO datetime. Declared last as
+    # it hides the date type in the class body.
+    date: Optional[str] = None
+
+    def __post_init__(self):
+        """Fills the date range of single day exceptions from date"""
+        if self.start_date is None:
+            if not self.date:
+                raise ValueError("Object missing required field `start_date`")
+            self.start_date = date.fromisoformat(self.date[:10])
+        if self.end_date is None:
+            self.end_date = self.start_date
+        self.date = self.start_date.isoformat()
+
+
+class MedicalRecordStruct(BaseModelStruct, tag="MedicalRecord", kw_only=True):
+    appointment_id: str = ""
+    patient_id: str = ""
+    doctor_id: str = ""
+    notes: Optional[str] = ""
+    prescriptions: Optional[str] = ""
+
+
+class PatientStruct(BaseModelStruct, tag="Patient", kw_only=True):
+    first_name: str = ""
+    last_name: str = ""
+    phone_number: str = ""
+    email: str = ""
+    insurance_number: str = ""
+    insurance_provider: Optional[str] = ""
+    user_id: str = ""
+
+
+class UserStruct(BaseModelStruct, tag="User", kw_only=True):
+    name: str = ""
+    email: str = ""
+    password: str = ""
+    role: str = ""
+
+
+class WaitlistEntryStruct(BaseModelStruct, tag="WaitlistEntry", kw_only=True):
+    patient_id: str = ""
+    doctor_id: str = ""
+    start_date: date
+    end_date: date
+    earliest_time: Optional[time] = None
+    latest_time: Optional[time] = None
+    duration: int
+    priority: int = 0
+    auto_book: bool = False
+    status: str = "waiting"
+    hold_id: Optional[str] = None
+    offered_time: Optional[datetime] = None
+    offered_until: Optional[datetime] = None
+    appointment_id: Optional[str] = None
+
+
+# model class -> Struct
+structs = {
+    BaseModel: BaseModelStruct,
+    Appointment: AppointmentStruct,
+    Availability: AvailabilityStruct,
+    Doctor: DoctorStruct,
+    DoctorException: ExceptionStruct,
+    MedicalRecord: MedicalRecordStruct,
+    Patient: PatientStruct,
+    User: UserStruct,
+    WaitlistEntry: WaitlistEntryStruct,
+}
+models_of = {struct: cls for cls, struct in structs.items()}
+# fields set by the Struct from the others instead of read from objects
+derived_fields = {ExceptionStruct: {"date"}}
+AnyModel = Union[tuple(structs.values())]
+
+
+class JournalRecord(msgspec.Struct, omit_defaults=True):
+    """A FileStorage journal line: a 'put' of value or a 'del' of key"""
+    op: str
+    key: str
+    value: Optional[AnyModel] = None
+
+
+_encoder = msgspec.json.Encoder()
+_snapshot_decoder = msgspec.json.Decoder(dict[str, AnyModel], strict=False)
+_record_decoder = msgspec.json.Decoder(JournalRecord, strict=False)
+
+
+def _values(obj, changes=None):
+    """The Struct of obj and the values of its fields, with changes applied"""
+    struct = structs[type(obj)]
+    skipped = derived_fields.get(struct, ())
+    values = {name: getattr(obj, name, None) for name in struct.__struct_fields__
+              if name not in skipped}
+    if changes:
+        values.update((name, value) for name, value in changes.items() if name in values)
+    values["__class__"] = struct.__struct_config__.tag
+    return struct, values
+
+
+def _convert(obj, changes=None):
+    """Converts the values of obj, with changes applied, to its Struct"""
+    struct, values = _values(obj, changes)
+    try:
+        return msgspec.convert(values, struct, strict=False)
+    except msgspec.ValidationError as e:
+        raise ValueError(f"Invalid {type(obj).__name__} {values.get('id')}: {e}") from None
+
+
+def to_struct(obj):
+    """
+    Returns the Struct of a model object, file or database backed, with
+    numbers and dates given as strings converted
+
+    Raises:
+        ValueError: if a field has a value of the wrong type
+    """
+    return _convert(obj)
+
+
+def check(obj, changes):
+    """
+    Checks that obj can still be encoded once the changes, a dictionary
+    of field -> value, are set on it. obj is left unchanged, so views can
+    refuse an update before applying it.
+
+    Raises:
+        ValueError: if a field would have a value of the wrong type
+    """
+    _convert(obj, changes)
+
+
+def invalid_fields(obj):
+    """Names of the fields of obj whose own value can't be encoded"""
+    struct, values = _values(obj)
+    del values["__class__"]
+    types = {field.name: field.type for field in msgspec.structs.fields(struct)}
+    invalid = []
+    for name, value in values.items():
+        try:
+            msgspec.convert(value, types[name], strict=False)
+        except msgspec.ValidationError:
+            invalid.append(name)
+    return invalid
+
+
+def from_struct(struct):
+    """
+    Returns the file storage model object of a Struct, built from its fields
+    without going through __init__ as they are already typed
+    """
+    obj = object.__new__(models_of[type(struct)])
+    obj.__dict__.update(msgspec.structs.asdict(struct))
+    if type(struct) is ExceptionStruct:
+        # the model keeps date as a date
+        obj.date = struct.start_date
+    return obj
+
+
+def encode(objs):
+    """Encodes a dictionary of key -> object to JSON bytes"""
+    return _encoder.encode({key: to_struct(obj) for key, obj in objs.items()})
+
+
+def decode(data):
+    """
+    Decodes JSON bytes made by encode(), or by json.dump of to_dict(),
+    to a dictionary of key -> object
+
+    Raises:
+        msgspec.DecodeError: if the data is malformed or has an unknown class
+    """
+    return {key: from_struct(struct) for key, struct in _snapshot_decoder.decode(data).items()}
+
+
+def encode_object(obj):
+    """Encodes one object to JSON bytes"""
+    return _encoder.encode(to_struct(obj))
+
+
+def encode_list(objs):
+    """Encodes objects to a JSON array, the API's list responses"""
+    return _encoder.encode([to_struct(obj) for obj in objs])
+
+
+def encode_record(key, obj):
+    """Encodes a journal line putting obj at key, or deleting key when obj is None"""
+    if obj is None:
+        record = JournalRecord("del", key)
+    else:
+        record = JournalRecord("put", key, to_struct(obj))
+    return _encoder.encode(record) + b"\n"
+
+
+def decode_record(line):
+    """
+    Decodes a journal line to (op, key, object or None)
+
+    Raises:
+        msgspec.DecodeError: if the line is malformed
+    """
+    record = _record_decoder.decode(line)
+    return record.op, record.key, from_struct(record.value) if record.value is not None else None
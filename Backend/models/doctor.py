@@ -15,7 +15,7 @@ class Doctor(BaseModel, Base):
         last_name = Column(String(128), nullable=False)
         email = Column(String(128), unique=True, nullable=False)
         specialization = Column(String(128), nullable=False)
-        user_id = Column(String(60), ForeignKey('users.id'), nullable=False)
+        user_id = Column(String(60), ForeignKey('users.id'), nullable=False, index=True)
 
         user = relationship('User', back_populates='doctors')
         appointments = relationship('Appointment', back_populates='doctor')
@@ -4,16 +4,28 @@ import models
 from models.base_model import BaseModel, Base
 from models.appointment import Appointment
 from models.availability import Availability
+from models.booking_lock import BookingLock
 from models.doctor import Doctor
 from models.exception import Exception
 from models.patient import Patient
 from models.medical_record import MedicalRecord
-from models.user import User
+from models.user import User, normalize_email
+from models.waitlist_entry import WaitlistEntry
 from os import getenv
+import operator
 import sqlalchemy
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, literal, select, union_all, String, and_, or_
 from sqlalchemy.orm import scoped_session, sessionmaker
 
+FILTER_OPERATORS = {
+    "": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda column, values: column.in_(values),
+}
+
 
 class DBStorage:
     """interact with the mysql database"""
@@ -26,18 +38,28 @@ class DBStorage:
         "Patient": Patient,
         "Exception": Exception,
         "MedicalRecord": MedicalRecord,
-        "User": User
+        "User": User,
+        "WaitlistEntry": WaitlistEntry
     }
 
     __engine = None
     __session = None
 
+    # used by Flask-Migrate / alembic (see migrations/env.py)
+    metadata = Base.metadata
+
     def __init__(self):
         """Instantiates a DBStorage object"""
         HMS_MYSQL_USER = getenv("HMS_MYSQL_USER")
         HMS_MYSQL_PWD = getenv("HMS_MYSQL_PWD")
         HMS_MYSQL_HOST = getenv("HMS_MYSQL_HOST")
         HMS_MYSQL_DB = getenv("HMS_MYSQL_DB")
+        # Optional full database URL (e.g sqlite:///hms.db for local runs and benchmarks)
+        HMS_DB_URL = getenv("HMS_DB_URL")
+
+        if HMS_DB_URL:
+            self.__engine = create_engine(HMS_DB_URL, pool_pre_ping=True)
+            return
         
         self.__engine = create_engine('mysql+mysqldb://{}:{}@{}/{}'.
                                       format(HMS_MYSQL_USER,
@@ -45,6 +67,34 @@ class DBStorage:
                                              HMS_MYSQL_HOST,
                                              HMS_MYSQL_DB), pool_pre_ping=True, echo=True)
         
+    def _resolve_class(self, cls):
+        """Returns the model class for a class or class name"""
+        if isinstance(cls, str):
+            name = cls
+            cls = self.classes.get(name)
+            if cls is None:
+                raise ValueError(f"Class {name} is not valid model")
+
+        if cls not in self.classes.values():
+            raise ValueError(f"Class {cls} is not a valid model")
+        return cls
+
+    def _query(self, cls, filters, columns=None):
+        """
+        Returns a query on cls, or only the given columns of it, with the
+        filters applied. A filter is either column=value or
+        column__<op>=value where op is one of gt, gte, lt, lte or in
+        e.g scheduled_time__gte=datetime(2025, 1, 1)
+        """
+        query = self.__session.query(*columns) if columns else self.__session.query(cls)
+        for key, value in filters.items():
+            name, _, op = key.partition("__")
+            column = getattr(cls, name)
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter '{key}'")
+            query = query.filter(FILTER_OPERATORS[op](column, value))
+        return query
+
     def all(self, cls=None):
         """
         Query on the current database session for all objects
@@ -52,17 +102,8 @@ class DBStorage:
         """
         data = {}
         if cls:
-            if isinstance(cls, str):
-                cls = self.classes.get(cls)
-                if cls is None:
-                    raise ValueError(f"Class {cls} is not valid model")
-            
-            if cls not in self.classes.values():
-                raise ValueError(f"Class {cls} is not a valid model")
-            
-            if cls not in self.classes.values():
-                raise ValueError(f"{cls} is not recognized")
-            
+            cls = self._resolve_class(cls)
+
             class_obj = self.__session.query(cls).all()
             for obj in class_obj:
                 key = f"{obj.__class__.__name__}.{obj.id}"
@@ -85,27 +126,127 @@ class DBStorage:
         self.__session.commit()
 
     def get(self, cls, id):
-        """Returns  objects based on the class and its ID or None if not Found"""
-        all_classes = self.all(cls)
+        """
+        Returns the object based on the class and its ID or None if not Found.
+        The session identity map is checked first, then the primary key is
+        fetched directly so the cost doesn't grow with the table size
+        """
+        if id is None:
+            return None
+        cls = self._resolve_class(cls)
+        return self.__session.get(cls, str(id))
 
-        for obj in all_classes.values():
-            if id == str(obj.id):
-                return obj
-        return None
+    def get_many(self, cls, ids):
+        """
+        Returns a dictionary of id: object for all the given ids of a class,
+        fetched with a single IN query. Ids that don't exist are left out
+        """
+        cls = self._resolve_class(cls)
+        ids = {str(id) for id in ids if id is not None}
+        if not ids:
+            return {}
+        objs = self.__session.query(cls).filter(cls.id.in_(ids)).all()
+        return {obj.id: obj for obj in objs}
     
-    def count(self, cls=None):
-        """Count of how many instances of a classes there are"""
-        return len(self.all(cls))
+    def page(self, cls, limit, after=None, **filters):
+        """
+        Returns up to limit objects of a class ordered by (created_at, id)
+        starting after the (created_at, id) key given, together with the key
+        to continue from or None when there are no more objects.
+        Keyword arguments are applied as filters (see _query)
+        """
+        cls = self._resolve_class(cls)
+        query = self._query(cls, filters)
+        if after is not None:
+            created_at, id = after
+            query = query.filter(or_(cls.created_at > created_at,
+                                     and_(cls.created_at == created_at,
+                                          cls.id > id)))
+
+        objs = query.order_by(cls.created_at, cls.id).limit(limit + 1).all()
+        if len(objs) <= limit:
+            return objs, None
+        objs = objs[:limit]
+        return objs, (objs[-1].created_at, objs[-1].id)
+
+    def iterate(self, cls, after=None, batch_size=500, **filters):
+        """
+        Yields every object of a class ordered by (created_at, id) starting
+        after the (created_at, id) key given. Rows are fetched from a server
+        side cursor batch_size at a time so memory use stays flat.
+        Keyword arguments are applied as filters (see _query)
+        """
+        cls = self._resolve_class(cls)
+        query = self._query(cls, filters)
+        if after is not None:
+            created_at, id = after
+            query = query.filter(or_(cls.created_at > created_at,
+                                     and_(cls.created_at == created_at,
+                                          cls.id > id)))
+        yield from query.order_by(cls.created_at, cls.id).yield_per(batch_size)
+
+    def values(self, cls, fields, **filters):
+        """
+        Returns tuples of the given fields of every object of a class
+        matching the filters, selected as plain columns without building
+        the objects e.g values(Appointment, ('doctor_id', 'end_time'), status='scheduled')
+        """
+        cls = self._resolve_class(cls)
+        return [tuple(row) for row in
+                self._query(cls, filters, [getattr(cls, field) for field in fields])]
+
+    def get_by(self, cls, **filters):
+        """Returns the first object of a class matching the filters or None"""
+        cls = self._resolve_class(cls)
+        return self._query(cls, filters).first()
+
+    def count(self, cls=None, **filters):
+        """
+        Count of how many instances of a classes there are, computed with a
+        SELECT COUNT(*). Keyword arguments are applied as filters (see _query)
+        e.g count(Appointment, status='scheduled')
+        """
+        if cls is None:
+            return sum(self.count(clas, **filters)
+                       for clas in self.classes.values()
+                       if hasattr(clas, "__tablename__"))
+
+        cls = self._resolve_class(cls)
+        return self._query(cls, filters).with_entities(func.count(cls.id)).scalar()
+
+    def stats(self):
+        """
+        Returns the number of users, doctors, patients and appointments and
+        the appointments per status using a single grouped query
+        """
+        def totals(label, cls):
+            return select(literal(label).label("name"),
+                          literal(None, String).label("status"),
+                          func.count(cls.id).label("total"))
+
+        query = union_all(
+            totals("users", User),
+            totals("doctors", Doctor),
+            totals("patients", Patient),
+            select(literal("appointments").label("name"),
+                   Appointment.status,
+                   func.count(Appointment.id)).group_by(Appointment.status)
+        )
+
+        data = {"users": 0, "doctors": 0, "patients": 0, "appointments": 0,
+                "appointments_by_status": {}}
+        for name, status, total in self.__session.execute(query):
+            if status is None:
+                data[name] += total
+            else:
+                data["appointments"] += total
+                data["appointments_by_status"][status] = total
+        return data
     
     def find(self, cls=None, id=None):
         """Finds a user in the db and returns a bolean"""
         if cls is not None or id is not None:
-            all_classes = self.all(cls).values()
-
-            for obj in all_classes:
-                if obj.id == id:
-                    return True
-            return False
+            return self.get(cls, id) is not None
 
     
     def check_user(self, cls=None, email=None):
@@ -114,23 +255,32 @@ class DBStorage:
         and returns a boolean
         """
         if cls is not None or email is not None:
-            all_classes = self.all(cls).values()
-
-            for user in all_classes:
-                if user.email == email:
-                    return True
-            return False
+            return self.get_user_by_email(email) is not None
 
     def get_user_by_email(self, email):
-        """Gets and return a user"""
+        """Gets and return a user using the unique index on users.email"""
         if email is not None:
-            all_users = self.all(User).values()
-
-            for user in all_users:
-                if user.email == email:
-                    return user
-            return None
+            # the raw value is kept for rows stored before emails were normalized
+            emails = {email.strip(), normalize_email(email)}
+            return self.__session.query(User).filter(User.email.in_(emails)).first()
         
+    def lock(self, doctor_id, day):
+        """
+        Locks the (doctor, day) booking row until the current transaction
+        commits or rolls back, creating the row on first use. Raises
+        IntegrityError if another transaction created the row concurrently,
+        the caller is expected to roll back and retry
+        """
+        lock = self.__session.query(BookingLock).filter_by(
+            doctor_id=doctor_id, day=day).with_for_update().first()
+        if lock is None:
+            self.__session.add(BookingLock(doctor_id, day))
+            self.__session.flush()
+
+    def rollback(self):
+        """Rolls back the current db session transaction"""
+        self.__session.rollback()
+
     def delete(self, obj=None):
         """Deletes current object from the database session"""
         if obj is not None:
@@ -143,6 +293,10 @@ class DBStorage:
         Session = scoped_session(sess_factory)
         self.__session = Session
 
+    def get_engine(self):
+        """Returns the engine, used by Flask-Migrate to run migrations"""
+        return self.__engine
+
     def get_session(self):
         """Returns the current session"""
         return self.__session
@@ -1,15 +1,24 @@
 #!/usr/bin/python3
 """Contains the FileStorage class"""
-import json
 import models
+import msgspec
+import operator
+import os
+import atexit
+import tempfile
+import time
+from bisect import bisect_right, insort
+from threading import Event, Lock, Thread
+from models import codec
 from models.base_model import BaseModel
 from models.appointment import Appointment
 from models.availability import Availability
 from models.doctor import Doctor
-from models.exception import Exception
+from models.exception import Exception as DoctorException
 from models.patient import Patient
 from models.medical_record import MedicalRecord
-from models.user import User
+from models.user import User, normalize_email
+from models.waitlist_entry import WaitlistEntry
 
 classes = {
     "BaseModel": BaseModel,
@@ -17,15 +26,92 @@ classes = {
     "Availability": Availability,
     "Doctor": Doctor,
     "Patient": Patient,
-    "Exception": Exception,
+    "Exception": DoctorException,
     "MedicalRecord": MedicalRecord,
-    "User": User
+    "User": User,
+    "WaitlistEntry": WaitlistEntry
 }
+# Append changes to <file>.journal on save() instead of rewriting the file
+FILE_JOURNAL = os.getenv("HMS_FILE_JOURNAL") == "1"
+# Journal records after which the file is rewritten in the background
+JOURNAL_COMPACT_RECORDS = int(os.getenv("HMS_JOURNAL_COMPACT_RECORDS", 10000))
+# Seconds a save() waits for others to write them all at once, 0 writes at once
+FILE_FLUSH_WINDOW = float(os.getenv("HMS_FILE_FLUSH_WINDOW", 0))
+
+# Fields with a value -> keys index, used to answer filtered lookups
+indexed_fields = {
+    "Appointment": ("doctor_id", "patient_id"),
+    "Availability": ("doctor_id",),
+    "Doctor": ("user_id",),
+    "Exception": ("doctor_id",),
+    "Patient": ("user_id",),
+    "WaitlistEntry": ("doctor_id", "patient_id"),
+}
+
+filter_operators = {
+    "": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda value, values: value in values,
+}
+
+
+def matches(obj, filters):
+    """
+    Checks an object against filters written as attribute=value or
+    attribute__<op>=value where op is one of gt, gte, lt, lte or in
+    """
+    for key, value in filters.items():
+        name, _, op = key.partition("__")
+        if op not in filter_operators:
+            raise ValueError(f"Unsupported filter '{key}'")
+        attr = getattr(obj, name, None)
+        if op and attr is None:
+            return False
+        if not filter_operators[op](attr, value):
+            return False
+    return True
+
 
 class FileStorage:
-    """Serializes instances to a JSON file & deserializes back to instances"""
+    """
+    Serializes instances to a JSON file & deserializes back to instances.
+    The file is replaced through a synced temporary file, so a crash leaves
+    the old or the new file whole.
+    In journal mode save() only appends the objects added, changed or
+    deleted since the last save to <file>.journal, one JSON record per
+    line, and the file is rewritten by a background compaction once the
+    journal holds JOURNAL_COMPACT_RECORDS records. reload() reads the file
+    then replays the journal.
+    With a flush_window, save() returns at once and a flusher thread writes
+    the changes of every save() of the window together.
+    """
     __file_path = "file.json"
+    journal = FILE_JOURNAL
+    flush_window = FILE_FLUSH_WINDOW
+    # key -> object to write, or None once deleted, since the last write
+    __dirty = {}
+    __journal_records = 0
+    __write_lock = Lock()
+    __compaction = None
+    __flusher = None
+    __flush_requested = Event()
+    # (inode, size, mtime) of the file and (inode, offset) of the journal
+    # as last read or written, to tell whether another process changed them
+    __file_stamp = None
+    __journal_stamp = None
+    # why the file or journal couldn't be read, writes are refused until
+    # a reload succeeds so they don't replace the objects that weren't read
+    __load_error = None
     __objects = {}
+    __by_class = {}
+    __emails = {}
+    __email_of = {}
+    __sorted = {}
+    __fields = {}
+    __field_values = {}
 
     def all(self, cls=None):
         """
@@ -37,52 +123,465 @@ class FileStorage:
                 cls = classes.get(cls)
             if cls not in classes.values():
                 raise ValueError(f"invalid class name: {cls}")
-            new_dict = {}
-            for key, value in self.__objects.items():
-                if cls == value.__class__ or cls == value.__class__.__name__:
-                    new_dict[key] = value
-            return new_dict
+            return dict(self.__by_class.get(cls.__name__, {}))
         return self.__objects
     
     def new(self, obj):
-        """ Sets in __objects the obj with key <obj class name>.id """
+        """
+        Sets in __objects the obj with key <obj class name>.id
+
+        Raises:
+            ValueError: if a field can't be written (see codec.to_struct).
+            The fields that can't are put back as last written on a stored
+            object (see __revert), views should check changes beforehand
+            with codec.check.
+        The indexes are updated under the write lock, as the flusher and
+        compaction threads read them.
+        """
         key = f"{obj.__class__.__name__}.{obj.id}"
-        self.__objects[key] = obj
+        try:
+            codec.to_struct(obj)
+        except ValueError:
+            with self.__write_lock:
+                if self.__objects.get(key) is obj:
+                    self.__revert(key, obj)
+            raise
+        with self.__write_lock:
+            if key not in self.__objects:
+                self.__index_sorted(obj)
+            self.__objects[key] = obj
+            self.__by_class.setdefault(obj.__class__.__name__, {})[key] = obj
+            self.__index_email(key, obj)
+            self.__index_fields(key, obj)
+            self.__dirty[key] = obj
+
+    def __revert(self, key, obj):
+        """
+        Sets the fields of a stored object that can't be written back to
+        their values in the file and journals, leaving its other changes.
+        An object that was never written is dropped. Call with the write
+        lock held.
+        """
+        written = self.__read_written(key)
+        if written is None:
+            self.__forget(key)
+            self.__dirty.pop(key, None)
+            return
+        for name in codec.invalid_fields(obj) or list(vars(written)):
+            setattr(obj, name, getattr(written, name, None))
+
+    def __read_written(self, key):
+        """The object of a key as last written to the file and journals, or None"""
+        obj = None
+        try:
+            with open(self.__file_path, 'rb') as f:
+                obj = codec.decode(f.read()).get(key)
+        except (FileNotFoundError, msgspec.DecodeError):
+            pass
+        for path in reversed(self.__journal_paths()):
+            try:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        op, record_key, record = codec.decode_record(line)
+                        if record_key == key:
+                            obj = record
+            except (FileNotFoundError, msgspec.DecodeError):
+                pass
+        return obj
+
+    def __index_fields(self, key, obj):
+        """Keeps the value -> keys indexes of indexed_fields up to date"""
+        for field, value in self.__field_values.pop(key, {}).items():
+            keys = self.__fields[field].get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__fields[field][value]
+        if obj is None:
+            return
+        cls_name = obj.__class__.__name__
+        values = {}
+        for name in indexed_fields.get(cls_name, ()):
+            value = getattr(obj, name, None)
+            field = (cls_name, name)
+            self.__fields.setdefault(field, {}).setdefault(value, set()).add(key)
+            values[field] = value
+        if values:
+            self.__field_values[key] = values
+
+    def __candidates(self, cls, filters):
+        """
+        Returns the keys of the objects of cls that can match the filters,
+        using the narrowest field index for an equality or 'in' filter, or
+        None when no index applies
+        """
+        candidates = None
+        for key, value in filters.items():
+            name, _, op = key.partition("__")
+            field = (cls.__name__, name)
+            if field not in self.__fields or op not in ("", "in"):
+                continue
+            index = self.__fields[field]
+            # copies, the indexes change while callers iterate
+            if op == "in":
+                keys = set().union(*(index.get(one, ()) for one in value))
+            else:
+                keys = set(index.get(value, ()))
+            if candidates is None or len(keys) < len(candidates):
+                candidates = keys
+        return candidates
+
+    def __index_sorted(self, obj, remove=False):
+        """
+        Keeps a per class list of (created_at, id) sorted so collections can
+        be paginated without sorting every object
+        """
+        entries = self.__sorted.setdefault(obj.__class__.__name__, [])
+        entry = (obj.created_at, obj.id)
+        if not remove:
+            insort(entries, entry)
+            return
+        i = bisect_right(entries, entry) - 1
+        if i >= 0 and entries[i] == entry:
+            del entries[i]
+
+    def __index_email(self, key, obj):
+        """Keeps the normalized email -> User key index up to date"""
+        old_email = self.__email_of.pop(key, None)
+        if old_email is not None and self.__emails.get(old_email) == key:
+            del self.__emails[old_email]
+        if isinstance(obj, User) and obj.email:
+            email = normalize_email(obj.email)
+            self.__emails[email] = key
+            self.__email_of[key] = email
+
+    def __journal_paths(self):
+        """Paths of the journal and of the journal being compacted"""
+        return self.__file_path + ".journal", self.__file_path + ".journal.compacting"
 
     def save(self):
-        """serializes __objects to json file (path: __file_path)"""
+        """
+        Writes the changes: serializes __objects to the json file (path:
+        __file_path), or in journal mode appends the changes since the last
+        write to the journal. With a flush_window the flusher thread writes
+        them, up to flush_window seconds later.
+        """
+        if self.flush_window > 0:
+            self.__request_flush()
+            return
+        self.flush()
+
+    def __request_flush(self):
+        """Wakes up the flusher thread, starting it on the first call"""
+        with self.__write_lock:
+            if self.__flusher is None or not self.__flusher.is_alive():
+                FileStorage.__flusher = Thread(target=self.__run_flusher,
+                                               name="file-storage-flusher", daemon=True)
+                self.__flusher.start()
+                atexit.register(self.__flush_requested_saves)
+        self.__flush_requested.set()
+
+    def __run_flusher(self):
+        """Flusher thread: one write per window with saves"""
+        while True:
+            self.__flush_requested.wait()
+            time.sleep(self.flush_window)
+            self.__flush_requested_saves()
+
+    def __flush_requested_saves(self):
+        """Writes the changes if a save() is waiting for the flusher"""
+        if self.__flush_requested.is_set():
+            self.flush()
+
+    def flush(self):
+        """Writes the changes made since the last write now"""
+        self.__flush_requested.clear()
+        if self.__load_error is not None:
+            print(f"Not saving, {self.__file_path} could not be read. \n{self.__load_error}")
+            return
         try:
-            with open(self.__file_path, 'w') as file:
-                json.dump({k: v.to_dict() for k, v in self.__objects.items()}, file)
+            if self.journal:
+                self.__append_journal()
+                return
+            if self.__compaction is not None:
+                self.__compaction.join()
+            with self.__write_lock:
+                FileStorage.__dirty = {}
+                self.__replace_file(self.__write_temp(codec.encode(dict(self.__objects))))
+                # the file now holds every change the journals had
+                for path in self.__journal_paths():
+                    if os.path.exists(path):
+                        os.remove(path)
+                FileStorage.__journal_records = 0
+                FileStorage.__journal_stamp = None
         except Exception as e:
             print(f"Error saving file. \n{e}")
 
+    @staticmethod
+    def __stat(path):
+        """(inode, size, mtime) of a file, None when it doesn't exist"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def __write_temp(self, data):
+        """Writes data to a new synced file next to the file, returns its path"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.__file_path)),
+                                        prefix=os.path.basename(self.__file_path) + ".",
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def __replace_file(self, tmp_path):
+        """
+        Renames a file made by __write_temp over the file, keeping its
+        permissions, and syncs the directory so the rename is durable
+        """
+        try:
+            os.chmod(tmp_path, os.stat(self.__file_path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        # the rename keeps the inode, size and mtime
+        stamp = self.__stat(tmp_path)
+        os.replace(tmp_path, self.__file_path)
+        FileStorage.__file_stamp = stamp
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(os.path.dirname(os.path.abspath(self.__file_path)), os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def __append_journal(self):
+        """
+        Appends one record per changed key to the journal and syncs it, the
+        cost depends on the changes only. Starts a compaction when the
+        journal is long enough.
+        """
+        with self.__write_lock:
+            dirty, FileStorage.__dirty = self.__dirty, {}
+            if not dirty:
+                return
+            try:
+                lines = [codec.encode_record(key, self.__objects.get(key)) for key in dirty]
+                with open(self.__journal_paths()[0], 'ab') as file:
+                    start = file.tell()
+                    file.write(b"".join(lines))
+                    file.flush()
+                    os.fsync(file.fileno())
+                    inode = os.fstat(file.fileno()).st_ino
+                    # skip reading back the records when nobody wrote since the last read
+                    if self.__journal_stamp == (inode, start) or \
+                            (self.__journal_stamp is None and start == 0):
+                        FileStorage.__journal_stamp = (inode, file.tell())
+            except BaseException:
+                # keep them for the next write
+                for key, obj in dirty.items():
+                    self.__dirty.setdefault(key, obj)
+                raise
+            FileStorage.__journal_records += len(lines)
+            if self.__journal_records >= JOURNAL_COMPACT_RECORDS and \
+                    (self.__compaction is None or not self.__compaction.is_alive()):
+                self.__start_compaction()
+
+    def __start_compaction(self):
+        """
+        Moves the journal aside and rewrites the file from a copy of the
+        objects in a background thread, call with the journal lock held.
+        Saves made meanwhile go to a new journal, replayed after both.
+        """
+        journal_path, compacting_path = self.__journal_paths()
+        if os.path.exists(compacting_path):
+            # left by a compaction that didn't finish, keep its records
+            with open(journal_path, 'rb') as journal, open(compacting_path, 'ab') as compacting:
+                compacting.write(journal.read())
+            os.remove(journal_path)
+        else:
+            os.replace(journal_path, compacting_path)
+        FileStorage.__journal_records = 0
+        FileStorage.__journal_stamp = None
+        objs = list(self.__objects.items())
+        FileStorage.__compaction = Thread(target=self.__compact, args=(objs,),
+                                          name="file-storage-compaction", daemon=True)
+        self.__compaction.start()
+
+    def compact(self):
+        """Rewrites the file with the journal's changes now and waits for it"""
+        while True:
+            running = self.__compaction
+            if running is not None:
+                running.join()
+            with self.__write_lock:
+                if self.__compaction is not running:
+                    # another save started one meanwhile
+                    continue
+                if os.path.exists(self.__journal_paths()[0]):
+                    self.__start_compaction()
+                running = self.__compaction
+            if running is not None:
+                running.join()
+            return
+
+    def __compact(self, objs):
+        """
+        Compaction thread: rewrites the file from objs, (key, object) pairs,
+        then drops the compacted journal. A crash leaves either the old file
+        and journal or the new file.
+        """
+        try:
+            tmp_path = self.__write_temp(codec.encode(dict(objs)))
+            with self.__write_lock:
+                self.__replace_file(tmp_path)
+                os.remove(self.__journal_paths()[1])
+        except Exception as e:
+            print(f"Error compacting file. \n{e}")
+
+    def __load(self, key, obj):
+        """Sets the object of a key and indexes it"""
+        self.__objects[key] = obj
+        self.__by_class.setdefault(obj.__class__.__name__, {})[key] = obj
+        self.__index_email(key, obj)
+        self.__index_fields(key, obj)
+
+    def __forget(self, key):
+        """Removes the object of a key and its index entries, returns it"""
+        obj = self.__objects.pop(key, None)
+        if obj is not None:
+            self.__index_sorted(obj, remove=True)
+            self.__by_class.get(obj.__class__.__name__, {}).pop(key, None)
+            self.__index_email(key, None)
+            self.__index_fields(key, None)
+        return obj
+
+    def __replay(self, path, pending, stamp=None, index_sorted=False):
+        """
+        Applies the records of a journal but those of the pending keys,
+        from the offset of stamp when it is the same journal. Returns how
+        many records were read and the (inode, offset) read up to. A line
+        cut short, by a crash or a write in progress, ends the journal.
+
+        Raises:
+            msgspec.DecodeError: if a complete line is malformed
+        """
+        count = 0
+        try:
+            with open(path, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                offset = stamp[1] if stamp is not None and stamp[0] == inode else 0
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    op, key, obj = codec.decode_record(line)
+                    offset += len(line)
+                    count += 1
+                    if key in pending:
+                        continue
+                    if op == "del":
+                        self.__forget(key)
+                    else:
+                        if index_sorted and key not in self.__objects:
+                            self.__index_sorted(obj)
+                        self.__load(key, obj)
+        except FileNotFoundError:
+            return count, None
+        return count, (inode, offset)
+
     def reload(self):
-        """Deserializes the json file to __objects"""
+        """
+        Deserializes the json file, then its journals, to __objects. Objects
+        changed in memory and not written yet are kept, the other objects
+        missing from the file and journals are dropped.
+        """
         try:
-            with open(self.__file_path, 'r') as f:
-                data = json.load(f)
-            for key in data:
-                self.__objects[key] = classes[data[key]["__class__"]](**data[key])
+            journal_path, compacting_path = self.__journal_paths()
+            with self.__write_lock:
+                pending = set(self.__dirty)
+                FileStorage.__file_stamp = self.__stat(self.__file_path)
+                try:
+                    with open(self.__file_path, 'rb') as f:
+                        data = codec.decode(f.read())
+                except FileNotFoundError:
+                    print("File not found")
+                    data = {}
+                # removed by another process, the journals put back the others
+                for key in [key for key in self.__objects if key not in data and key not in pending]:
+                    self.__forget(key)
+                for key, obj in data.items():
+                    if key not in pending:
+                        self.__load(key, obj)
+                self.__replay(compacting_path, pending)
+                FileStorage.__journal_records, FileStorage.__journal_stamp = \
+                    self.__replay(journal_path, pending)
+                self.__sorted.clear()
+                for obj in self.__objects.values():
+                    self.__sorted.setdefault(obj.__class__.__name__, []).append(
+                        (obj.created_at, obj.id))
+                for entries in self.__sorted.values():
+                    entries.sort()
+            FileStorage.__load_error = None
         
-        except FileNotFoundError:
-            print("File not found")
-        except KeyError as e:
-            print(f"Missing class definition for {e}")
-        except json.JSONDecodeError:
-            print("Corrupted JSON file. Unable to reload")
+        except msgspec.DecodeError as e:
+            FileStorage.__load_error = e
+            print(f"Corrupted JSON file. Unable to reload\n{e}")
 
     def delete(self, obj=None):
         """Deletes obj from __objects if it is inside"""
         if obj is not None:
             key = obj.__class__.__name__ + "." + obj.id
-            if key in self.__objects:
-                del self.__objects[key]
+            with self.__write_lock:
+                if self.__forget(key) is not None:
+                    self.__dirty[key] = None
         else:
             print(f"Can't delete {obj}")
 
+    def lock(self, doctor_id, day):
+        """
+        Nothing to lock on disk: bookings are only serialized by the
+        in-process booking locks, so they are safe within one API process
+        """
+        pass
+
+    def rollback(self):
+        """Changes are only written on save(), there is nothing to roll back"""
+        pass
+
     def close(self):
-        """Call reload() method for deserializing the json file to objects"""
+        """
+        Reads what other processes wrote since the last read or write:
+        nothing when the file and journal didn't change, only the new
+        records when the journal grew, else the whole file (see reload)
+        """
+        with self.__write_lock:
+            if self.__stat(self.__file_path) == self.__file_stamp:
+                journal_path = self.__journal_paths()[0]
+                journal = self.__stat(journal_path)
+                stamp = self.__journal_stamp
+                if journal is None and stamp is None:
+                    return
+                # a journal started since the last read only holds new records
+                if journal is not None and (stamp is None or journal[0] == stamp[0]):
+                    if stamp is None or journal[1] > stamp[1]:
+                        try:
+                            count, FileStorage.__journal_stamp = self.__replay(
+                                journal_path, set(self.__dirty), stamp, index_sorted=True)
+                        except msgspec.DecodeError as e:
+                            FileStorage.__load_error = e
+                            print(f"Corrupted journal. Unable to reload\n{e}")
+                            return
+                        FileStorage.__journal_records += count
+                    return
         self.reload()
 
     def get(self, cls, id):
@@ -90,26 +589,146 @@ class FileStorage:
         Returns the object based on the class name and ID
         or None if not found
         """
+        if isinstance(cls, str):
+            cls = classes.get(cls)
         if cls not in classes.values():
             return None
-        
-        all_classes = models.storage.all(cls)
-        for value in all_classes.values():
-            if (value.id == id):
-                return value
-        return None
+        return self.__objects.get(f"{cls.__name__}.{id}")
     
-    def count(self, cls=None):
+    def get_user_by_email(self, email):
+        """Gets and return a user using the normalized email index"""
+        if email is None:
+            return None
+        key = self.__emails.get(normalize_email(email))
+        user = self.__objects.get(key)
+        if user is None or normalize_email(user.email) != normalize_email(email):
+            return None
+        return user
+
+    def check_user(self, cls=None, email=None):
         """
-        Counts the number of objects in storage
+        Finds the User in storage based on the email to search for
+        and returns a boolean
+        """
+        if cls is not None or email is not None:
+            return self.get_user_by_email(email) is not None
+
+    def get_many(self, cls, ids):
+        """
+        Returns a dictionary of id: object for all the given ids of a class.
+        Ids that don't exist are left out
+        """
+        if isinstance(cls, str):
+            cls = classes.get(cls)
+        if cls not in classes.values():
+            return {}
+
+        found = {}
+        for id in ids:
+            obj = self.__objects.get(f"{cls.__name__}.{id}")
+            if obj is not None:
+                found[obj.id] = obj
+        return found
+    
+    def page(self, cls, limit, after=None, **filters):
+        """
+        Returns up to limit objects of a class ordered by (created_at, id)
+        starting after the (created_at, id) key given, together with the key
+        to continue from or None when there are no more objects.
+        Keyword arguments are applied as filters (see matches)
+        """
+        if isinstance(cls, str):
+            cls = classes.get(cls)
+        if cls not in classes.values():
+            raise ValueError(f"invalid class name: {cls}")
+
+        candidates = self.__candidates(cls, filters)
+        if candidates is None:
+            entries = self.__sorted.get(cls.__name__, [])
+        else:
+            entries = sorted((obj.created_at, obj.id) for obj in
+                             map(self.__objects.get, candidates) if obj is not None)
+        start = bisect_right(entries, after) if after is not None else 0
+        objs = []
+        for i in range(start, len(entries)):
+            try:
+                id = entries[i][1]
+            except IndexError:
+                # shortened by another thread meanwhile
+                break
+            obj = self.__objects.get(f"{cls.__name__}.{id}")
+            if obj is None or not matches(obj, filters):
+                continue
+            if len(objs) == limit:
+                return objs, (objs[-1].created_at, objs[-1].id)
+            objs.append(obj)
+        return objs, None
+
+    def get_by(self, cls, **filters):
+        """Returns the first object of a class matching the filters or None"""
+        objs, _ = self.page(cls, 1, None, **filters)
+        return objs[0] if objs else None
+
+    def iterate(self, cls, after=None, batch_size=500, **filters):
+        """
+        Yields every object of a class ordered by (created_at, id) starting
+        after the (created_at, id) key given.
+        Keyword arguments are applied as filters (see matches)
+        """
+        after_key = after
+        while True:
+            objs, after_key = self.page(cls, batch_size, after_key, **filters)
+            yield from objs
+            if after_key is None:
+                return
+
+    def count(self, cls=None, **filters):
+        """
+        Counts the number of objects in storage, keyword arguments are
+        applied as filters (see matches)
         """
-        all_classes = classes.values()
         if not cls:
-            count = 0
-            for clas in all_classes:
-                count += len(models.storage.all(clas).values())
+            objs = self.__objects.values()
         else:
-            count = len(models.storage.all(cls).values())
+            if isinstance(cls, str):
+                cls = classes.get(cls)
+            candidates = self.__candidates(cls, filters)
+            if candidates is not None:
+                objs = [obj for obj in map(self.__objects.get, candidates) if obj is not None]
+            else:
+                objs = list(self.__by_class.get(cls.__name__, {}).values())
+
+        if not filters:
+            return len(objs)
+        return sum(1 for obj in objs if matches(obj, filters))
 
-        return count
+    def values(self, cls, fields, **filters):
+        """
+        Returns tuples of the given fields of every object of a class
+        matching the filters (see matches)
+        """
+        if isinstance(cls, str):
+            cls = classes.get(cls)
+        candidates = self.__candidates(cls, filters)
+        if candidates is not None:
+            objs = [obj for obj in map(self.__objects.get, candidates) if obj is not None]
+        else:
+            objs = list(self.__by_class.get(cls.__name__, {}).values())
+        return [tuple(getattr(obj, field) for field in fields)
+                for obj in objs if matches(obj, filters)]
+
+    def stats(self):
+        """
+        Returns the number of users, doctors, patients and appointments and
+        the appointments per status
+        """
+        data = {"users": 0, "doctors": 0, "patients": 0, "appointments": 0,
+                "appointments_by_status": {}}
+        names = {User: "users", Doctor: "doctors", Patient: "patients", Appointment: "appointments"}
+        by_status = data["appointments_by_status"]
 
+        for cls, name in names.items():
+            data[name] = len(self.__by_class.get(cls.__name__, {}))
+        for obj in self.__by_class.get(Appointment.__name__, {}).values():
+            by_status[obj.status] = by_status.get(obj.status, 0) + 1
+        return data
@@ -2,16 +2,31 @@
 """Defines the Exception Model"""
 from models.base_model import Base, BaseModel
 import models
-from sqlalchemy import ForeignKey, Column, String, Date, Boolean
+from sqlalchemy import ForeignKey, Column, String, Date, Time, Boolean, Index
 from sqlalchemy.orm import relationship
+from datetime import date, time
 
 
 class Exception(BaseModel, Base):
-    """Defines the Blueprint for the Exception Model"""
+    """
+    Defines the Blueprint for the Exception Model: a doctor's exception from
+    start_date to end_date (inclusive), the whole day or from start_time to
+    end_time on each day. date is kept equal to start_date.
+    """
     if models.storage_type == "db":
         __tablename__ = 'exceptions'
+        __table_args__ = (
+            Index('ix_exceptions_doctor_date', 'doctor_id', 'date'),
+            # overlap lookups: one doctor, start_date <= last day and end_date >= first day
+            Index('ix_exceptions_doctor_range', 'doctor_id', 'start_date', 'end_date'),
+        )
         doctor_id = Column(String(60), ForeignKey('doctors.id'), nullable=False)
         date = Column(Date, nullable=False)
+        start_date = Column(Date, nullable=False)
+        end_date = Column(Date, nullable=False)
+        # both None for whole days
+        start_time = Column(Time, nullable=True)
+        end_time = Column(Time, nullable=True)
         is_available = Column(Boolean, default=True)
 
         doctor = relationship('Doctor', back_populates='exceptions')
@@ -19,8 +34,40 @@ class Exception(BaseModel, Base):
     else:
         doctor_id = ""
         date = ""
+        start_date = ""
+        end_date = ""
+        start_time = None
+        end_time = None
         is_available = True
 
     def __init__(self, *args, **kwargs):
-        """Initializes the Exception"""
+        """
+        Initializes the Exception, a single date is a one day range. Dates
+        and times may be ISO strings, as reloaded from the JSON file
+        """
         super().__init__(*args, **kwargs)
+        for key in ("date", "start_date", "end_date"):
+            if isinstance(getattr(self, key), str) and getattr(self, key):
+                setattr(self, key, date.fromisoformat(getattr(self, key)[:10]))
+        for key in ("start_time", "end_time"):
+            if isinstance(getattr(self, key), str):
+                setattr(self, key, time.fromisoformat(getattr(self, key)))
+        if not self.start_date:
+            self.start_date = self.date
+        if not self.end_date:
+            self.end_date = self.start_date
+        self.date = self.start_date
+
+    def to_dict(self):
+        """
+        Returns the dictionary of BaseModel.to_dict with the dates and
+        times of the exception as ISO strings
+        """
+        new_dict = super().to_dict()
+        for key in ("date", "start_date", "end_date"):
+            if isinstance(new_dict.get(key), date):
+                new_dict[key] = new_dict[key].isoformat()
+        for key in ("start_time", "end_time"):
+            if isinstance(new_dict.get(key), time):
+                new_dict[key] = new_dict[key].strftime("%H:%M:%S")
+        return new_dict
@@ -10,8 +10,8 @@ class MedicalRecord(BaseModel, Base):
     """Blueprint for medicalrecord"""
     if models.storage_type == "db":
         __tablename__ = 'medical_records'
-        appointment_id = Column(String(60), ForeignKey('appointments.id'), nullable=False)
-        patient_id = Column(String(60), ForeignKey('patients.id'), nullable=False)
+        appointment_id = Column(String(60), ForeignKey('appointments.id'), nullable=False, index=True)
+        patient_id = Column(String(60), ForeignKey('patients.id'), nullable=False, index=True)
         doctor_id = Column(String(60), ForeignKey('doctors.id'), nullable=False)
         notes = Column(Text, nullable=True)
         prescriptions = Column(Text, nullable=True)
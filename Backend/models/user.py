@@ -3,10 +3,17 @@
 import models
 from models.base_model import BaseModel, Base
 from sqlalchemy import Column, String, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 import bcrypt
 
 
+def normalize_email(email):
+    """Returns the email in the form used for lookups (trimmed, lower case)"""
+    if email is None:
+        return None
+    return email.strip().lower()
+
+
 class User(BaseModel, Base):
     """User model class"""
     if models.storage_type == "db":
@@ -19,6 +26,11 @@ class User(BaseModel, Base):
         patients = relationship('Patient', back_populates='user', uselist=False)
         doctors = relationship('Doctor', back_populates='user', uselist=False)
 
+        @validates('email')
+        def _validate_email(self, key, email):
+            """Stores emails normalized so lookups can use the unique index"""
+            return normalize_email(email)
+
     else:
         name = ""
         email = ""
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""Defines the WaitlistEntry model"""
+import models
+from models.base_model import Base, BaseModel
+from sqlalchemy import Column, String, Integer, Boolean, Date, Time, DateTime, Enum, ForeignKey, Index, text
+from datetime import date, time
+
+
+class WaitlistEntry(BaseModel, Base):
+    """
+    A patient waiting for an opening of duration minutes with a doctor from
+    start_date to end_date (inclusive), optionally between earliest_time and
+    latest_time of the day. Higher priority entries are served first, then
+    the oldest.
+    """
+    if models.storage_type == "db":
+        __tablename__ = 'waitlist_entries'
+        __table_args__ = (
+            # matching: the waiting entries of one doctor, best first, in
+            # the order they are read (priority DESC, created_at ASC)
+            Index('ix_waitlist_doctor_status_priority', 'doctor_id', 'status',
+                  text('priority DESC'), 'created_at'),
+            # settling: the offers that ran out
+            Index('ix_waitlist_status_offered_until', 'status', 'offered_until'),
+            Index('ix_waitlist_patient', 'patient_id'),
+        )
+        patient_id = Column(String(60), ForeignKey('patients.id'), nullable=False)
+        doctor_id = Column(String(60), ForeignKey('doctors.id'), nullable=False)
+        start_date = Column(Date, nullable=False)
+        end_date = Column(Date, nullable=False)
+        earliest_time = Column(Time, nullable=True)
+        latest_time = Column(Time, nullable=True)
+        duration = Column(Integer, nullable=False)
+        priority = Column(Integer, default=0, nullable=False)
+        # book the opening directly instead of offering it as a hold
+        auto_book = Column(Boolean, default=False, nullable=False)
+        status = Column(Enum('waiting', 'offered', 'booked', 'cancelled', 'expired',
+                             name='waitlist_status'), default='waiting', nullable=False)
+        hold_id = Column(String(60), nullable=True)
+        # start of the offered range and when its hold runs out
+        offered_time = Column(DateTime, nullable=True)
+        offered_until = Column(DateTime, nullable=True)
+        appointment_id = Column(String(60), nullable=True)
+
+    else:
+        patient_id = ""
+        doctor_id = ""
+        start_date = ""
+        end_date = ""
+        earliest_time = None
+        latest_time = None
+        duration = ""
+        priority = 0
+        auto_book = False
+        status = "waiting"
+        hold_id = None
+        offered_time = None
+        offered_until = None
+        appointment_id = None
+
+    def __init__(self, *args, **kwargs):
+        """Initializes the WaitlistEntry"""
+        super().__init__(*args, **kwargs)
+        if self.priority is None:
+            self.priority = 0
+        if self.auto_book is None:
+            self.auto_book = False
+        if self.status is None:
+            self.status = 'waiting'
+
+    def to_dict(self):
+        """
+        Returns the dictionary of BaseModel.to_dict with the dates and
+        times of the entry as ISO strings
+        """
+        new_dict = super().to_dict()
+        for key in ("start_date", "end_date", "earliest_time", "latest_time",
+                    "offered_time", "offered_until"):
+            if isinstance(new_dict.get(key), (date, time)):
+                new_dict[key] = new_dict[key].isoformat()
+        return new_dict
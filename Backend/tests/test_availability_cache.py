@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import date, time
+from api.v1.availability_cache import AvailabilityCache
+from api.v1.slot_index import DoctorRow
+
+
+class TestAvailabilityCache(unittest.TestCase):
+    def setUp(self):
+        self.doctor = DoctorRow("doc1", "Ada", "Lovelace")
+        availability = ("a1", "Monday", time(9), time(12))
+        exception = ("e1", False, None, None, date(2030, 1, 7), date(2030, 1, 7))
+        self.cache = AvailabilityCache(size=10, ttl=60)
+        self.rows = MagicMock(return_value=(self.doctor, [availability], [exception]))
+        self.cache._load = self.rows
+        patcher = patch("api.v1.availability_cache.storage")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def schedule(self):
+        return self.cache.schedule("doc1", {"Monday"}, {date(2030, 1, 7)})
+
+    def test_read_through(self):
+        doctor, availabilities, exceptions = self.schedule()
+        self.assertIs(doctor, self.doctor)
+        self.assertEqual(availabilities["Monday"][0].start_time, time(9))
+        self.assertFalse(exceptions[date(2030, 1, 7)][0].is_available)
+        self.schedule()
+        self.assertEqual(self.rows.call_count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 3))
+
+    def test_load_reads_plain_rows(self):
+        with patch("api.v1.availability_cache.storage") as storage:
+            storage.get.return_value = MagicMock(id="doc1", first_name="Ada", last_name="Lovelace")
+            storage.values.side_effect = lambda cls, fields, **filters: []
+            doctor, availabilities, exceptions = AvailabilityCache._load(
+                "doc1", True, {"Monday"}, {date(2030, 1, 7)})
+        self.assertEqual(doctor, self.doctor)
+        self.assertEqual(storage.values.call_count, 2)
+        storage.get_session.assert_not_called()
+
+    def test_range_exception_covers_each_date(self):
+        exception = ("e2", False, time(13), time(17), date(2030, 1, 8), date(2030, 1, 10))
+        self.rows.return_value = (self.doctor, [], [exception])
+        _, _, exceptions = self.cache.schedule("doc1", set(), {date(2030, 1, 7), date(2030, 1, 9)})
+        self.assertEqual(exceptions[date(2030, 1, 7)], [])
+        self.assertEqual(exceptions[date(2030, 1, 9)][0].start_time, time(13))
+        self.cache.invalidate_exception("doc1", date(2030, 1, 8), date(2030, 1, 10))
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_invalidation(self):
+        self.schedule()
+        self.cache.invalidate_exception("doc1", "2030-01-07")
+        self.schedule()
+        self.assertEqual(self.rows.call_count, 2)
+        self.cache.invalidate_availability("doc1", "Monday")
+        self.schedule()
+        self.assertEqual(self.rows.call_count, 3)
+
+    def test_lru_eviction(self):
+        self.cache.size = 3
+        self.schedule()
+        self.cache.schedule("doc1", {"Tuesday"}, set())
+        self.assertEqual(self.cache.stats()["size"], 3)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_unknown_doctor_is_not_cached(self):
+        self.rows.return_value = (None, [], [])
+        self.assertIsNone(self.schedule()[0])
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
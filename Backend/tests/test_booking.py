@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, date, time, timedelta
+from api.v1.booking import BookingCheck, BookingContext, check_holds, check_many, confirm_hold
+from api.v1.holds import slot_holds
+from api.v1.slot_index import Booked, Closure, DoctorRow
+
+
+def make_appointment(start, duration):
+    return MagicMock(id=f"appt-{start:%H%M}", scheduled_time=start,
+                     end_time=start + timedelta(minutes=duration))
+
+
+class TestBookingContext(unittest.TestCase):
+    def setUp(self):
+        # 2030-01-07 is a Monday
+        self.monday = datetime(2030, 1, 7)
+        availabilities = {"Monday": [MagicMock(start_time=time(9), end_time=time(12)),
+                                     MagicMock(start_time=time(13), end_time=time(17))]}
+        exceptions = {date(2030, 1, 14): [Closure("e1", False)],
+                      date(2030, 1, 21): [Closure("e2", False, time(9), time(10))]}
+        appointments = [make_appointment(self.monday.replace(hour=10), 30)]
+        self.context = BookingContext(MagicMock(), availabilities, exceptions, appointments)
+
+    def check(self, start, duration=30):
+        return self.context.check("doc1", start, duration)
+
+    def test_available(self):
+        result = self.check(self.monday.replace(hour=10, minute=30))
+        self.assertTrue(result.available)
+        self.assertEqual(result.status_code, 200)
+
+    def test_conflict(self):
+        result = self.check(self.monday.replace(hour=9, minute=45))
+        self.assertEqual(result.code, "conflict")
+        self.assertEqual(result.to_dict()["conflicts"], ["appt-1000"])
+
+    def test_must_fit_in_one_availability_slot(self):
+        self.assertEqual(self.check(self.monday.replace(hour=11, minute=45)).code,
+                         "outside_availability")
+
+    def test_no_availability_on_weekday(self):
+        self.assertEqual(self.check(self.monday + timedelta(days=1, hours=10)).code,
+                         "no_availability")
+
+    def test_unavailable_exception_date(self):
+        self.assertEqual(self.check(self.monday + timedelta(days=7, hours=10)).code,
+                         "doctor_unavailable")
+
+    def test_partial_day_exception(self):
+        self.assertEqual(self.check(self.monday + timedelta(days=14, hours=9, minutes=45)).code,
+                         "doctor_unavailable")
+        self.assertTrue(self.check(self.monday + timedelta(days=14, hours=10)).available)
+
+    def test_doctor_not_found(self):
+        context = BookingContext(None, {}, {}, [])
+        self.assertEqual(context.check("doc1", self.monday, 30).status_code, 404)
+
+    @patch("api.v1.booking.availability_cache")
+    @patch("api.v1.booking.storage")
+    def test_load_reads_plain_rows(self, storage, cache):
+        cache.schedule.return_value = (DoctorRow("doc1", "Ada", "Lovelace"), {}, {})
+        start = self.monday.replace(hour=10)
+        storage.values.return_value = [("a1", start, start + timedelta(minutes=30)),
+                                       ("a2", start, start + timedelta(minutes=30))]
+        context = BookingContext.load("doc1", [(start, 30)], appointment_id_to_ignore="a2")
+        self.assertEqual(context.appointments, [Booked("a1", start, start + timedelta(minutes=30))])
+        self.assertEqual(storage.values.call_args.kwargs,
+                         {"doctor_id": "doc1", "status": "scheduled",
+                          "end_time__gt": start, "scheduled_time__lt": start + timedelta(minutes=30)})
+        storage.get_session.assert_not_called()
+
+
+class TestCheckMany(unittest.TestCase):
+    @patch("api.v1.booking.check_bookings")
+    def test_groups_per_doctor_and_keeps_order(self, check_bookings):
+        check_bookings.side_effect = lambda doctor_id, candidates: [
+            (doctor_id, start) for start, _ in candidates]
+        monday = datetime(2030, 1, 7, 9)
+        candidates = [("doc1", monday, 30), ("doc2", monday, 30),
+                      ("doc1", monday + timedelta(days=1), 30)]
+        self.assertEqual(check_many(candidates), [(doctor_id, start) for doctor_id, start, _ in candidates])
+        self.assertEqual(check_bookings.call_count, 2)
+
+
+
+class TestConfirmHold(unittest.TestCase):
+    def setUp(self):
+        start = datetime(2030, 1, 7, 10)
+        self.hold = slot_holds.place("doc-confirm", "pat-confirm", start, 30)
+        self.addCleanup(slot_holds.release, self.hold.id)
+        self.available = BookingCheck("doc-confirm", start, 30, "available", "Available")
+
+    def test_own_hold_is_not_a_conflict(self):
+        self.assertEqual(check_holds(self.available).code, "held")
+        self.assertTrue(check_holds(self.available, ignore_hold_id=self.hold.id).available)
+
+    @patch("api.v1.booking.storage")
+    @patch("api.v1.booking._insert_appointments")
+    @patch("api.v1.booking._check_locked")
+    @patch("api.v1.booking._locked", lambda doctor_id, days, action: action())
+    def test_range_booked_elsewhere_is_refused(self, check_locked, insert, storage):
+        conflict = BookingCheck("doc-confirm", self.hold.scheduled_time, 30, "conflict", "Time slot conflict")
+        check_locked.return_value = [conflict]
+        result, appointment = confirm_hold(self.hold)
+        self.assertIs(result, conflict)
+        self.assertIsNone(appointment)
+        insert.assert_not_called()
+        self.assertIsNone(slot_holds.get(self.hold.id))
+        check_locked.assert_called_once_with("doc-confirm", [(self.hold.scheduled_time, 30)],
+                                             ignore_hold_id=self.hold.id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import unittest
+from datetime import date, datetime, time
+from models import codec
+from models.appointment import Appointment
+from models.doctor import Doctor
+from models.exception import Exception as DoctorException
+from models.user import User
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip_keeps_types(self):
+        appointment = Appointment(patient_id="p", doctor_id="d", duration=30,
+                                  scheduled_time=datetime(2030, 1, 7, 10, 0), status="scheduled")
+        exception = DoctorException(doctor_id="d", date="2030-01-14", start_time="09:00:00",
+                                    end_time="12:00:00", is_available=False)
+        objs = {f"Appointment.{appointment.id}": appointment, f"Exception.{exception.id}": exception}
+
+        loaded = codec.decode(codec.encode(objs))
+        copy = loaded[f"Appointment.{appointment.id}"]
+        self.assertIsInstance(copy, Appointment)
+        self.assertEqual(copy.scheduled_time, datetime(2030, 1, 7, 10, 0))
+        self.assertEqual(copy.end_time, datetime(2030, 1, 7, 10, 30))
+        self.assertEqual(copy.created_at, appointment.created_at)
+        copy = loaded[f"Exception.{exception.id}"]
+        self.assertEqual((copy.start_date, copy.end_date), (date(2030, 1, 14), date(2030, 1, 14)))
+        self.assertEqual(copy.start_time, time(9, 0))
+        self.assertFalse(copy.is_available)
+
+    def test_decodes_to_dict_files(self):
+        user = User(name="a", email="a@example.com", password="x", role="admin")
+        data = json.dumps({f"User.{user.id}": user.to_dict()}).encode()
+        copy = codec.decode(data)[f"User.{user.id}"]
+        self.assertEqual(copy.to_dict(), user.to_dict())
+
+    def test_decodes_baseline_file(self):
+        data = json.dumps({
+            "Exception.e1": {"id": "e1", "created_at": "2025-04-05T17:19:41.015071",
+                             "updated_at": "2025-04-05T17:19:41.015071", "doctor_id": "d",
+                             "date": "2025-04-07", "is_available": False, "__class__": "Exception"},
+            "Exception.e2": {"id": "e2", "created_at": "2025-04-05T17:19:41.015071",
+                             "updated_at": "2025-04-05T17:19:41.015071", "doctor_id": "d",
+                             "date": "2025-04-08T00:00:00", "is_available": True, "__class__": "Exception"},
+            "User.u1": {"id": "u1", "created_at": "2025-04-05T17:19:41.015071",
+                        "updated_at": "2025-04-05T17:19:41.267636", "name": "Jane Doe",
+                        "password": "x", "email": "jane.doe@gmail.com", "role": "patient",
+                        "__class__": "User"},
+        }).encode()
+        objs = codec.decode(data)
+        first = objs["Exception.e1"]
+        self.assertEqual((first.date, first.start_date, first.end_date), (date(2025, 4, 7),) * 3)
+        self.assertIsNone(first.start_time)
+        self.assertEqual(objs["Exception.e2"].start_date, date(2025, 4, 8))
+        self.assertEqual(objs["User.u1"].email, "jane.doe@gmail.com")
+        self.assertEqual(set(codec.decode(codec.encode(objs))), set(objs))
+
+    def test_invalid_values_are_not_encoded(self):
+        doctor = Doctor(first_name="a", last_name="b", email=None, specialization="s", user_id="u")
+        with self.assertRaises(ValueError):
+            codec.encode({f"Doctor.{doctor.id}": doctor})
+
+    def test_journal_records(self):
+        user = User(name="a", email="a@example.com", password="x", role="admin")
+        op, key, copy = codec.decode_record(codec.encode_record("User.1", user))
+        self.assertEqual((op, key, copy.email), ("put", "User.1", "a@example.com"))
+        self.assertEqual(codec.decode_record(codec.encode_record("User.1", None)), ("del", "User.1", None))
+
+    def test_encode_list(self):
+        user = User(name="a", email="a@example.com", password="x", role="admin")
+        [item] = json.loads(codec.encode_list([user]))
+        self.assertEqual(item["__class__"], "User")
+        self.assertEqual(item["id"], user.id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,338 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from threading import Thread
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from models import codec
+from models.engine.file_storage import FileStorage
+from models.user import User
+from models.appointment import Appointment
+from models.patient import Patient
+
+
+class TestFileStorageQueries(unittest.TestCase):
+    def setUp(self):
+        self.storage = FileStorage()
+        base = datetime(2020, 1, 1)
+        self.users = []
+        for i in range(5):
+            user = User(name=f"user{i}", email=f"User{i}@Example.com", role="patient")
+            user.created_at = base + timedelta(minutes=i // 2)
+            self.storage.new(user)
+            self.users.append(user)
+
+    def tearDown(self):
+        for user in self.users:
+            self.storage.delete(user)
+
+    def test_page_walks_every_object_once(self):
+        ids = {user.id for user in self.users}
+        seen = []
+        after = None
+        while True:
+            objs, after = self.storage.page(User, 2, after)
+            seen.extend(obj.id for obj in objs if obj.id in ids)
+            if after is None:
+                break
+        self.assertEqual(sorted(seen), sorted(ids))
+        self.assertEqual(len(seen), len(ids))
+
+    def test_page_applies_filters(self):
+        objs, after = self.storage.page(User, 10, None, name="user3")
+        self.assertEqual([obj.id for obj in objs], [self.users[3].id])
+        self.assertIsNone(after)
+
+    def test_get_user_by_email_is_case_insensitive(self):
+        self.assertIs(self.storage.get_user_by_email(" user1@example.COM"), self.users[1])
+        self.assertIsNone(self.storage.get_user_by_email("missing@example.com"))
+
+    def test_get_and_all_by_class(self):
+        self.assertIs(self.storage.get(User, self.users[2].id), self.users[2])
+        self.assertIs(self.storage.get("User", self.users[2].id), self.users[2])
+        self.assertIsNone(self.storage.get(Appointment, self.users[2].id))
+        users = self.storage.all(User)
+        self.assertTrue(all(key.startswith("User.") for key in users))
+        self.assertEqual(len(users), self.storage.count(User))
+        self.storage.delete(self.users[4])
+        self.assertNotIn(f"User.{self.users[4].id}", self.storage.all(User))
+        self.assertIsNone(self.storage.get(User, self.users[4].id))
+
+    def test_get_many(self):
+        found = self.storage.get_many(User, [self.users[0].id, "missing"])
+        self.assertEqual(list(found), [self.users[0].id])
+
+
+class TestFileStorageAppointmentFilters(unittest.TestCase):
+    def setUp(self):
+        self.storage = FileStorage()
+        start = datetime(2030, 1, 1, 9)
+        self.appointments = []
+        for i in range(6):
+            appointment = Appointment(doctor_id=f"doctor{i % 2}", patient_id="patient",
+                                      scheduled_time=start + timedelta(days=i),
+                                      duration=30, status="scheduled")
+            self.storage.new(appointment)
+            self.appointments.append(appointment)
+
+    def tearDown(self):
+        for appointment in self.appointments:
+            self.storage.delete(appointment)
+
+    def test_indexed_equality_and_range_filters(self):
+        objs, _ = self.storage.page(Appointment, 10, None, doctor_id="doctor0",
+                                    scheduled_time__gte=datetime(2030, 1, 2),
+                                    scheduled_time__lt=datetime(2030, 1, 6))
+        self.assertCountEqual(objs, [self.appointments[2], self.appointments[4]])
+        self.assertEqual(self.storage.count(Appointment, doctor_id="doctor1"), 3)
+
+    def test_values(self):
+        rows = self.storage.values(Appointment, ("doctor_id", "end_time"), doctor_id__in=["doctor1"])
+        self.assertCountEqual(rows, [("doctor1", appointment.end_time)
+                                     for appointment in self.appointments[1::2]])
+
+    def test_index_follows_updates_and_deletes(self):
+        moved = self.appointments[0]
+        moved.doctor_id = "doctor1"
+        self.storage.new(moved)
+        self.storage.delete(self.appointments[1])
+        self.assertEqual(self.storage.count(Appointment, doctor_id="doctor0"), 2)
+        self.assertEqual(self.storage.count(Appointment, doctor_id="doctor1"), 3)
+
+    def test_in_filter_and_user_id_index(self):
+        self.assertEqual(self.storage.count(Appointment, doctor_id__in=["doctor0", "doctor1", "none"]), 6)
+        patient = Patient(first_name="a", last_name="b", user_id="user-42")
+        self.storage.new(patient)
+        self.addCleanup(self.storage.delete, patient)
+        self.assertIs(self.storage.get_by(Patient, user_id="user-42"), patient)
+        self.assertIsNone(self.storage.get_by(Patient, user_id="user-43"))
+
+
+class TestFileStorageJournal(unittest.TestCase):
+    def setUp(self):
+        self.storage = FileStorage()
+        self.storage.journal = True
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "file.json")
+        self.storage._FileStorage__file_path = self.path
+        self.addCleanup(delattr, self.storage, "_FileStorage__file_path")
+        self.storage.save()
+
+    def records(self):
+        with open(self.path + ".journal") as f:
+            return [json.loads(line) for line in f]
+
+    def test_save_appends_changed_objects_only(self):
+        user = User(name="journal", email="journal@example.com", role="patient")
+        self.storage.new(user)
+        self.addCleanup(self.storage.delete, user)
+        self.storage.save()
+        self.storage.save()
+        self.assertEqual(self.records()[-1]["op"], "put")
+        self.assertEqual(self.records()[-1]["value"]["name"], "journal")
+        count = len(self.records())
+
+        self.storage.delete(user)
+        self.storage.save()
+        self.assertEqual(self.records()[count:], [{"op": "del", "key": f"User.{user.id}"}])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_reload_replays_journal_and_compact_rewrites_file(self):
+        kept = User(name="kept", email="kept@example.com", role="patient")
+        gone = User(name="gone", email="gone@example.com", role="patient")
+        for user in (kept, gone):
+            self.storage.new(user)
+            self.addCleanup(self.storage.delete, user)
+        self.storage.save()
+        kept.name = "renamed"
+        self.storage.new(kept)
+        self.storage.delete(gone)
+        self.storage.save()
+
+        # forget both in memory, as in a new process
+        self.storage._FileStorage__forget(f"User.{kept.id}")
+        self.storage.reload()
+        self.assertEqual(self.storage.get(User, kept.id).name, "renamed")
+        self.assertIsNone(self.storage.get(User, gone.id))
+
+        self.storage.compact()
+        self.assertFalse(os.path.exists(self.path + ".journal"))
+        with open(self.path) as f:
+            data = json.load(f)
+        self.assertEqual(data[f"User.{kept.id}"]["name"], "renamed")
+        self.assertNotIn(f"User.{gone.id}", data)
+
+
+class TestFileStorageWrites(unittest.TestCase):
+    def setUp(self):
+        self.storage = FileStorage()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "file.json")
+        self.storage._FileStorage__file_path = self.path
+        self.addCleanup(delattr, self.storage, "_FileStorage__file_path")
+        self.user = User(name="writes", email="writes@example.com", role="patient")
+        self.storage.new(self.user)
+        self.addCleanup(self.storage.delete, self.user)
+
+    def test_failed_save_keeps_previous_file(self):
+        self.storage.save()
+        with open(self.path, 'rb') as f:
+            before = f.read()
+        with patch("models.engine.file_storage.os.fsync", side_effect=OSError("disk full")):
+            self.storage.save()
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(os.listdir(self.dir.name), ["file.json"])
+
+    def test_unreadable_file_blocks_saves(self):
+        with open(self.path, 'w') as f:
+            f.write('{"User.x": {"__class__": "User", "id": "x"}}')
+        self.storage.reload()
+        self.storage.save()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {"User.x": {"__class__": "User", "id": "x"}})
+        os.remove(self.path)
+        self.storage.reload()
+        self.storage.save()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_new_rejects_invalid_values(self):
+        self.storage.save()
+        other = self.storage.all(User)
+        self.user.name = "pending"
+        self.storage.new(self.user)
+        self.user.email = None
+        with self.assertRaises(ValueError):
+            self.storage.new(self.user)
+        # only the invalid field is put back, on the same objects
+        self.assertIs(self.storage.get(User, self.user.id), self.user)
+        self.assertEqual((self.user.name, self.user.email), ("pending", "writes@example.com"))
+        self.assertEqual(self.storage.all(User), other)
+        self.storage.save()
+        with open(self.path) as f:
+            written = json.load(f)[f"User.{self.user.id}"]
+        self.assertEqual((written["name"], written["email"]), ("pending", "writes@example.com"))
+
+    def test_check_leaves_objects_unchanged(self):
+        with self.assertRaises(ValueError):
+            codec.check(self.user, {"name": "checked", "email": 5})
+        self.assertEqual(self.user.email, "writes@example.com")
+        codec.check(self.user, {"name": "checked"})
+        self.assertNotEqual(self.user.name, "checked")
+
+    def test_flush_window_coalesces_saves(self):
+        self.storage.flush_window = 0.2
+        with patch("models.engine.file_storage.os.replace", wraps=os.replace) as replace:
+            for i in range(20):
+                self.user.name = f"writes{i}"
+                self.storage.save()
+            self.assertFalse(os.path.exists(self.path))
+            deadline = time.monotonic() + 5
+            while not os.path.exists(self.path) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.storage.flush()
+            self.assertLessEqual(replace.call_count, 2)
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)[f"User.{self.user.id}"]["name"], "writes19")
+
+    def test_concurrent_changes_and_reads(self):
+        errors = []
+
+        def run(action):
+            try:
+                for i in range(300):
+                    action(i)
+            except Exception as e:
+                errors.append(e)
+
+        def change(i):
+            user = User(name="concurrent", email=f"concurrent{i}@example.com", role="patient")
+            self.storage.new(user)
+            if i % 2:
+                self.storage.delete(user)
+            else:
+                self.addCleanup(self.storage.delete, user)
+
+        def read(i):
+            self.storage.values(User, ("id",), name="concurrent")
+            self.storage.count(User, role="patient")
+            self.storage.page(User, 50)
+
+        threads = [Thread(target=run, args=(action,))
+                   for action in (change, change, read, lambda i: self.storage.save())]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.storage.count(User, name="concurrent"), 300)
+        self.storage.save()
+        with open(self.path) as f:
+            self.assertEqual(sum(1 for value in json.load(f).values() if value.get("name") == "concurrent"), 300)
+
+
+class TestFileStorageClose(unittest.TestCase):
+    def setUp(self):
+        self.storage = FileStorage()
+        self.storage.journal = True
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "file.json")
+        self.storage._FileStorage__file_path = self.path
+        # reloading drops what isn't in the test file, read the default file back after
+        self.addCleanup(self.storage.reload)
+        self.addCleanup(delattr, self.storage, "_FileStorage__file_path")
+        self.user = User(name="close", email="close@example.com", role="patient")
+        self.storage.new(self.user)
+        self.addCleanup(self.storage.delete, self.user)
+        self.storage.journal = False
+        self.storage.save()
+        self.storage.journal = True
+
+    def test_close_does_not_reload_unchanged_files(self):
+        self.user.name = "renamed"
+        self.storage.new(self.user)
+        self.storage.save()
+        with patch.object(self.storage, "reload") as reload:
+            self.storage.close()
+        reload.assert_not_called()
+        self.assertIs(self.storage.get(User, self.user.id), self.user)
+
+    def test_close_reads_records_of_other_processes(self):
+        other = User(name="other", email="other@example.com", role="patient")
+        self.addCleanup(self.storage.delete, other)
+        with open(self.path + ".journal", 'ab') as f:
+            f.write(codec.encode_record(f"User.{other.id}", other))
+            f.write(codec.encode_record(f"User.{self.user.id}", None))
+        with patch.object(self.storage, "reload") as reload:
+            self.storage.close()
+        reload.assert_not_called()
+        self.assertEqual(self.storage.get(User, other.id).name, "other")
+        self.assertIsNone(self.storage.get(User, self.user.id))
+        self.assertEqual(self.storage.get_by(User, name="other").id, other.id)
+
+    def test_close_reloads_a_replaced_file(self):
+        removed = User(name="removed", email="removed@example.com", role="patient")
+        self.storage.new(removed)
+        self.storage.journal = False
+        self.storage.save()
+        self.storage.journal = True
+        self.assertIsNotNone(self.storage.get(User, removed.id))
+        copy = User(**self.user.to_dict())
+        copy.name = "replaced"
+        with open(self.path + ".new", 'wb') as f:
+            f.write(codec.encode({f"User.{copy.id}": copy}))
+        os.replace(self.path + ".new", self.path)
+        self.storage.close()
+        self.assertEqual(self.storage.get(User, self.user.id).name, "replaced")
+        self.assertIsNone(self.storage.get(User, removed.id))
+        self.assertNotIn(removed, self.storage.iterate(User))
+        self.assertIsNone(self.storage.get_user_by_email("removed@example.com"))
+
+
+if __name__ == '__main__':
+    unittest.main()
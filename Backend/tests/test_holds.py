@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from api.v1.holds import HoldStore, MAX_HOLDS_PER_PATIENT
+
+
+class TestHoldStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch("api.v1.holds.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.holds = HoldStore()
+        self.start = datetime(2030, 1, 7, 10)
+
+    def test_overlapping(self):
+        hold = self.holds.place("doc1", "pat1", self.start, 30, ttl=60)
+        self.assertEqual(self.holds.overlapping("doc1", self.start + timedelta(minutes=15),
+                                                self.start + timedelta(minutes=45)), [hold])
+        self.assertEqual(self.holds.overlapping("doc1", self.start + timedelta(minutes=30),
+                                                self.start + timedelta(minutes=60)), [])
+        self.assertEqual(self.holds.overlapping("doc2", self.start, self.start + timedelta(minutes=30)), [])
+
+    def test_expiry(self):
+        first = self.holds.place("doc1", "pat1", self.start, 30, ttl=30)
+        second = self.holds.place("doc1", "pat2", self.start + timedelta(hours=1), 30, ttl=90)
+        self.now += 60
+        self.assertIsNone(self.holds.get(first.id))
+        self.assertIs(self.holds.get(second.id), second)
+        self.assertEqual(len(self.holds), 1)
+        self.now += 60
+        self.assertEqual(len(self.holds), 0)
+
+    def test_release(self):
+        hold = self.holds.place("doc1", "pat1", self.start, 30, ttl=60)
+        self.assertIs(self.holds.release(hold.id), hold)
+        self.assertIsNone(self.holds.release(hold.id))
+        self.assertEqual(self.holds.overlapping("doc1", self.start, self.start + timedelta(minutes=30)), [])
+
+    def test_holds_per_patient(self):
+        for i in range(MAX_HOLDS_PER_PATIENT):
+            self.holds.place("doc1", "pat1", self.start + timedelta(hours=i), 30, ttl=60)
+        with self.assertRaises(ValueError):
+            self.holds.place("doc1", "pat1", self.start - timedelta(hours=1), 30, ttl=60)
+
+
+if __name__ == '__main__':
+    unittest.main()
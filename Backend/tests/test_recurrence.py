@@ -0,0 +1,29 @@
+import unittest
+from datetime import datetime
+from api.v1.helper_functions import expand_recurrence, MAX_SERIES_OCCURRENCES
+
+
+class TestExpandRecurrence(unittest.TestCase):
+    def setUp(self):
+        self.first = datetime(2030, 1, 7, 9)
+
+    def test_weekly_count(self):
+        starts = expand_recurrence(self.first, {"frequency": "weekly", "count": 3})
+        self.assertEqual(starts, [datetime(2030, 1, 7, 9), datetime(2030, 1, 14, 9),
+                                  datetime(2030, 1, 21, 9)])
+
+    def test_daily_until_with_interval(self):
+        starts = expand_recurrence(self.first, {"frequency": "daily", "interval": 2,
+                                                "until": "2030-01-12"})
+        self.assertEqual([start.day for start in starts], [7, 9, 11])
+
+    def test_invalid_rules(self):
+        for rule in ({"frequency": "monthly", "count": 2},
+                     {"frequency": "weekly"},
+                     {"frequency": "weekly", "count": 2, "until": "2030-02-01"},
+                     {"frequency": "weekly", "interval": 0, "count": 2},
+                     {"frequency": "weekly", "until": "2029-12-31"},
+                     {"frequency": "daily", "count": MAX_SERIES_OCCURRENCES + 1},
+                     None):
+            with self.assertRaises(ValueError):
+                expand_recurrence(self.first, rule)
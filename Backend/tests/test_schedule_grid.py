@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, date, time
+import numpy as np
+from api.v1.holds import slot_holds
+from api.v1.schedule_grid import ScheduleGrid
+from api.v1.slot_index import SLOT_GRANULARITY, UNITS_PER_DAY
+
+
+def units(hour, minute=0):
+    return (hour * 60 + minute) // SLOT_GRANULARITY
+
+
+class TestScheduleGrid(unittest.TestCase):
+    def setUp(self):
+        self.doctors = [MagicMock(id="doc1"), MagicMock(id="doc2")]
+        free = np.zeros((2, 2, UNITS_PER_DAY), dtype=bool)
+        free[0, 0, units(10):units(11)] = True
+        free[1, 0, units(9):units(9, 30)] = True
+        free[1, 1, units(8):units(12)] = True
+        self.grid = ScheduleGrid(self.doctors, date(2030, 1, 7), free)
+
+    def test_first_free_orders_by_start_across_doctors(self):
+        slots = [(doctor.id, start) for doctor, start, _ in self.grid.first_free(30, 3, step=30)]
+        self.assertEqual(slots, [("doc2", datetime(2030, 1, 7, 9)),
+                                 ("doc1", datetime(2030, 1, 7, 10)),
+                                 ("doc1", datetime(2030, 1, 7, 10, 30))])
+
+    def test_first_free_needs_the_whole_duration(self):
+        slots = self.grid.first_free(45, 10, step=15)
+        self.assertEqual([(doctor.id, start.hour, start.minute) for doctor, start, _ in slots][:2],
+                         [("doc1", 10, 0), ("doc1", 10, 15)])
+        self.assertNotIn("doc2", {doctor.id for doctor, start, _ in slots if start.day == 7})
+
+    def test_not_before(self):
+        slots = self.grid.first_free(30, 1, step=30, not_before=datetime(2030, 1, 7, 12))
+        self.assertEqual(slots[0][1:], (datetime(2030, 1, 8, 8), datetime(2030, 1, 8, 8, 30)))
+
+    def test_occupancy(self):
+        available = self.grid.free.copy()
+        available[0, 0, units(11):units(12)] = True
+        grid = ScheduleGrid(self.doctors, date(2030, 1, 7), self.grid.free, available)
+        available_minutes, booked_minutes = grid.occupancy(60)
+        self.assertEqual(available_minutes.shape, (2, 48))
+        self.assertEqual(available_minutes[0, 10:12].tolist(), [60, 60])
+        self.assertEqual(booked_minutes[0, 10:12].tolist(), [0, 60])
+        self.assertEqual(available_minutes[1, 9], 30)
+        self.assertEqual(available_minutes[1].sum(), 30 + 4 * 60)
+
+    def test_load_marks_holds_busy(self):
+        def values(cls, fields, **filters):
+            if cls.__name__ == "Availability":
+                return [("doc1", "Monday", time(9), time(11))]
+            return []
+
+        hold = slot_holds.place("doc1", "patient", datetime(2030, 1, 7, 9), 30, 60)
+        self.addCleanup(slot_holds.release, hold.id)
+        with patch("api.v1.schedule_grid.storage") as storage:
+            storage.values.side_effect = values
+            grid = ScheduleGrid.load(self.doctors[:1], date(2030, 1, 7), date(2030, 1, 7))
+        self.assertEqual(grid.first_free(30, 1, step=30)[0][1], datetime(2030, 1, 7, 9, 30))
+        available_minutes, booked_minutes = grid.occupancy(60)
+        self.assertEqual(booked_minutes[0, 9], 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, date, time, timedelta
+from api.v1.booking import BookingContext
+from api.v1.slot_index import DaySlots, SlotIndex, Window, Closure, Booked
+
+
+class TestDaySlots(unittest.TestCase):
+    def setUp(self):
+        # 2030-01-07 is a Monday
+        self.day = date(2030, 1, 7)
+        self.monday = datetime(2030, 1, 7)
+        context = BookingContext(
+            MagicMock(id="doc1"),
+            {"Monday": [Window("a1", time(9), time(12)), Window("a2", time(13), time(15))]},
+            {},
+            [Booked("appt1", self.monday.replace(hour=10), self.monday.replace(hour=10, minute=30))]
+        )
+        self.slots = DaySlots(self.day, context)
+
+    def starts(self, length=30):
+        return [start.strftime("%H:%M") for start, _ in self.slots.free_slots(length)]
+
+    def test_free_slots_skip_bookings(self):
+        self.assertEqual(self.starts(), ["09:00", "09:30", "10:30", "11:00", "11:30",
+                                         "13:00", "13:30", "14:00", "14:30"])
+
+    def test_lookup(self):
+        self.assertTrue(self.slots.lookup(self.monday.replace(hour=9), 60))
+        self.assertFalse(self.slots.lookup(self.monday.replace(hour=9, minute=45), 30))
+        self.assertIsNone(self.slots.lookup(self.monday.replace(hour=9, minute=1), 30))
+
+    def test_check_matches_context(self):
+        result = self.slots.check("doc1", self.monday.replace(hour=9, minute=45), 30)
+        self.assertEqual(result.code, "conflict")
+        self.assertTrue(self.slots.check("doc1", self.monday.replace(hour=13), 120).available)
+        self.assertEqual(self.slots.check("doc1", self.monday.replace(hour=14, minute=30), 60).code,
+                         "outside_availability")
+
+    def test_adjacent_windows(self):
+        context = BookingContext(
+            MagicMock(id="doc1"),
+            {"Monday": [Window("a2", time(12), time(15)), Window("a1", time(9), time(12))]},
+            {}, []
+        )
+        slots = DaySlots(self.day, context)
+        start = self.monday.replace(hour=11, minute=30)
+        self.assertTrue(context.check("doc1", start, 60).available)
+        self.assertTrue(slots.lookup(start, 60))
+        self.assertTrue(slots.check("doc1", start, 60).available)
+        self.assertEqual([start.strftime("%H:%M") for start, _ in slots.free_slots(120)],
+                         ["09:00", "11:00", "13:00"])
+
+    def test_book_and_release(self):
+        appointment = MagicMock(id="appt2", doctor_id="doc1",
+                                scheduled_time=self.monday.replace(hour=13),
+                                end_time=self.monday.replace(hour=14))
+        booked = self.slots.booked(appointment)
+        self.assertIn("13:00", self.starts())
+        self.slots = booked
+        self.assertNotIn("13:00", self.starts())
+        self.assertEqual(self.slots.check("doc1", appointment.scheduled_time, 30).code, "conflict")
+        self.slots = self.slots.released(appointment)
+        self.assertIn("13:00", self.starts())
+
+    def test_unaligned_booking_falls_back_to_exact_check(self):
+        self.slots = self.slots.booked(Booked("appt3", self.monday.replace(hour=11, minute=2),
+                               self.monday.replace(hour=11, minute=28)))
+        self.assertFalse(self.slots.exact)
+        self.assertNotIn("11:00", self.starts())
+        self.assertIn("11:00", self.starts(length=2))
+
+    def test_closed_day_has_no_slots(self):
+        self.slots.context.exceptions[self.day] = [Closure("e1", False)]
+        self.slots = self.slots.released(MagicMock(id="none"))
+        self.assertTrue(self.slots.closed)
+        self.assertEqual(self.starts(), [])
+
+    def test_partial_day_exception(self):
+        self.slots.context.exceptions[self.day] = [Closure("e1", False, time(13), time(14))]
+        self.slots = self.slots.released(MagicMock(id="none"))
+        self.assertFalse(self.slots.closed)
+        self.assertEqual(self.starts()[-2:], ["14:00", "14:30"])
+        self.assertNotIn("13:30", self.starts())
+        self.assertEqual(self.slots.check("doc1", self.monday.replace(hour=13, minute=30), 30).code,
+                         "doctor_unavailable")
+
+
+class TestSlotIndex(unittest.TestCase):
+    def test_lru_and_invalidate(self):
+        index = SlotIndex(size=2)
+        context = BookingContext(MagicMock(id="doc1"), {}, {}, [])
+        for day in (date(2030, 1, 7), date(2030, 1, 8), date(2030, 1, 9)):
+            index.put("doc1", day, context)
+        self.assertIsNone(index.get("doc1", date(2030, 1, 7)))
+        self.assertIsNotNone(index.get("doc1", date(2030, 1, 9)))
+        index.invalidate("doc1")
+        self.assertIsNone(index.get("doc1", date(2030, 1, 9)))
+
+    def test_book_swaps_the_day(self):
+        index = SlotIndex()
+        day = date(2030, 1, 7)
+        context = BookingContext(MagicMock(id="doc1"), {"Monday": [Window("a1", time(9), time(12))]}, {}, [])
+        held = index.put("doc1", day, context)
+        appointment = MagicMock(id="appt1", doctor_id="doc1", scheduled_time=datetime(2030, 1, 7, 9),
+                                end_time=datetime(2030, 1, 7, 10))
+        index.book(appointment)
+        # a request already reading the day keeps it unchanged
+        self.assertTrue(held.lookup(appointment.scheduled_time, 60))
+        self.assertEqual(held.context.appointments, [])
+        self.assertFalse(index.get("doc1", day).lookup(appointment.scheduled_time, 60))
+        self.assertEqual(index.get("doc1", day).loaded_at, held.loaded_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
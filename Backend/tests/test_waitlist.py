@@ -0,0 +1,114 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, date, time, timedelta
+from threading import Timer
+from api.v1.waitlist import WaitlistMatcher
+from models.appointment import Appointment
+from models.engine.file_storage import FileStorage
+from models.waitlist_entry import WaitlistEntry
+
+
+class TestWaitlistMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = WaitlistMatcher()
+        self.start = datetime(2030, 1, 7, 9)
+        self.end = datetime(2030, 1, 7, 10)
+
+    def entry(self, duration=30, earliest_time=None, latest_time=None):
+        return MagicMock(duration=duration, earliest_time=earliest_time, latest_time=latest_time)
+
+    def test_fit(self):
+        self.assertEqual(self.matcher.fit(self.entry(), self.start, self.end), self.start)
+        self.assertEqual(self.matcher.fit(self.entry(earliest_time=time(9, 15)), self.start, self.end),
+                         datetime(2030, 1, 7, 9, 15))
+        self.assertIsNone(self.matcher.fit(self.entry(duration=90), self.start, self.end))
+        self.assertIsNone(self.matcher.fit(self.entry(latest_time=time(9, 20)), self.start, self.end))
+
+    def test_wait_wakes_up_on_notify(self):
+        version = self.matcher.version("w1")
+        Timer(0.05, self.matcher.notify, ("w1",)).start()
+        self.assertEqual(self.matcher.wait("w1", version, 5), version + 1)
+        self.assertEqual(self.matcher.wait("w1", version + 1, 0.01), version + 1)
+
+    def test_versions_are_bounded(self):
+        def changes():
+            for i in range(10):
+                self.matcher.notify(f"w{i}")
+            self.matcher.notify("waited")
+
+        self.matcher.notify("waited")
+        version = self.matcher.version("waited")
+        with patch("api.v1.waitlist.MAX_TRACKED_ENTRIES", 3):
+            Timer(0.05, changes).start()
+            # kept while a request waits for it
+            self.assertEqual(self.matcher.wait("waited", version, 5), version + 1)
+            self.assertEqual(len(self.matcher._versions), 3)
+        self.assertEqual(self.matcher.version("w0"), 0)
+        self.assertEqual(self.matcher.version("w9"), 1)
+
+
+class TestWaitlistOffers(unittest.TestCase):
+    def setUp(self):
+        self.storage = FileStorage()
+        self.matcher = WaitlistMatcher()
+        self.start = datetime(2030, 1, 7, 9)
+        self.objs = []
+        # entries are written by save(), kept in memory here
+        patcher = patch.object(WaitlistEntry, "save")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for obj in self.objs:
+            self.storage.delete(obj)
+
+    def add(self, obj, created_at=None):
+        if created_at is not None:
+            obj.created_at = created_at
+        self.storage.new(obj)
+        self.objs.append(obj)
+        return obj
+
+    def entry(self, patient_id, priority=0, minutes=0, **kwargs):
+        return self.add(WaitlistEntry(patient_id=patient_id, doctor_id="doc1", start_date=date(2030, 1, 7),
+                                      end_date=date(2030, 1, 7), duration=30, priority=priority, **kwargs),
+                        datetime(2030, 1, 1) + timedelta(minutes=minutes))
+
+    def place_hold(self, patient_id, doctor_id, start, duration, ttl):
+        return MagicMock(), MagicMock(id=f"hold-{patient_id}", expires_at=datetime.now() - timedelta(seconds=1))
+
+    def test_match_picks_best_priority_then_oldest(self):
+        self.entry("low", priority=0, minutes=0)
+        self.entry("newer", priority=5, minutes=2)
+        best = self.entry("older", priority=5, minutes=1)
+        self.entry("offered", priority=9, status="offered")
+        with patch("api.v1.waitlist.place_hold", side_effect=self.place_hold):
+            entry = self.matcher.match("doc1", self.start, self.start + timedelta(hours=1))
+        self.assertIs(entry, best)
+        self.assertEqual((entry.status, entry.hold_id, entry.offered_time),
+                         ("offered", "hold-older", self.start))
+
+    def test_check_offers_expires_and_offers_again(self):
+        first = self.entry("first", priority=1)
+        second = self.entry("second", minutes=1)
+        with patch("api.v1.waitlist.place_hold", side_effect=self.place_hold):
+            self.assertIs(self.matcher.match("doc1", self.start, self.start + timedelta(minutes=30)), first)
+            self.matcher.check_offers()
+            self.assertEqual(first.status, "expired")
+            freed = self.matcher._queue.get_nowait()
+            self.assertEqual(freed, ("doc1", self.start, self.start + timedelta(minutes=30)))
+            self.assertIs(self.matcher.match(*freed), second)
+        self.assertEqual(second.status, "offered")
+
+    def test_check_offers_finds_booked_offers(self):
+        entry = self.entry("first", status="offered", hold_id="hold-first", offered_time=self.start,
+                           offered_until=datetime.now() - timedelta(seconds=1))
+        appointment = self.add(Appointment(patient_id="first", doctor_id="doc1", scheduled_time=self.start,
+                                           duration=30, status="scheduled"))
+        self.matcher.check_offers()
+        self.assertEqual((entry.status, entry.appointment_id), ("booked", appointment.id))
+        self.assertTrue(self.matcher._queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()